@@ -21,6 +21,7 @@ import argparse
 import os
 import subprocess
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timezone
 
@@ -28,8 +29,42 @@ import cpmapi as api
 from pcp import pmapi
 
 imported_archives = {}
+archive_windows = {}
 minimum_start_time = 0.0
 maximum_finish_time = 0.0
+scanned_archives = {}
+
+
+def load_state(state_path: str):
+    # Restore imported archives and their time windows from a previous run
+    global imported_archives, archive_windows
+    if not state_path:
+        return
+    try:
+        with open(state_path, "r", encoding="utf-8") as file:
+            state = json.load(file)
+        imported_archives = dict(state["imported"])
+        archive_windows = {k: tuple(v) for k, v in state["windows"].items()}
+    except FileNotFoundError:
+        return
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        logging.warning("Ignoring invalid state file %s: %s", state_path, e)
+        return
+    logging.info("Restored state of %d archives from %s", len(archive_windows), state_path)
+
+
+def save_state(state_path: str, no_op: bool):
+    # Persist imported archives and their time windows for restarts
+    if not state_path or no_op:
+        return
+    state = {"imported": imported_archives, "windows": archive_windows}
+    try:
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, state_path)
+    except OSError as e:
+        logging.error("Error writing state file: %s", e)
 
 
 def base_archive_path(path: Path):
@@ -88,42 +123,52 @@ def update_time_window(begin: str, end: str, json_path: str, no_op: bool):
         logging.info("Successfully updated the JSON file: %s", json_path)
 
 
-def setup_time_window(path: Path, i: int, count: int, json_path: str, no_op: bool):
-    global minimum_start_time, maximum_finish_time
-
+def setup_time_window(path: Path, mod_time: float, i: int, count: int):
+    # Record the start and end time of a new or changed archive
     archive_path = base_archive_path(path)
-    archive_mod_time = os.path.getmtime(path)
-    if archive_unchanged(archive_path, archive_mod_time, i, count):
-        return
+    window = archive_windows.get(archive_path)
+    if window and window[0] == mod_time:
+        return False
 
     try:
         ctx = pmapi.pmContext(api.PM_CONTEXT_ARCHIVE, archive_path)
         ctx.pmNewZone('UTC')
         label = ctx.pmGetArchiveLabel()
+        start = float(label.start)
+        finish = float(ctx.pmGetArchiveEnd())
     except pmapi.pmErr:
         logging.info("Skipping archive %s (no context) [%d/%d]", archive_path, i, count)
-        return # .meta exists, but not a PCP archive metadata file
-    start = float(label.start)
-    if minimum_start_time == 0.0 or start < minimum_start_time:
-        logging.info("Updating start to %s from %s [%d/%d]",
-                     format_time(start), archive_path, i, count)
-        minimum_start_time = start
+        return False # .meta exists, but not a PCP archive metadata file
+
+    archive_windows[archive_path] = (mod_time, start, finish)
+    return True
+
 
-    finish = float(ctx.pmGetArchiveEnd())
-    if finish > maximum_finish_time:
-        logging.info("Updating finish to %s from %s [%d/%d]",
-                     format_time(finish), archive_path, i, count)
+def update_time_windows(json_path: str, no_op: bool):
+    # Compute the overall time window once for all archives
+    global minimum_start_time, maximum_finish_time
+
+    if not archive_windows:
+        return
+    start = min(window[1] for window in archive_windows.values())
+    finish = max(window[2] for window in archive_windows.values())
+    if start == minimum_start_time and finish == maximum_finish_time:
+        return
+
+    if start != minimum_start_time:
+        logging.info("Updating start to %s", format_time(start))
+        minimum_start_time = start
+    if finish != maximum_finish_time:
+        logging.info("Updating finish to %s", format_time(finish))
         maximum_finish_time = finish
 
     # update the time window in the JSON file with archive start and end times
     update_time_window(minimum_start_time, maximum_finish_time, json_path, no_op)
 
 
-def import_archive(path: Path, i: int, count: int, no_op: bool, import_timeout: int, port: str, time_zone: str):
+def import_archive(path: Path, archive_mod_time: float, i: int, count: int, no_op: bool, import_timeout: int, port: str, time_zone: str):
+    # Import a single archive, returning its modification time on success
     archive_path = base_archive_path(path)
-    archive_mod_time = os.path.getmtime(path)
-    if archive_unchanged(archive_path, archive_mod_time, i, count):
-        return
 
     start_dt = datetime.now()
     try:
@@ -148,17 +193,52 @@ def import_archive(path: Path, i: int, count: int, no_op: bool, import_timeout:
                     timeout=import_timeout,
                 )
     except subprocess.CalledProcessError as e:
-        logging.error("Error: %s", e.stdout)
+        logging.error("Error importing %s: %s", archive_path, e.stdout)
     except subprocess.TimeoutExpired:
-        logging.error("Timeout")
+        logging.error("Timeout importing %s", archive_path)
     else:
         total_sec = (datetime.now() - start_dt).total_seconds()
         minutes, seconds = divmod(total_sec, 60)
-        logging.info("Successfully imported archive in %d:%dm.", minutes, seconds)
-        imported_archives[archive_path] = archive_mod_time
-
-
-def poll(archives_path: str, jsonfile_path: str, no_op: bool, import_timeout: int, port: str, time_zone: str):
+        logging.info("Successfully imported archive %s in %d:%dm.", archive_path, minutes, seconds)
+        return archive_mod_time
+    return None
+
+
+def scan_archives(top: str):
+    # Find archive metadata files and their modification times.
+    # Only directories whose modification time changed since the previous
+    # scan are listed again, files of unchanged directories are just stat'ed.
+    found = {}
+    directories = [top]
+    while directories:
+        directory = directories.pop()
+        try:
+            dir_mod_time = os.stat(directory).st_mtime
+            cached = scanned_archives.get(directory)
+            if cached and cached[0] == dir_mod_time:
+                subdirs, metas = cached[1], cached[2]
+            else:
+                subdirs, metas = [], []
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif '.meta' in entry.name:
+                            metas.append(entry.path)
+                scanned_archives[directory] = (dir_mod_time, subdirs, metas)
+        except OSError:
+            scanned_archives.pop(directory, None)
+            continue
+        directories.extend(subdirs)
+        for meta in metas:
+            try:
+                found[Path(meta)] = os.path.getmtime(meta)
+            except OSError:
+                continue
+    return found
+
+
+def poll(archives_path: str, jsonfile_path: str, no_op: bool, import_timeout: int, port: str, time_zone: str, jobs: int, state_path: str):
     logging.info("Searching for new or updated archives...")
 
     if not os.access(archives_path, os.R_OK):
@@ -166,16 +246,48 @@ def poll(archives_path: str, jsonfile_path: str, no_op: bool, import_timeout: in
         logging.error("Please use '--security-opt label=disable' when starting the container.")
         return
 
-    archive_paths = list(Path(archives_path).rglob("*.meta*"))
-    if not archive_paths:
+    archives = scan_archives(archives_path)
+    if not archives:
         logging.warning("No archives found.")
-    else:
-        # prepare the dashboard with an initial (quick) pass over all archives
-        # because the import_archive process may be loading large data volumes
-        for i, path in enumerate(archive_paths, start=1):
-            setup_time_window(path, i, len(archive_paths), jsonfile_path, no_op)
-        for i, path in enumerate(archive_paths, start=1):
-            import_archive(path, i, len(archive_paths), no_op, import_timeout, port, time_zone)
+        return
+
+    # forget about archives which have been removed
+    present = set(base_archive_path(path) for path in archives)
+    changed = False
+    for archive_path in list(archive_windows):
+        if archive_path not in present:
+            del archive_windows[archive_path]
+            imported_archives.pop(archive_path, None)
+            changed = True
+
+    count = len(archives)
+    pending = []
+    for i, (path, mod_time) in enumerate(sorted(archives.items()), start=1):
+        if not archive_unchanged(base_archive_path(path), mod_time, i, count):
+            pending.append((i, path, mod_time))
+
+    # prepare the dashboard with an initial (quick) pass over changed archives
+    # because the import_archive process may be loading large data volumes
+    for i, path, mod_time in pending:
+        changed = setup_time_window(path, mod_time, i, count) or changed
+    update_time_windows(jsonfile_path, no_op)
+    if changed:
+        save_state(state_path, no_op)
+    if not pending:
+        return
+
+    # import independent archives concurrently
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for i, path, mod_time in pending:
+            future = executor.submit(import_archive, path, mod_time, i, count,
+                                     no_op, import_timeout, port, time_zone)
+            futures[future] = path
+        for future in as_completed(futures):
+            mod_time = future.result()
+            if mod_time is not None:
+                imported_archives[base_archive_path(futures[future])] = mod_time
+                save_state(state_path, no_op)
 
 
 def main():
@@ -188,6 +300,8 @@ def main():
     parser.add_argument("--import-timeout", type=int, default=600)
     parser.add_argument('-p', "--port", type=str)
     parser.add_argument('-Z', "--timezone", type=str)
+    parser.add_argument('-j', "--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--statefile", default="/var/lib/pcp/archive-import.json")
     args = parser.parse_args()
     dash = 'http://localhost:3000/d/pcp-archive-analysis/pcp-archive-analysis'
     logging.basicConfig(level=logging.INFO, format="%(message)s")
@@ -198,12 +312,15 @@ def main():
     os.environ['TZ'] = 'UTC'
     time.tzset()
 
+    load_state(args.statefile)
+
     try:
         while True:
             logging.info("Poll interval: %d", args.poll_interval)
             logging.info("Import timeout: %d", args.import_timeout)
+            logging.info("Import jobs: %d", args.jobs)
             poll(args.archives, args.jsonfile, args.noop, args.import_timeout, args.port,
-                 args.timezone)
+                 args.timezone, max(1, args.jobs), args.statefile)
             time.sleep(args.poll_interval)
     except KeyboardInterrupt:
         pass  # debugging
@@ -0,0 +1,188 @@
+""" Exercise the pmdabcc module helpers against mock BPF tables """
+import os
+import sys
+import types
+import timeit
+import unittest
+import ctypes as ct
+from importlib.machinery import SourceFileLoader
+
+LOG2_INDEX_MAX = 65
+BATCH_SIZE = 512
+
+
+class TableBase(object):
+    """
+    Mock BPF table, counting the bpf(2) system calls the real
+    BCC implementation would need for each operation
+    """
+    Key = ct.c_uint
+    Leaf = ct.c_ulonglong
+    batched = True
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.syscalls = 0
+
+    def items(self):
+        # BPF_MAP_GET_NEXT_KEY and BPF_MAP_LOOKUP_ELEM per entry
+        self.syscalls += 2 * len(self.entries) + 1
+        return [(self.Key(k), self.Leaf(v)) for k, v in self.entries.items()]
+
+    def _batches(self):
+        self.syscalls += len(self.entries) // BATCH_SIZE + 1
+        if not self.batched:
+            raise Exception("BPF_MAP_LOOKUP_BATCH: Invalid argument")
+
+    def items_lookup_batch(self):
+        self._batches()
+        for k, v in list(self.entries.items()):
+            yield self.Key(k), self.Leaf(v)
+
+    def items_lookup_and_delete_batch(self):
+        self._batches()
+        entries, self.entries = self.entries, {}
+        for k, v in entries.items():
+            yield self.Key(k), self.Leaf(v)
+
+
+class HashTable(TableBase):
+    """ Mock BPF hash table """
+    def clear(self):
+        # BPF_MAP_GET_NEXT_KEY and BPF_MAP_DELETE_ELEM per entry
+        self.syscalls += 2 * len(self.entries) + 1
+        self.entries = {}
+
+
+class ArrayBase(TableBase):
+    """ Mock BPF array, entries are zeroed rather than deleted """
+    def clear(self):
+        self.syscalls += len(self.entries)
+        self.entries = dict.fromkeys(self.entries, 0)
+
+
+class SectionKey(ct.Structure):
+    """ Key of a sectioned log2 histogram """
+    _fields_ = [("op", ct.c_char * 8), ("slot", ct.c_ulonglong)]
+
+
+class SectionHashTable(HashTable):
+    """ Mock BPF histogram with sections """
+    Key = SectionKey
+
+    def items(self):
+        self.syscalls += 2 * len(self.entries) + 1
+        return [(self.Key(*k), self.Leaf(v)) for k, v in self.entries.items()]
+
+    def items_lookup_and_delete_batch(self):
+        self._batches()
+        entries, self.entries = self.entries, {}
+        for k, v in entries.items():
+            yield self.Key(*k), self.Leaf(v)
+
+
+def load_pcpbcc():
+    """ Load pcpbcc.python with the bcc module replaced by mocks """
+    bcc = types.ModuleType("bcc")
+    bcc.__version__ = "0.20.0"
+    bcc.BPF = type("BPF", (object,), {})
+    table = types.ModuleType("bcc.table")
+    table.log2_index_max = LOG2_INDEX_MAX
+    table.ArrayBase = ArrayBase
+    bcc.table = table
+    sys.modules["bcc"] = bcc
+    sys.modules["bcc.table"] = table
+
+    modules = os.path.join(os.environ.get("PCP_PMDAS_DIR", "/var/lib/pcp/pmdas"),
+                           "bcc", "modules")
+    loader = SourceFileLoader("pcpbcc", os.path.join(modules, "pcpbcc.python"))
+    module = types.ModuleType(loader.name)
+    loader.exec_module(module)
+    return module.PCPBCCBase
+
+
+PCPBCCBase = load_pcpbcc()
+
+
+class PCPBCCTests(unittest.TestCase):
+
+    def setUp(self):
+        PCPBCCBase.batch_unsupported.clear()
+
+    def testReadTableBatched(self):
+        table = HashTable({pid: pid * 10 for pid in range(2000)})
+        entries = PCPBCCBase.read_table(table, clear=True)
+        self.assertEqual(len(entries), 2000)
+        self.assertEqual(dict((k.value, v.value) for k, v in entries)[42], 420)
+        self.assertEqual(table.entries, {})
+        self.assertEqual(table.syscalls, 4)
+
+    def testReadTableFallback(self):
+        table = HashTable({1: 10, 2: 20})
+        table.batched = False
+        entries = PCPBCCBase.read_table(table, clear=True)
+        self.assertEqual(sorted((k.value, v.value) for k, v in entries), [(1, 10), (2, 20)])
+        self.assertEqual(table.entries, {})
+        self.assertIn(("HashTable", True), PCPBCCBase.batch_unsupported)
+
+        # no further batch attempts once found to be unsupported
+        table.entries = {3: 30}
+        table.syscalls = 0
+        PCPBCCBase.read_table(table, clear=True)
+        self.assertEqual(table.syscalls, 6)
+
+    def testReadArray(self):
+        table = ArrayBase({i: 0 for i in range(16)})
+        table.entries[3] = 7
+        values = PCPBCCBase.read_array(table, 16, clear=True)
+        self.assertEqual(len(values), 16)
+        self.assertEqual(values[3], 7)
+        self.assertEqual(sum(values), 7)
+        self.assertEqual(table.entries[3], 0)
+
+    def testReadLog2Histogram(self):
+        table = ArrayBase({i: 0 for i in range(LOG2_INDEX_MAX)})
+        table.entries.update({1: 5, 3: 2})
+        cache = {}
+        insts = PCPBCCBase.read_log2_histogram(table, cache, clear=True)
+        self.assertEqual(list(insts.keys()), ["0-1", "2-3", "4-7"])
+        self.assertEqual(cache, {"0-1": 5, "2-3": 0, "4-7": 2})
+        table.entries[1] = 1
+        PCPBCCBase.read_log2_histogram(table, cache, clear=True)
+        self.assertEqual(cache["0-1"], 6)
+
+    def testReadLog2Histograms(self):
+        table = SectionHashTable({(b"read", 1): 4, (b"write", 2): 3})
+        cache = {}
+        insts = PCPBCCBase.read_log2_histograms(table, cache, clear=True)
+        self.assertEqual(list(insts.keys()), ["0-1", "2-3"])
+        self.assertEqual(cache, {"read": {"0-1": 4}, "write": {"0-1": 0, "2-3": 3}})
+        self.assertEqual(table.entries, {})
+
+    def testUpdateInsts(self):
+        insts = {}
+        self.assertTrue(PCPBCCBase.update_insts(insts, {"000001", "000002"}))
+        self.assertFalse(PCPBCCBase.update_insts(insts, {"000001", "000002"}))
+        self.assertTrue(PCPBCCBase.update_insts(insts, {"000002"}))
+        self.assertEqual(list(insts.keys()), ["000002"])
+
+
+def benchmark(entries=50000, repeat=5):
+    """ Compare batched and per-entry reads of a large mock hash table """
+    data = {pid: pid for pid in range(entries)}
+    for batched in True, False:
+        PCPBCCBase.batch_unsupported.clear()
+        table = HashTable()
+        table.batched = batched
+
+        def read():
+            table.entries = dict(data)
+            PCPBCCBase.read_table(table, clear=True)
+        elapsed = min(timeit.repeat(read, number=1, repeat=repeat))
+        print("%-9s %d entries: %.2f msec, %d syscalls" %
+              ("batched" if batched else "per-entry", entries,
+               elapsed * 1000, table.syscalls // repeat))
+
+
+if __name__ == "__main__":
+    benchmark()
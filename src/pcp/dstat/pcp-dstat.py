@@ -1,6 +1,6 @@
 #!/usr/bin/env pmpython
 #
-# Copyright (C) 2018-2022 Red Hat.
+# Copyright (C) 2018-2022,2026 Red Hat.
 # Copyright (C) 2004-2016 Dag Wieers <dag@wieers.com>
 #
 # This program is free software; you can redistribute it and/or modify it
@@ -25,10 +25,11 @@ try:
     import configparser as ConfigParser
 except ImportError:
     import ConfigParser
-import termios, struct, atexit, fcntl, sched, errno, time, re, sys, os
+import termios, struct, atexit, fcntl, errno, json, time, re, sys, os
 
 # PCP Python PMAPI
 from pcp import pmapi, pmconfig
+from pcp.schedule import Scheduler
 from cpmapi import PM_CONTEXT_ARCHIVE, PM_CONTEXT_HOST, PM_CONTEXT_LOCAL
 from cpmapi import PM_TYPE_32, PM_TYPE_U32, PM_TYPE_64, PM_TYPE_U64
 from cpmapi import PM_TYPE_DOUBLE, PM_TYPE_FLOAT, PM_TIME_MIN, PM_TIME_HOUR
@@ -226,6 +227,129 @@ class DstatTerminal:
                     COLOR['gray'], COLOR['red'], COLOR['green'])
 
 
+class DstatConfig(object):
+    """ Plugin definitions from the configuration files, parsed lazily.
+        Every plugin name is needed at startup (each is also a long option)
+        so the files are first only scanned for their section headers; a
+        full parse is then done just for the files defining the plugins
+        that are actually requested.  Plugin names and parsed definitions
+        are kept in a cache file, discarded if any configuration file is
+        added, removed or modified (by mtime and size).
+    """
+    VERSION = 1
+
+    def __init__(self, paths, cache=None):
+        self.paths = paths
+        self.cache = cache
+        self.stamps = self.stat(paths)
+        self.index = OrderedDict()  # section -> indexes of files defining it
+        self.defaults = []          # indexes of files with DEFAULT sections
+        self.plugins = {}           # section -> parsed (key, value) pairs
+        self.changed = False
+        if not self.load():
+            self.scan()
+
+    @staticmethod
+    def stat(paths):
+        """ Modification time and size of each configuration file """
+        stamps = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stamps.append([path, st.st_mtime, st.st_size])
+            except OSError:
+                stamps.append([path, None, None])
+        return stamps
+
+    def load(self):
+        """ Use the cached plugins if the configuration files are unchanged """
+        if not self.cache:
+            return False
+        try:
+            with open(self.cache) as cache:
+                saved = json.load(cache)
+            if saved['version'] != self.VERSION or saved['files'] != self.stamps:
+                return False
+            self.index = OrderedDict(saved['sections'])
+            self.defaults = saved['defaults']
+            self.plugins = saved['plugins']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def save(self):
+        """ Update the cache file with plugins parsed on this invocation """
+        if not self.cache or not self.changed:
+            return
+        saved = {'version': self.VERSION, 'files': self.stamps,
+                 'sections': list(self.index.items()),
+                 'defaults': self.defaults, 'plugins': self.plugins}
+        try:
+            directory = os.path.dirname(self.cache)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            temp = '%s.%d' % (self.cache, os.getpid())
+            with open(temp, 'w') as cache:
+                json.dump(saved, cache, separators=(',', ':'))
+            os.rename(temp, self.cache)
+            self.changed = False
+        except (IOError, OSError):
+            pass
+
+    def scan(self):
+        """ Find the sections in each file without parsing any options """
+        header = ConfigParser.RawConfigParser.SECTCRE
+        for i, path in enumerate(self.paths):
+            try:
+                with open(path) as config:
+                    for line in config:
+                        match = header.match(line.strip())
+                        if not match:
+                            continue
+                        name = match.group('header')
+                        if name == ConfigParser.DEFAULTSECT:
+                            files = self.defaults
+                        else:
+                            files = self.index.setdefault(name, [])
+                        if i not in files:
+                            files.append(i)
+            except (IOError, OSError, UnicodeDecodeError):
+                pass    # unreadable files are skipped, as by ConfigParser
+        self.changed = True
+
+    def parse(self, section):
+        """ Parse the files defining one section, caching all their plugins """
+        files = sorted(set(self.index[section] + self.defaults))
+        paths = [self.paths[i] for i in files]
+        config = ConfigParser.RawConfigParser()
+        config.optionxform = str
+        try:
+            config.read(paths)
+        except ConfigParser.Error as cfgerr:
+            sys.stderr.write("Config parse failure: %s\n" % cfgerr)
+            sys.exit(1)
+        except Exception:
+            sys.stderr.write("Cannot parse configs in %s\n" % paths)
+            sys.exit(1)
+        for name in config.sections():
+            if name in self.index and set(self.index[name]) <= set(files):
+                self.plugins[name] = [(key, config.get(name, key))
+                                      for key in config.options(name)]
+        self.changed = True
+
+    def sections(self):
+        return list(self.index)
+
+    def has_section(self, section):
+        return section in self.index
+
+    def items(self, section):
+        """ Options of a plugin section as (key, value) pairs """
+        if section not in self.plugins:
+            self.parse(section)
+        return self.plugins.get(section, [])
+
+
 class DstatPlugin(object):
     """ Performance metrics group, for generating reports on one or
         more performance metrics (term/CSV) using pmConfig services.
@@ -417,6 +541,7 @@ class DstatTool(object):
 
     # Default configuration file directories
     DEFAULT_CONFIGS = ["$PCP_SYSCONF_DIR/dstat", "$HOME/.pcp/dstat"]
+    CONFIG_CACHE = "$HOME/.pcp/dstat.cache"
     CONFIG_VERSION = 1
 
     # Defaults
@@ -436,7 +561,6 @@ class DstatTool(object):
                 sys.stderr.write(": No such file or directory\n")
                 sys.exit(1)
 
-        self.inittime = time.time()
         self.context = None
         self.opts = self.options()
         self.arguments = arguments
@@ -477,6 +601,8 @@ class DstatTool(object):
         # Internal
         self.missed = 0
         self.nomissed = False # report missed ticks by default
+        self.stats = False    # report schedule statistics on exit
+        self.scheduler = None
         self.runtime = -1
         self.plugins = []     # list of requested plugin names
         self.allplugins = []  # list of all known plugin names
@@ -486,6 +612,8 @@ class DstatTool(object):
         self.vislist = []     # visible DstatPlugin object list
         self.mapping = {}     # maps 'section/label' to plugin
         self.novalues = True  # values observed for this line
+        self.pipeline = None  # compiled report line for the visible list
+        self.pipelist = None  # visible list the pipeline was compiled for
 
         self.full = False
         self.bits = False
@@ -608,19 +736,10 @@ class DstatTool(object):
             sys.stderr.write("No configs found in: %s\n" % self.DEFAULT_CONFIGS)
             sys.exit(1)
 
-        config = ConfigParser.RawConfigParser()
-        config.optionxform = str
-        try:
-            found = config.read(paths)
-        except ConfigParser.Error as cfgerr:
-            sys.stderr.write("Config parse failure: %s\n" % cfgerr.message())
-            sys.exit(1)
-        except Exception:
-            sys.stderr.write("Cannot parse configs in %s\n" % paths)
-            sys.exit(1)
+        config = DstatConfig(paths, self.config_paths(self.CONFIG_CACHE))
 
         if self.debug:
-            print("Found configs: %s" % found)
+            print("Found configs: %s" % paths)
             print("with sections: %s" % config.sections())
 
         for plugin in config.sections():
@@ -658,8 +777,7 @@ class DstatTool(object):
             else:
                 plugin = DstatPlugin(section)
 
-                for key in config.options(section):
-                    value = config.get(section, key)
+                for key, value in config.items(section):
                     if key in lib.metricspec:
                         if self.debug:
                             print("Default %s %s -> %s" % (section, key, value))
@@ -717,6 +835,8 @@ class DstatTool(object):
 
             self.totlist.append(plugin)
 
+        config.save()
+
     def finalize_options(self):
         operands = self.opts.pmGetOperands()
         if not operands:
@@ -810,6 +930,7 @@ class DstatTool(object):
         opts.pmSetLongOption('noheaders', 0, '', '', 'disable repetitive headers')
         opts.pmSetLongOption('noupdate', 0, '', '', 'disable intermediate updates')
         opts.pmSetLongOption('nomissed', 0, '', '', 'disable missed ticks warnings')
+        opts.pmSetLongOption('stats', 0, '', '', 'report missed ticks and timing on exit')
         opts.pmSetLongOption('output', 1, 'o', 'file', 'write CSV output to file')
         opts.pmSetLongOption('version', 0, 'V', '', '')
         opts.pmSetLongOption('debug', 1, None, '', '')
@@ -950,6 +1071,8 @@ class DstatTool(object):
             self.update = False
         elif opt in ['nomissed']:
             self.nomissed = True
+        elif opt in ['stats']:
+            self.stats = True
         elif opt in ['o', 'output']:
             self.output = arg
         elif opt in ['pidfile']:
@@ -1194,12 +1317,12 @@ class DstatTool(object):
                     ret = '%2dw' % (var / 60 / 24 / 7)
         return ret
 
-    def tshow(self, plugin, stamp):
-        "Display sample time stamp"
-        value = self.showtime(plugin, stamp)
-        line = self.cprint(value, NOUNITS, 's', None, plugin.width, None)
-        #sys.stderr.write("tshow result:\n%s%s\n" % (line, THEME['default']))
-        return line
+    def tcompile(self, plugin, sep):
+        "Compile display of sample time stamps"
+        column = self.ccompile(NOUNITS, 's', None, plugin.width, None)
+        def tshow(results, stamp, final):
+            return sep + column(self.showtime(plugin, stamp), final)
+        return tshow
 
     def mgetkey(self, label, instid):
         "Get valueset lookup key for a given metric instance"
@@ -1247,36 +1370,35 @@ class DstatTool(object):
             return valueset
         return None
 
-    def mshow(self, plugin, index, result):
-        "Display stat results"
-        metric = op.metrics[plugin.mgroup[index]]
-        #sys.stderr.write("Result metric: %s\n" % metric)
-        label = metric[0]
-        units = metric[2][1]
-        width = metric[4]
-        pmtype = metric[5].pmtype
-        printtype = metric[8]
-        colorstep = metric[9]
-        valuesets = metric[13]
+    def mcompile(self, plugin, sep):
+        "Compile display of stat results"
+        columns = []
+        for name in plugin.mgroup:
+            metric = op.metrics[name]
+            pmtype = metric[5].pmtype
+            column = self.ccompile(metric[2][1], metric[8], pmtype, metric[4], metric[9])
+            columns.append((name, metric[0], pmtype, metric[13], column))
 
-        line = ''
-        count = 0
-        sep = CHAR['space']
-        for instid, _, value in result:
-            if count > 0:
-                line = line + sep
-            key = self.mgetkey(label, instid)
-            valueset = self.mappend(valuesets, key, pmtype, value)
-            value = self.maverage(valueset, key, pmtype)
-            self.mcleanup(valuesets, key)
-            self.mupdate(valuesets, valueset, key)
-            #sys.stderr.write("mshow result value:\n%s%s\n" % (value, THEME['default']))
-            line = line + self.cprint(value, units, printtype, pmtype, width, colorstep)
-            count += 1
-        if count == 0:
-            line = line + self.cprint(None, units, printtype, pmtype, width, colorstep)
-        #sys.stderr.write("mshow result line:\n%s%s\n" % (line, THEME['default']))
-        return line
+        def mshow(results, stamp, final):
+            line = sep
+            for m, (name, label, pmtype, valuesets, column) in enumerate(columns):
+                if m > 0:
+                    line = line + CHAR['space']
+                count = 0
+                for instid, _, value in results[name]:
+                    if count > 0:
+                        line = line + CHAR['space']
+                    key = self.mgetkey(label, instid)
+                    valueset = self.mappend(valuesets, key, pmtype, value)
+                    value = self.maverage(valueset, key, pmtype)
+                    self.mcleanup(valuesets, key)
+                    self.mupdate(valuesets, valueset, key)
+                    line = line + column(value, final)
+                    count += 1
+                if count == 0:
+                    line = line + column(None, final)
+            return line
+        return mshow
 
     @staticmethod
     def roundcsv(var):
@@ -1320,125 +1442,112 @@ class DstatTool(object):
             return name[len(name)-4:len(name)] == '.top'
         return False
 
-    def gshow(self, plugin, results):
-        "Display stat group results"
-        line = ''
-        count = 0
+    def gcompile(self, plugin, sep):
+        "Compile display of stat group results"
         col = THEME['frame'] + CHAR['colon']
-
-        # first iterate over the result and update all metric instance valuesets
-        for i, name in enumerate(plugin.mgroup):        # e.g. [usr, sys, idl]
-            metric = op.metrics[plugin.mgroup[i]]
-            result = results[name]
-            valuesets = metric[13]
+        size = len(plugin.mgroup)
+        last = plugin.mgroup[-1]
+        metrics = []
+        for name in plugin.mgroup:        # e.g. [usr, sys, idl]
+            metric = op.metrics[name]
             pmtype = metric[5].pmtype
-            label = metric[0]
-            top_instance = None
-            top_value = 0
+            units = metric[2][1]
+            width = metric[4]
+            printtype = metric[8]
+            colorstep = metric[9]
             top_key = self.top_sort_key(name, plugin)  # boolean: top sort key?
+            # 'total' columns are displayed as for the last metric in the group
+            total = self.ccompile(units, printtype, pmtype, width, colorstep)
+            if plugin.grouptype == 4 and metric[10] is not None:
+                colorstep = int(metric[10])
+            column = self.ccompile(units, printtype, pmtype, width, colorstep)
+            metrics.append((name, metric[0], pmtype, metric[13], top_key, column))
+
+        def gshow(results, stamp, final):
+            line = ''
+            count = 0
+
+            # first iterate over the result and update all metric instance valuesets
+            for name, label, pmtype, valuesets, top_key, _ in metrics:
+                result = results[name]
+                top_instance = None
+                top_value = 0
 
-            if top_key:
-                plugin.igroup = []  # empty out for subsequent re-evaluation
-
-            for instid, _, value in result:
-                key = self.mgetkey(label, instid)
-                valueset = self.mappend(valuesets, key, pmtype, value)
-                self.mupdate(valuesets, valueset, key)
+                if top_key:
+                    plugin.igroup = []  # empty out for subsequent re-evaluation
 
-            # assess top-most instance and update instances list
-            if top_key and pmtype in [PM_TYPE_32, PM_TYPE_U32, PM_TYPE_64,
-                                    PM_TYPE_U64, PM_TYPE_FLOAT, PM_TYPE_DOUBLE]:
-                for instid, instname, value in result:
+                for instid, _, value in result:
                     key = self.mgetkey(label, instid)
-                    valueset = self.mlookup(valuesets, key)
-                    value = self.maverage(valueset, key, pmtype)
-                    if value > top_value:
-                        top_instance = instname
-                        top_value = value
-                if top_value == 0:  # short-circuit if no top-most instance found
-                    return line + '%-*s' % (plugin.width, ' ')
-                plugin.igroup = [top_instance]  # otherwise we restrict instances
+                    valueset = self.mappend(valuesets, key, pmtype, value)
+                    self.mupdate(valuesets, valueset, key)
 
-        # next, iterate over specific instances requested and report values
-        for inst in plugin.igroup:      # e.g. [cpu0, cpu1, total]
-            for i, name in enumerate(plugin.mgroup):        # e.g. [usr, sys, idl]
-                metric = op.metrics[plugin.mgroup[i]]
-                result = results[name]
-                valuesets = metric[13]
-                label = metric[0]
-                units = metric[2][1]
-                width = metric[4]
-                pmtype = metric[5].pmtype
-                printtype = metric[8]
-                colorstep = metric[9]
-                value = None
-
-                if plugin.grouptype == 4:
-                    if self.top_sort_key(name, plugin):  # skip it if so
-                        continue
-                    if metric[10] is not None:
-                        colorstep = int(metric[10])
-
-                for instid, instname, _ in result:
-                    if instname == inst:
+                # assess top-most instance and update instances list
+                if top_key and pmtype in [PM_TYPE_32, PM_TYPE_U32, PM_TYPE_64,
+                                        PM_TYPE_U64, PM_TYPE_FLOAT, PM_TYPE_DOUBLE]:
+                    for instid, instname, value in result:
                         key = self.mgetkey(label, instid)
                         valueset = self.mlookup(valuesets, key)
                         value = self.maverage(valueset, key, pmtype)
-                #sys.stderr.write("[%s] inst=%s value=%s\n" % (name, inst, str(value)))
-                if not self.instance_match(inst, plugin):
-                    continue
-                if plugin.grouptype == 2:   # total only
-                    continue
-                if count > 0 and (count % len(plugin.mgroup)) == 0:
+                        if value > top_value:
+                            top_instance = instname
+                            top_value = value
+                    if top_value == 0:  # short-circuit if no top-most instance found
+                        return sep + '%-*s' % (plugin.width, ' ')
+                    plugin.igroup = [top_instance]  # otherwise we restrict instances
+
+            # next, iterate over specific instances requested and report values
+            if plugin.grouptype != 2 and plugin.igroup:    # not total only
+                instids = [dict((instname, instid) for instid, instname, _ in results[m[0]])
+                           for m in metrics]
+                for inst in plugin.igroup:      # e.g. [cpu0, cpu1, total]
+                    if not self.instance_match(inst, plugin):
+                        continue
+                    for i, (_, label, pmtype, valuesets, top_key, column) in enumerate(metrics):
+                        if top_key:             # skip it if so
+                            continue
+                        value = None
+                        instid = instids[i].get(inst)
+                        if instid is not None:
+                            key = self.mgetkey(label, instid)
+                            valueset = self.mlookup(valuesets, key)
+                            value = self.maverage(valueset, key, pmtype)
+                        if count > 0 and (count % size) == 0:
+                            line = line + col
+                        elif count > 0:
+                            line = line + CHAR['space']
+                        line = line + column(value, final)
+                        count += 1
+
+            if plugin.grouptype in [2, 3]:         # report 'total' (sum) calculation
+                totals = [0] * size
+                for i, (name, label, pmtype, valuesets, _, _) in enumerate(metrics):
+                    values = 0
+                    for instid, instname, _ in results[name]:
+                        if plugin.cullinsts is not None and re.match(plugin.cullinsts, instname):
+                            continue
+                        key = self.mgetkey(label, instid)
+                        valueset = self.mlookup(valuesets, key)
+                        totals[i] += self.maverage(valueset, key, pmtype)
+                        values += 1
+
+                if values == 0:
+                    totals = [None] * size
+                if values and plugin.printtype == 'p':
+                    for i in range(0, size):
+                        totals[i] /= values
+                if line != '':
                     line = line + col
-                elif count > 0:
-                    line = line + CHAR['space']
-                line = line + self.cprint(value, units, printtype, pmtype, width, colorstep)
-                count += 1
+                line = line + CHAR['space'].join([total(value, final) for value in totals])
 
-        if plugin.grouptype in [2, 3]:         # report 'total' (sum) calculation
-            totals = [0] * len(plugin.mgroup)
-            for i, name in enumerate(plugin.mgroup):        # e.g. [usr, sys, idl]
-                metric = op.metrics[name]
-                values = 0
-                result = results[name]
-                valuesets = metric[13]
-                label = metric[0]
-                units = metric[2][1]
-                width = metric[4]
-                pmtype = metric[5].pmtype
-                printtype = metric[8]
-                colorstep = metric[9]
-
-                for instid, instname, _ in result:
-                    if plugin.cullinsts is not None and re.match(plugin.cullinsts, instname):
-                        continue
+            # finally, throw away any values that are no longer needed
+            for _, label, _, valuesets, _, _ in metrics:
+                for instid, _, _ in results[last]:
                     key = self.mgetkey(label, instid)
-                    valueset = self.mlookup(valuesets, key)
-                    totals[i] += self.maverage(valueset, key, pmtype)
-                    values += 1
-
-            if values == 0:
-                totals = [None] * len(plugin.mgroup)
-            if values and plugin.printtype == 'p':
-                for i in range(0, len(plugin.mgroup)):
-                    totals[i] /= values
-            if line != '':
-                line = line + col
-            line = line + self.cprintlist(totals, units, printtype, pmtype, width, colorstep)
+                    valueset = self.mcleanup(valuesets, key)
+                    self.mupdate(valuesets, valueset, key)
 
-        # finally, throw away any values that are no longer needed
-        for i, name in enumerate(plugin.mgroup):        # e.g. [usr, sys, idl]
-            metric = op.metrics[name]
-            valuesets = metric[13]
-            label = metric[0]
-            for instid, _, _ in result:
-                key = self.mgetkey(label, instid)
-                valueset = self.mcleanup(valuesets, key)
-                self.mupdate(valuesets, valueset, key)
-
-        #sys.stderr.write("gshow result line:\n%s%s\n" % (line, THEME['default']))
-        return line
+            return sep + line
+        return gshow
 
     def gshowcsv(self, plugin, results):
         "Return stat group results for CSV file"
@@ -1512,8 +1621,8 @@ class DstatTool(object):
         return line
 
     @staticmethod
-    def scale_time(value, scale):
-        """ convert to canonical time units of seconds """
+    def scale_time(scale):
+        """ divisor and multiplier to canonical time units of seconds """
         div = 1.0
         mul = 1.0
         if scale == PM_TIME_NSEC:
@@ -1526,35 +1635,28 @@ class DstatTool(object):
             mul = 60.0
         elif scale == PM_TIME_HOUR:
             mul = 3600.0
-        return (float(value) / div) * mul
+        return div, mul
 
     @staticmethod
-    def scale_space(value, scale):
-        """ convert to canonical space units of bytes """
+    def scale_space(scale):
+        """ multiplier to canonical space units of bytes """
         if scale == 0:
-            return value
-        return value * pow(1024, scale)
-
-    def cprintlist(self, values, units, prtype, pmtype, width, colorstep):
-        """Return all columns color printed"""
-        ret = sep = ''
-        for value in values:
-            ret = ret + sep + self.cprint(value, units, prtype, pmtype, width, colorstep)
-            sep = CHAR['space']
-        return ret
-
-    def cprint(self, value, units, printtype, pmtype, width, colorstep):
-        """Color print one column.  Note that @value may be None indicating
-           there were no values available at sampling time in which case we
-           print a blank section in the report.  If the entire line ends up
-           blank, we filter it out later.
+            return None
+        return pow(1024, scale)
+
+    def ccompile(self, units, printtype, pmtype, width, colorstep):
+        """Compile color printing of one column.  Everything that depends
+           only on the column - print type, unit scaling, field width and
+           unit suffixes, colors - is worked out here once, the returned
+           closure then converts a value and is called every sample as
+           column(value, final), where @final is set for the last step in
+           a delay.  Note that @value may be None indicating there were no
+           values available at sampling time in which case we print a blank
+           section in the report.  If the entire line ends up blank, we
+           filter it out later.
         """
-        if value is not None:
-            self.novalues = False
-        else:
-            value = ''
-            printtype = 's'
-            colorstep = None
+        # blank sections, for intermediate and final steps
+        blank = (THEME['text_hi'] + ''.ljust(width), THEME['text_lo'] + ''.ljust(width))
 
         if printtype is None:
             if pmtype in [PM_TYPE_32, PM_TYPE_U32, PM_TYPE_64, PM_TYPE_U64]:
@@ -1563,94 +1665,116 @@ class DstatTool(object):
                 printtype = 'f'
             else:
                 printtype = 's'
+        numeric = printtype != 's'
         base = 1000
-        if units.dimTime and printtype != 's':
-            value = self.scale_time(value, units.scaleTime)
-        if units.dimSpace and printtype != 's':
+        timescale = spacescale = countscale = None
+        if units.dimTime and numeric:
+            timescale = self.scale_time(units.scaleTime)
+        if units.dimSpace and numeric:
             base = 1024
-            value = self.scale_space(value, units.scaleSpace)
-        if units.dimCount and units.scaleCount and printtype != 's':
-            value *= units.scaleCount
+            spacescale = self.scale_space(units.scaleSpace)
+        if units.dimCount and units.scaleCount and numeric:
+            countscale = units.scaleCount
 
         ### Display units when base is exact 1000 or 1024
         showunit = False
         if colorstep is None:
-            if width >= len(str(base)) and not isinstance(value, str):
+            if width >= len(str(base)) and numeric:
                 showunit = True
                 width = width - 1
 
-        ### If this is a negative value, return a dash
-        if printtype in ('b', 'd', 'f') and value < 0:
-            if showunit:
-                return THEME['error'] + '-'.rjust(width) + CHAR['space'] + THEME['default']
-            else:
-                return THEME['error'] + '-'.rjust(width) + THEME['default']
+        ### Negative values are shown as a dash
+        dash = '-'.rjust(width)
+        if showunit:
+            dash += CHAR['space']
+        signed = printtype in ('b', 'd', 'f')
 
-        if op.bits and printtype in ('b', ):
+        bits = op.bits and printtype in ('b', )
+        if bits:
             units = ('b', 'k', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y')
             base = 1000
-            value = value * 8.0
         elif base != 1024:
             units = (CHAR['space'], 'k', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y')
         else:
             units = ('B', 'k', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y')
 
-        if step == op.delay:
-            colors = THEME['colors_lo']
-            ctext = THEME['text_lo']
-            cunit = THEME['unit_lo']
-            cdone = THEME['done_lo']
-        else:
-            colors = THEME['colors_hi']
-            ctext = THEME['text_hi']
-            cunit = THEME['unit_hi']
-            cdone = THEME['done_hi']
-
-        #sys.stderr.write("printtype: %s width=%d\n" % (str(printtype), width))
-        #sys.stderr.write("colorstep: %s value=%s\n" % (colorstep, str(value)))
+        # colors, text, unit and done themes for intermediate and final steps
+        themes = ((THEME['colors_hi'], THEME['text_hi'], THEME['unit_hi'], THEME['done_hi']),
+                  (THEME['colors_lo'], THEME['text_lo'], THEME['unit_lo'], THEME['done_lo']))
 
         ### Convert value to string given base and field-length
+        text = False
         if op.integer and printtype in ('b', 'd', 'p', 'f'):
-            ret, c = self.dchg(value, width, base)
+            convert = self.dchg
         elif op.float and printtype in ('b', 'd', 'p', 'f'):
-            ret, c = self.fchg(value, width, base)
+            convert = self.fchg
         elif printtype in ('b', 'd', 'p'):
-            ret, c = self.dchg(value, width, base)
+            convert = self.dchg
         elif printtype in ('f',):
-            ret, c = self.fchg(value, width, base)
+            convert = self.fchg
         elif printtype in ('s',):
-            ret, c = self.schg(value, width), ctext
+            convert, text = self.schg, True
         elif printtype in ('t',):
-            ret, c = self.tchg(value, width), ctext
+            convert, text = self.tchg, True
         else:
-            raise TypeError('printtype %s not known to pcp-dstat.' % printtype)
-
-        ### Set the metrics color
-        if ret == '0':
-            color = cunit
-        elif printtype in ('p') and py3round(value) >= 100.0:
-            color = cdone
-        elif printtype not in ('s') and colorstep is not None and colorstep != 0:
-            color = colors[int(value/colorstep) % len(colors)]
-        elif printtype in ('b', 'd', 'f'):
-            color = colors[c % len(colors)]
-        else:
-            color = ctext
+            convert = None
 
-        ### Justify value to left if string
-        if printtype in ('s',):
-            ret = color + ret.ljust(width)
-        else:
-            ret = color + ret.rjust(width)
+        percent = printtype == 'p'
+        stepped = numeric and colorstep is not None and colorstep != 0
+        scaled = printtype in ('b', 'd', 'f')
+        justify = str.ljust if printtype == 's' else str.rjust
 
-        ### Add unit to output
-        if showunit:
-            if c != -1 and py3round(value) != 0:
-                ret += cunit + units[c]
+        def column(value, final):
+            if value is None:
+                return blank[final]
+            self.novalues = False
+
+            if timescale:
+                value = (float(value) / timescale[0]) * timescale[1]
+            if spacescale:
+                value = value * spacescale
+            if countscale:
+                value *= countscale
+
+            ### If this is a negative value, return a dash
+            if signed and value < 0:
+                return THEME['error'] + dash + THEME['default']
+
+            if bits:
+                value = value * 8.0
+            colors, ctext, cunit, cdone = themes[final]
+
+            if text:
+                ret, c = convert(value, width), ctext
+            elif convert:
+                ret, c = convert(value, width, base)
             else:
-                ret += CHAR['space']
+                raise TypeError('printtype %s not known to pcp-dstat.' % printtype)
+
+            ### Set the metrics color
+            if ret == '0':
+                color = cunit
+            elif percent and py3round(value) >= 100.0:
+                color = cdone
+            elif stepped:
+                color = colors[int(value/colorstep) % len(colors)]
+            elif scaled:
+                color = colors[c % len(colors)]
+            else:
+                color = ctext
 
-        return ret
+            ### Justify value to left if string
+            ret = color + justify(ret, width)
+
+            ### Add unit to output
+            if showunit:
+                if c != -1 and py3round(value) != 0:
+                    ret += cunit + units[c]
+                else:
+                    ret += CHAR['space']
+
+            return ret
+        return column
 
     def show_header(self, visible):
         "Return the header for a set of module counters"
@@ -1715,6 +1839,35 @@ class DstatTool(object):
         except:
             pass
 
+    def compile(self, vislist):
+        """ Compile the visible plugins into the list of column closures
+            that make up a report line, each called once per sample with
+            the ranked results, time stamp and final step flag.  This is
+            redone only when the set of visible plugins changes.
+        """
+        pipeline = []
+        trimmed = THEME['frame'] + CHAR['gt']
+        for i, plugin in enumerate(self.totlist):
+            if i == 0:
+                sep = ''
+            else:
+                sep = THEME['frame'] + CHAR['pipe']
+            if plugin not in vislist:
+                pass
+            elif plugin in self.timelist:
+                pipeline.append(self.tcompile(plugin, sep))
+            elif plugin.grouptype is None:
+                if plugin.mgroup:
+                    pipeline.append(self.mcompile(plugin, sep))
+            elif plugin.mgroup:
+                pipeline.append(self.gcompile(plugin, sep))
+            if self.totlist == vislist:
+                continue
+            if plugin in self.totlist and plugin not in vislist:
+                pipeline.append(lambda results, stamp, final: trimmed)
+                break
+        return pipeline
+
     def perform(self, update):
         "Inner loop that calculates counters and constructs output"
         global oldvislist, vislist, showheader, showcsvheader, rows, cols
@@ -1733,11 +1886,6 @@ class DstatTool(object):
                 totaltime = 0
             curwidth = 8
 
-        # If it takes longer than 500ms, then warn!
-        if loop != 0 and starttime - self.inittime - update > 1:
-            self.missed = self.missed + 1
-            return
-
         # Initialise certain variables
         if loop == 0:
             rows, cols = 0, 0
@@ -1773,10 +1921,12 @@ class DstatTool(object):
             vislist = self.totlist
 
         # Fetch values
+        self.scheduler.fetching()
         try:
             self.pmfg.fetch()
         except pmapi.pmErr as fetcherr:
             raise fetcherr
+        self.scheduler.fetched()
 
         # Calculate all objects (visible, invisible)
         onovalues = self.novalues
@@ -1790,27 +1940,15 @@ class DstatTool(object):
         # Note that some plugins (time-based) will not have
         # any corresponding entry in the results.
 
+        if self.pipeline is None or self.pipelist is not vislist:
+            self.pipeline = self.compile(vislist)
+            self.pipelist = vislist
+
         results = self.pmconfig.get_ranked_results()
-        for i, plugin in enumerate(self.totlist):
-            if i == 0:
-                sep = ''
-            else:
-                sep = THEME['frame'] + CHAR['pipe']
-            if plugin not in vislist:
-                pass
-            elif plugin in self.timelist:
-                line = line + sep + self.tshow(plugin, self.pmfg_ts)
-            elif plugin.grouptype is None:
-                for m, name in enumerate(plugin.mgroup):
-                    line = line + sep + self.mshow(plugin, m, results[name])
-                    sep = CHAR['space']
-            elif plugin.mgroup:
-                line = line + sep + self.gshow(plugin, results)
-            if self.totlist == vislist:
-                continue
-            if plugin in self.totlist and plugin not in vislist:
-                line = line + THEME['frame'] + CHAR['gt']
-                break
+        final = step == op.delay
+        stamp = self.pmfg_ts
+        for column in self.pipeline:
+            line = line + column(results, stamp, final)
 
         if self.output:
             for i, plugin in enumerate(self.totlist):
@@ -1899,11 +2037,6 @@ class DstatTool(object):
             sys.stdout.write("Config file keywords: " + str(self.keys) + "\n")
             sys.stdout.write("Metric spec keywords: " + str(self.pmconfig.metricspec) + "\n")
 
-        # Set delay mode for live sampling
-        if self.context.type != PM_CONTEXT_ARCHIVE:
-            scheduler = sched.scheduler(time.time, time.sleep)
-            self.inittime = time.time()
-
         # Common preparations
         self.context.prepare_execute(self.opts, False, self.interpol, self.interval)
 
@@ -1912,19 +2045,29 @@ class DstatTool(object):
         if not self.update:
             interval = op.delay
 
-        while update <= self.delay * (self.samples - 1) or self.samples == -1:
-            if self.context.type != PM_CONTEXT_ARCHIVE:
-                scheduler.enterabs(self.inittime + update, 1, perform, (update,))
-                scheduler.run()
-            else:
-                self.perform(update)
-            sys.stdout.flush()
-            update = update + interval
-
+        # Set delay mode for live sampling
+        if self.context.type != PM_CONTEXT_ARCHIVE:
+            self.scheduler = Scheduler(interval)
+        else:
+            self.scheduler = Scheduler(0)
 
-def perform(update):
-    """Helper function for interfacing to the scheduler"""
-    op.perform(update)
+        try:
+            while update <= self.delay * (self.samples - 1) or self.samples == -1:
+                # Skip any ticks missed while the last one overran
+                if update > 0:
+                    missed = self.scheduler.pause()
+                    if missed:
+                        self.missed = self.missed + missed
+                        update = update + interval * missed
+                        if update > self.delay * (self.samples - 1) and self.samples != -1:
+                            break
+                self.perform(update)
+                sys.stdout.flush()
+                update = update + interval
+        finally:
+            if self.stats:
+                for line in self.scheduler.summary():
+                    sys.stderr.write("%s: %s\n" % (pmapi.pmContext.pmGetProgname(), line))
 
 
 if __name__ == '__main__':
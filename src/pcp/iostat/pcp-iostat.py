@@ -1,6 +1,6 @@
 #!/usr/bin/env pmpython
 #
-# Copyright (C) 2014-2016,2020 Red Hat.
+# Copyright (C) 2014-2016,2020,2026 Red Hat.
 #
 # This program is free software; you can redistribute it and/or modify it
 # under the terms of the GNU General Public License as published by the
@@ -18,13 +18,21 @@
 
 import re
 import sys
+import csv
+import json
 import signal
+from operator import itemgetter
 from pcp import pmapi, pmcc
 from cpmapi import PM_CONTEXT_ARCHIVE, PM_MODE_FORW
 
 # use default SIGPIPE handler to avoid broken pipe exceptions
 signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 IOSTAT_SD_METRICS = [ 'disk.dev.read', 'disk.dev.read_bytes',
                       'disk.dev.write', 'disk.dev.write_bytes',
                       'disk.dev.read_merge', 'disk.dev.write_merge',
@@ -39,92 +47,166 @@ IOSTAT_DM_METRICS = [ 'disk.dm.read', 'disk.dm.read_bytes',
                       'disk.dm.read_rawactive', 'disk.dm.write_rawactive',
                       'disk.dm.avactive']
 
-def aggregate(method, aggr_value, value):
-    if method == 'sum':
-        aggr_value += value
-    elif method == 'avg':
-        aggr_value += value
-    elif method == 'min':
-        aggr_value = min(aggr_value, value)
-    elif method == 'max':
-        aggr_value = max(aggr_value, value)
-    else:
-        raise pmapi.pmUsageErr
-    return aggr_value
+# counter metrics (below disk.dev or disk.dm) used in the report, in
+# the order of the rows of the per-device counter matrices
+IOSTAT_COUNTERS = [ '.read_merge', '.write_merge', '.read', '.write',
+                    '.read_bytes', '.write_bytes',
+                    '.read_rawactive', '.write_rawactive', '.avactive']
+
+IOSTAT_COLUMNS = [ 'rrqm/s', 'wrqm/s', 'r/s', 'w/s', 'rkB/s', 'wkB/s',
+                   'avgrq-sz', 'avgqu-sz', 'await', 'r_await', 'w_await',
+                   '%util']
+
+# columns where a negative value indicates a counter wrap or reset
+IOSTAT_CHECKED = [0, 1, 2, 3, 6, 7, 8, 11]
+
+IOSTAT_AGGREGATES = ('sum', 'avg', 'min', 'max')
+IOSTAT_OUTPUTS = ('text', 'csv', 'json')
+
+class DeviceStats(object):
+    """
+    The report columns for every device over one interval, computed in
+    a single pass from (counters x devices) matrices of current and
+    previous values - as a NumPy (devices x columns) array when NumPy
+    is available, otherwise as one list per device.  Devices are then
+    reported in the given order, and those with missing values or
+    negative rates are flagged as invalid.
+    """
+    def __init__(self, current, previous, dt, order):
+        if numpy is not None:
+            self.matrix, self.invalid = self.__vectorized(current, previous, dt, order)
+        else:
+            self.matrix, self.invalid = self.__iterative(current, previous, dt, order)
+
+    @staticmethod
+    def __vectorized(current, previous, dt, order):
+        delta = numpy.array(current, dtype=float) - numpy.array(previous, dtype=float)
+        delta = delta[:, order]
+        rmerge, wmerge, rios, wios, rkb, wkb, ractive, wactive, active = delta
+        ios = rios + wios
+        queue = ractive + wactive
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            matrix = numpy.array([rmerge / dt, wmerge / dt, rios / dt, wios / dt,
+                                  rkb / dt, wkb / dt,
+                                  numpy.where(ios != 0, (rkb + wkb) / ios, 0.0),
+                                  queue / dt / 1000.0,
+                                  numpy.where(ios != 0, queue / ios, 0.0),
+                                  numpy.where(rios != 0, ractive / rios, 0.0),
+                                  numpy.where(wios != 0, wactive / wios, 0.0),
+                                  100.0 * (active / 1000.0) / dt]).T
+            invalid = numpy.isnan(matrix).any(axis=1) | \
+                      (matrix[:, IOSTAT_CHECKED] < 0).any(axis=1)
+        return matrix, invalid.tolist()
+
+    @staticmethod
+    def __iterative(current, previous, dt, order):
+        matrix = []
+        invalid = []
+        for c, p in zip(zip(*current), zip(*previous)):
+            rmerge, wmerge, rios, wios, rkb, wkb, ractive, wactive, active = \
+                [x - y for x, y in zip(c, p)]
+            ios = rios + wios
+            queue = ractive + wactive
+            row = [rmerge / dt, wmerge / dt, rios / dt, wios / dt,
+                   rkb / dt, wkb / dt,
+                   (rkb + wkb) / ios if ios else 0.0,
+                   queue / dt / 1000.0,
+                   queue / ios if ios else 0.0,
+                   ractive / rios if rios else 0.0,
+                   wactive / wios if wios else 0.0,
+                   100.0 * (active / 1000.0) / dt]
+            matrix.append(row)
+            invalid.append(any(value != value for value in row) or
+                           any(row[i] < 0 for i in IOSTAT_CHECKED))
+        return [matrix[i] for i in order], [invalid[i] for i in order]
+
+    def rows(self):
+        """ Report columns for each device, as lists of floats """
+        if numpy is not None:
+            return self.matrix.tolist()
+        return self.matrix
+
+    def aggregate(self, method, selected):
+        """ Reduce each report column over the selected devices """
+        if numpy is not None:
+            matrix = self.matrix[numpy.array(selected, dtype=bool)]
+            if not len(matrix):
+                return [0.0] * len(IOSTAT_COLUMNS)
+            if method == 'avg':
+                return matrix.mean(axis=0).tolist()
+            return getattr(matrix, method)(axis=0).tolist()
+        rows = [row for row, chosen in zip(self.matrix, selected) if chosen]
+        if not rows:
+            return [0.0] * len(IOSTAT_COLUMNS)
+        if method == 'avg':
+            return [sum(column) / len(rows) for column in zip(*rows)]
+        reduction = {'sum': sum, 'min': min, 'max': max}[method]
+        return [reduction(column) for column in zip(*rows)]
 
 class IostatReport(pmcc.MetricGroupPrinter):
     Hcount = 0
+    def __init__(self):
+        self.valfmt = None
+        self.regex = None
+        self.matches = {}       # device name: matches the -R regex
+        self.devices = None     # device axis in fetch order, as cached
+        self.order = None       # ... its permutation into sorted order
+        self.names = None       # ... sorted device names
+        self.mask = None        # ... and the -R filter mask over those
+        self.writer = None
+
     def timeStampDelta(self, group):
         s = group.timestamp.tv_sec - group.prevTimestamp.tv_sec
         n = group.timestamp.tv_nsec - group.prevTimestamp.tv_nsec
         # n may be negative here, calculation is still correct.
         return s + n / 1000000000.0
 
-    def instlist(self, group, name):
-        return dict(map(lambda x: (x[1], x[2]), group[name].netValues)).keys()
-
-    def curVals(self, group, name):
-        return dict(map(lambda x: (x[1], x[2]), group[name].netValues))
-
-    def prevVals(self, group, name):
-        return dict(map(lambda x: (x[1], x[2]), group[name].netPrevValues))
-
-    def report(self, manager):
-        regex = IostatOptions.Rflag
-        if regex == '':
-            regex = '.*'
-
-        aggr = IostatOptions.Gflag
-        if aggr and aggr not in ('sum', 'avg', 'min', 'max'):
-            print("Error, -G aggregation method must be one of 'sum', 'avg', 'min' or 'max'")
-            raise pmapi.pmUsageErr
-
-        precision = IostatOptions.Pflag
-        if precision < 0 or precision > 10 :
-            print("Precision value must be between 0 and 10")
-            raise pmapi.pmUsageErr
-
-        if 'dm' in IostatOptions.xflag:
-            subtree = 'disk.dm'
-        else:
-            subtree = 'disk.dev'
-        group = manager["iostat"]
-
-        if group[subtree + '.read_merge'].netPrevValues is None:
-            # need two fetches to report rate converted counter metrics
-            return
-
-        instlist = self.instlist(group, subtree + '.read')
-        dt = self.timeStampDelta(group)
-        timestamp = group.contextCache.pmCtime(int(group.timestamp)).rstrip()
-
-        c_rrqm = self.curVals(group, subtree + '.read_merge')
-        p_rrqm = self.prevVals(group, subtree + '.read_merge')
-
-        c_wrqm = self.curVals(group, subtree + '.write_merge')
-        p_wrqm = self.prevVals(group, subtree + '.write_merge')
-
-        c_r = self.curVals(group, subtree + '.read')
-        p_r = self.prevVals(group, subtree + '.read')
-
-        c_w = self.curVals(group, subtree + '.write')
-        p_w = self.prevVals(group, subtree + '.write')
-
-        c_rkb = self.curVals(group, subtree + '.read_bytes')
-        p_rkb = self.prevVals(group, subtree + '.read_bytes')
-
-        c_wkb = self.curVals(group, subtree + '.write_bytes')
-        p_wkb = self.prevVals(group, subtree + '.write_bytes')
-
-        c_ractive = self.curVals(group, subtree + '.read_rawactive')
-        p_ractive = self.prevVals(group, subtree + '.read_rawactive')
-
-        c_wactive = self.curVals(group, subtree + '.write_rawactive')
-        p_wactive = self.prevVals(group, subtree + '.write_rawactive')
-
-        c_avactive = self.curVals(group, subtree + '.avactive')
-        p_avactive = self.prevVals(group, subtree + '.avactive')
-
+    @staticmethod
+    def column(values, devices):
+        """ Metric values along the device axis, NaN where missing """
+        if len(values) == len(devices) and list(map(itemgetter(1), values)) == devices:
+            return list(map(itemgetter(2), values))
+        nan = float('nan')
+        values = dict((x[1], x[2]) for x in values)
+        return [values.get(device, nan) for device in devices]
+
+    def counters(self, group, subtree, devices):
+        """
+        Current and previous values of the counter metrics as matrices
+        of (counters x devices), or None when some metric has no
+        previous values at all
+        """
+        current = []
+        previous = []
+        for counter in IOSTAT_COUNTERS:
+            metric = group[subtree + counter]
+            prevValues = metric.netPrevValues
+            if not prevValues:
+                return None
+            current.append(self.column(metric.netValues, devices))
+            previous.append(self.column(prevValues, devices))
+        return current, previous
+
+    def deviceAxis(self, devices, regex):
+        """
+        Sort order and -R filter mask for devices (in fetch order),
+        cached while the set of devices is unchanged
+        """
+        if devices != self.devices:
+            if self.regex is None:
+                self.regex = re.compile(regex)
+            matches = self.matches
+            for device in devices:
+                if device not in matches:
+                    matches[device] = self.regex.search(device) is not None
+            self.order = sorted(range(len(devices)), key=devices.__getitem__)
+            self.names = [devices[i] for i in self.order]
+            self.mask = [matches[device] for device in self.names]
+            self.devices = devices
+        return self.order, self.names, self.mask
+
+    def setLayout(self, precision):
+        """ Prepare the report formats for a given precision """
         if precision == 1:
             utilspace=precision+5
             avgrqszspace=precision+7
@@ -150,227 +232,149 @@ class IostatReport(pmcc.MetricGroupPrinter):
             headfmtavgspace=avgrqszspace
             headfmtquspace=precision+6
 
+        headings = [rrqmspace, wrqmspace, precision+5, precision+4,
+                    precision+6, precision+6, avgrqszspace, precision+6,
+                    precision+5, precision+5, precision+5, utilspace]
+        unknowns = [rrqmspace, wrqmspace, precision+5, precision+4,
+                    precision+6, precision+6, headfmtavgspace, headfmtquspace,
+                    precision+5, awaitspace, awaitspace, utilspace]
+        widths = [rrqmspace, wrqmspace, precision+5, precision+4,
+                  precision+6, precision+6, avgrqszspace, avgrqszspace,
+                  precision+5, awaitspace, awaitspace, utilspace]
+        # avgrq-sz and avgqu-sz are reported with an extra decimal place
+        self.digits = [precision] * 6 + [precision+1] * 2 + [precision] * 4
+
         if "t" in IostatOptions.xflag:
-            headfmt = "%-24s %-12s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s"
-            valfmt = "%-24s %-12s %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f"
+            prefix = "%-24s %-12s"
         else:
-            headfmt = "%-12s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s"
-            valfmt = "%-12s %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f %*.*f"
-
-        if "h" not in IostatOptions.xflag:
+            prefix = "%-12s"
+        self.headfmt = prefix + "".join(" %%%ds" % w for w in headings)
+        self.unknownfmt = prefix + "".join(" %%%ds" % w for w in unknowns)
+        self.valfmt = prefix + "".join(" %%%d.%df" % (w, d)
+                                       for w, d in zip(widths, self.digits))
+
+    def printHeading(self, timestamp):
+        if "h" in IostatOptions.xflag:
+            return
+        if IostatOptions.oflag == 'csv':
+            if self.Hcount == 0:
+                self.writer.writerow(['Timestamp', 'Device'] + IOSTAT_COLUMNS)
+                self.Hcount = 1
+        elif IostatOptions.oflag == 'text':
             self.Hcount += 1
             if self.Hcount == 24:
                 self.Hcount = 1
             if self.Hcount == 1:
                 if "t" in IostatOptions.xflag:
-                    heading = ('# Timestamp', 'Device',rrqmspace)
+                    heading = ('# Timestamp', 'Device')
+                else:
+                    heading = ('# Device',)
+                print(self.headfmt % (heading + tuple(IOSTAT_COLUMNS)))
+
+    def printNoData(self, timestamp):
+        # no values for some metric (e.g. near start of archive)
+        if IostatOptions.oflag == 'csv':
+            self.writer.writerow([timestamp, 'NODATA'] + [''] * len(IOSTAT_COLUMNS))
+        elif IostatOptions.oflag == 'json':
+            print(json.dumps({'timestamp': timestamp, 'devices': None}))
+        elif "t" in IostatOptions.xflag:
+            print(self.unknownfmt % ((timestamp, 'NODATA') + ('?',) * len(IOSTAT_COLUMNS)))
+
+    def printValues(self, timestamp, results):
+        """ Report (device, values) pairs - values are None if invalid """
+        digits = self.digits
+        if IostatOptions.oflag == 'csv':
+            unknown = [''] * len(IOSTAT_COLUMNS)
+            self.writer.writerows([timestamp, device] +
+                                  (["%.*f" % (d, v) for v, d in zip(values, digits)]
+                                   if values is not None else unknown)
+                                  for device, values in results)
+        elif IostatOptions.oflag == 'json':
+            devices = []
+            for device, values in results:
+                if values is None:
+                    values = [None] * len(IOSTAT_COLUMNS)
                 else:
-                    heading = ('# Device',rrqmspace)
-                heading = heading + tuple(
-                           ['rrqm/s',wrqmspace, 'wrqm/s',precision+5,
-                           'r/s',precision+4, 'w/s',precision+6,
-                           'rkB/s',precision+6, 'wkB/s',
-                           avgrqszspace,'avgrq-sz',precision+6,
-                           'avgqu-sz',precision+5, 'await',precision+5,
-                           'r_await', precision+5,'w_await',utilspace, '%util'])
-                print(headfmt % heading)
-
-        if p_rrqm == {} or p_wrqm == {} or p_r == {} or p_w == {} or \
-           p_ractive == {} or p_wactive == {} or p_avactive == {} or \
-           p_rkb == {} or p_wkb == {}:
-            # no values for some metric (e.g. near start of archive)
+                    values = [round(v, d) for v, d in zip(values, digits)]
+                entry = {'device': device}
+                entry.update(zip(IOSTAT_COLUMNS, values))
+                devices.append(entry)
+            print(json.dumps({'timestamp': timestamp, 'devices': devices}))
+        elif results:
             if "t" in IostatOptions.xflag:
-                headfmt = "%-24s %-12s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s %*s"
-                print(headfmt % (timestamp, 'NODATA',
-                    rrqmspace, '?', rrqmspace, '?',
-                    precision+5, '?', precision+4, '?',
-                    precision+6, '?', precision+6, '?',
-                    headfmtavgspace, '?', headfmtquspace, '?',
-                    precision+5, '?', awaitspace, '?',
-                    awaitspace,'?', utilspace, '?'))
-            return
-
-        try:
-            if IostatOptions.Gflag:
-                aggr_rrqm = aggr_wrqm = aggr_r = aggr_w = aggr_rkb = aggr_wkb = aggr_avgrqsz = 0.0
-                aggr_avgqsz = aggr_await = aggr_r_await = aggr_w_await = aggr_util = 0.0
-                aggr_count = 0
+                prefix = (timestamp,)
+            else:
+                prefix = ()
+            unknown = ('?',) * len(IOSTAT_COLUMNS)
+            print("\n".join(self.valfmt % (prefix + (device,) + tuple(values))
+                            if values is not None else
+                            self.unknownfmt % (prefix + (device,) + unknown)
+                            for device, values in results))
 
-            for inst in sorted(instlist):
-                # basic stats
-                rrqm = (c_rrqm[inst] - p_rrqm[inst]) / dt
-                wrqm = (c_wrqm[inst] - p_wrqm[inst]) / dt
-                r = (c_r[inst] - p_r[inst]) / dt
-                w = (c_w[inst] - p_w[inst]) / dt
-                rkb = (c_rkb[inst] - p_rkb[inst]) / dt
-                wkb = (c_wkb[inst] - p_wkb[inst]) / dt
-
-                # totals
-                tot_rios = (float)(c_r[inst] - p_r[inst])
-                tot_wios = (float)(c_w[inst] - p_w[inst])
-                tot_ios = (float)(tot_rios + tot_wios)
-
-                # total active time in seconds (same units as dt)
-                tot_active = (float)(c_avactive[inst] - p_avactive[inst]) / 1000.0
-
-                avgrqsz = t_await = r_await = w_await = util = 0.0
+    def report(self, manager):
+        regex = IostatOptions.Rflag
+        if regex == '':
+            regex = '.*'
 
-                # average request size units are KB (sysstat reports in units of sectors)
-                if tot_ios:
-                    avgrqsz = (float)((c_rkb[inst] - p_rkb[inst]) + (c_wkb[inst] - p_wkb[inst])) / tot_ios
+        aggr = IostatOptions.Gflag
+        if aggr and aggr not in IOSTAT_AGGREGATES:
+            print("Error, -G aggregation method must be one of 'sum', 'avg', 'min' or 'max'")
+            raise pmapi.pmUsageErr
 
-                # average queue length
-                avgqsz = (float)((c_ractive[inst] - p_ractive[inst]) +
-                                 (c_wactive[inst] - p_wactive[inst])) / dt / 1000.0
+        precision = IostatOptions.Pflag
+        if precision < 0 or precision > 10 :
+            print("Precision value must be between 0 and 10")
+            raise pmapi.pmUsageErr
 
-                # await, r_await, w_await
-                if tot_ios:
-                    t_await = ((c_ractive[inst] - p_ractive[inst]) + (c_wactive[inst] - p_wactive[inst])) / tot_ios
+        if 'dm' in IostatOptions.xflag:
+            subtree = 'disk.dm'
+        else:
+            subtree = 'disk.dev'
+        group = manager["iostat"]
 
-                if tot_rios:
-                    r_await = (c_ractive[inst] - p_ractive[inst]) / tot_rios
+        if group[subtree + '.read_merge'].netPrevValues is None:
+            # need two fetches to report rate converted counter metrics
+            return
 
-                if tot_wios:
-                    w_await = (c_wactive[inst] - p_wactive[inst]) / tot_wios
+        if self.valfmt is None:
+            self.setLayout(precision)
+            if IostatOptions.oflag == 'csv':
+                self.writer = csv.writer(sys.stdout, lineterminator='\n')
 
-                # device utilization (percentage of active time / interval)
-                if tot_active:
-                    util = 100.0 * tot_active / dt
+        devices = list(map(itemgetter(1), group[subtree + '.read'].netValues))
+        dt = self.timeStampDelta(group)
+        timestamp = group.contextCache.pmCtime(int(group.timestamp)).rstrip()
 
-                device = inst	# prepare name for printing
-                badcounters = (rrqm < 0 or wrqm < 0 or r < 0 or w < 0 or
-                               t_await < 0 or avgrqsz < 0 or avgqsz < 0 or util < 0)
+        self.printHeading(timestamp)
 
-                if "t" in IostatOptions.xflag:
-                    if badcounters:
-                        print(headfmt % (timestamp, device,rrqmspace,
-                                         '?',wrqmspace, '?',precision+5,
-                                         '?',precision+4, '?',precision+6,
-                                         '?',precision+6, '?',headfmtavgspace,
-                                         '?',headfmtquspace, '?', precision+5,
-                                         '?',awaitspace, '?', awaitspace,
-                                         '?',utilspace, '?'))
-                    else:
-                        if IostatOptions.Rflag and re.search(regex,device) is None:
-                            continue
-
-                        if IostatOptions.Gflag:
-                            aggr_count += 1
-
-                        if "noidle" in IostatOptions.xflag:
-                            if rrqm == 0 and wrqm == 0 and r == 0 and w == 0:
-                                continue
-
-                        if not IostatOptions.Gflag:
-                            print(valfmt % (timestamp, device,rrqmspace,precision,
-                                            rrqm,wrqmspace,precision,
-                                            wrqm,precision+5,precision,
-                                            r,precision+4,precision,
-                                            w,precision+6,precision,
-                                            rkb,precision+6,precision,
-                                            wkb,avgrqszspace,precision+1,
-                                            avgrqsz,avgrqszspace,precision+1,
-                                            avgqsz,precision+5,precision,
-                                            t_await,awaitspace,precision,
-                                            r_await,awaitspace,precision,
-                                            w_await,utilspace,precision, util))
-                else:
-                    if badcounters:
-                        print(headfmt % (device,rrqmspace, '?',wrqmspace,
-                                         '?',precision+5, '?',precision+4,
-                                         '?',precision+6, '?',precision+6,
-                                         '?',headfmtavgspace,
-                                         '?',headfmtquspace,
-                                         '?',precision+5, '?',awaitspace,
-                                         '?',awaitspace, '?',utilspace, '?'))
-                    else:
-                        if IostatOptions.Rflag and re.search(regex,device) is None:
-                            continue
-
-                        if IostatOptions.Gflag:
-                            aggr_count += 1
-
-                        if "noidle" in IostatOptions.xflag:
-                            if rrqm == 0 and wrqm == 0 and r == 0 and w == 0:
-                                continue
-
-                        if not IostatOptions.Gflag:
-                            print(valfmt % (device,rrqmspace, precision,
-                                            rrqm,wrqmspace,precision,
-                                            wrqm,precision+5,precision,
-                                            r,precision+4,precision,
-                                            w,precision+6,precision,
-                                            rkb,precision+6,precision,
-                                            wkb,avgrqszspace,precision+1,
-                                            avgrqsz,avgrqszspace,precision+1,
-                                            avgqsz,precision+5,precision,
-                                            t_await,awaitspace,precision,
-                                            r_await,awaitspace,precision,
-                                            w_await,utilspace,precision, util))
-
-                if IostatOptions.Gflag and not badcounters:
-                    aggr_rrqm = aggregate(aggr, aggr_rrqm, rrqm)
-                    aggr_wrqm = aggregate(aggr, aggr_wrqm, wrqm)
-                    aggr_r = aggregate(aggr, aggr_r, r)
-                    aggr_w = aggregate(aggr, aggr_w, w)
-                    aggr_rkb = aggregate(aggr, aggr_rkb, rkb)
-                    aggr_wkb = aggregate(aggr, aggr_wkb, wkb)
-                    aggr_avgrqsz = aggregate(aggr, aggr_avgrqsz, avgrqsz)
-                    aggr_avgqsz = aggregate(aggr, aggr_avgqsz, avgqsz)
-                    aggr_await = aggregate(aggr, aggr_await, t_await)
-                    aggr_r_await = aggregate(aggr, aggr_r_await, r_await)
-                    aggr_w_await = aggregate(aggr, aggr_w_await, w_await)
-                    aggr_util = aggregate(aggr, aggr_util, util)
-            # end of loop
-
-            if IostatOptions.Gflag:
-                if IostatOptions.Gflag == 'avg' and aggr_count > 0:
-                    aggr_rrqm /= aggr_count
-                    aggr_wrqm /= aggr_count
-                    aggr_r /= aggr_count
-                    aggr_w /= aggr_count
-                    aggr_rkb /= aggr_count
-                    aggr_wkb /= aggr_count
-                    aggr_avgrqsz /= aggr_count
-                    aggr_avgqsz /= aggr_count
-                    aggr_await /= aggr_count
-                    aggr_r_await /= aggr_count
-                    aggr_w_await /= aggr_count
-                    aggr_util /= aggr_count
-
-
-                # report aggregate values - the 'device' here is reported as the regex used for the aggregation
-                device = '%s(%s)' % (aggr, regex)
-                if "t" in IostatOptions.xflag:
-                    print(valfmt % (timestamp, device,rrqmspace, precision,
-                                    aggr_rrqm,wrqmspace,precision,
-                                    aggr_wrqm,precision+5,precision,
-                                    aggr_r,precision+4,precision,
-                                    aggr_w,precision+6,precision,
-                                    aggr_rkb,precision+6,precision,
-                                    aggr_wkb,avgrqszspace,precision+1,
-                                    aggr_avgrqsz,avgrqszspace,precision+1,
-                                    aggr_avgqsz,precision+5,precision,
-                                    aggr_await,awaitspace,precision,
-                                    aggr_r_await,awaitspace,precision,
-                                    aggr_w_await,utilspace,precision, aggr_util))
-                else:
-                    print(valfmt % (device,rrqmspace, precision,
-                                    aggr_rrqm,wrqmspace,precision,
-                                    aggr_wrqm,precision+5,precision,
-                                    aggr_r,precision+4,precision,
-                                    aggr_w,precision+6,precision,
-                                    aggr_rkb,precision+6,precision,
-                                    aggr_wkb,avgrqszspace,precision+1,
-                                    aggr_avgrqsz,avgrqszspace,precision+1,
-                                    aggr_avgqsz,precision+5,precision,
-                                    aggr_await,awaitspace,precision,
-                                    aggr_r_await,awaitspace,precision,
-                                    aggr_w_await,utilspace,precision, aggr_util))
-
-        except KeyError:
-            # instance missing from previous sample
-            pass
+        counters = self.counters(group, subtree, devices)
+        if counters is None:
+            self.printNoData(timestamp)
+            return
+        if not all(group[subtree + counter].netValues for counter in IOSTAT_COUNTERS):
+            # no current values for some metric (e.g. with -u when
+            # metrics were logged at different intervals)
+            return
+        order, devices, mask = self.deviceAxis(devices, regex)
+        stats = DeviceStats(counters[0], counters[1], dt, order)
+        noidle = "noidle" in IostatOptions.xflag
+
+        # invalid devices are always reported, with unknown values;
+        # valid ones only when matching -R and not being aggregated
+        results = []
+        for device, values, invalid, match in zip(devices, stats.rows(),
+                                                  stats.invalid, mask):
+            if invalid:
+                results.append((device, None))
+            elif match and not aggr and not (noidle and not any(values[:4])):
+                results.append((device, values))
+
+        if aggr:
+            # report aggregate values - the 'device' here is reported as the regex used for the aggregation
+            selected = [match and not invalid for match, invalid in zip(mask, stats.invalid)]
+            results.append(('%s(%s)' % (aggr, regex), stats.aggregate(aggr, selected)))
+
+        self.printValues(timestamp, results)
 
 class IostatOptions(pmapi.pmOptions):
     # class attributes
@@ -379,7 +383,12 @@ class IostatOptions(pmapi.pmOptions):
     Pflag = 2
     Rflag = ""
     Gflag = ""
+    oflag = "text"
+    statsflag = False
     def checkOptions(self, manager):
+        if IostatOptions.oflag not in IOSTAT_OUTPUTS:
+            print("Error, -o output format must be one of 'text', 'csv' or 'json'")
+            return False
         if IostatOptions.uflag:
             if manager._options.pmGetOptionInterval():
                 print("Error: -t incompatible with -u")
@@ -400,9 +409,13 @@ class IostatOptions(pmapi.pmOptions):
             IostatOptions.Rflag = optarg
         elif opt == "G":
             IostatOptions.Gflag = optarg
+        elif opt == "o":
+            IostatOptions.oflag = optarg
+        elif opt == "stats":
+            IostatOptions.statsflag = True
 
     def __init__(self):
-        pmapi.pmOptions.__init__(self, "A:a:D:G:h:O:P:R:S:s:T:t:uVZ:z?x:")
+        pmapi.pmOptions.__init__(self, "A:a:D:G:h:O:o:P:R:S:s:T:t:uVZ:z?x:")
         self.pmSetOptionCallback(self.extraOptions)
         self.pmSetLongOptionHeader("General options")
         self.pmSetLongOptionAlign()
@@ -413,11 +426,14 @@ class IostatOptions(pmapi.pmOptions):
                              "using 'method' (sum, avg, min or max)")
         self.pmSetLongOptionHost()
         self.pmSetLongOptionOrigin()
+        self.pmSetLongOption("output", 1, "o", "FORMAT",
+                             "report format: text (default), csv or json")
         self.pmSetLongOption("precision", 1, "P", "N", "N digits after the decimal separator")
         self.pmSetLongOption("regex", 1, "R", "pattern",
                              "only report for devices names matching pattern, "
                              "e.g. 'sd[a-zA-Z]+'. See also -G.")
         self.pmSetLongOptionStart()
+        self.pmSetLongOption("stats", 0, "", "", "report sampling overruns and timing on exit")
         self.pmSetLongOptionSamples()
         self.pmSetLongOptionFinish()
         self.pmSetLongOptionInterval()
@@ -454,6 +470,7 @@ if __name__ == '__main__':
             sys.exit(1)
         manager["iostat"] = namelist
         manager.printer = IostatReport()
+        manager.stats = IostatOptions.statsflag
         sts = manager.run()
         sys.exit(sts)
     except pmapi.pmErr as error:
@@ -16,10 +16,15 @@
 # pylint: disable=redefined-outer-name,unnecessary-lambda
 #
 import signal
+from array import array
 from pcp import pmapi
 from pcp import pmcc
 import sys
 import time
+try:
+    import numpy
+except ImportError:
+    numpy = None
 MPSTAT_METRICS = ['kernel.uname.nodename', 'kernel.uname.release', 'kernel.uname.sysname',
                   'kernel.uname.machine', 'hinv.map.cpu_num', 'hinv.ncpu', 'hinv.cpu.online',
                   'kernel.all.cpu.user',
@@ -366,47 +371,79 @@ class InterruptUsage:
         else:
             return None
 
+def format_rate(value):
+    """ Format an interrupt rate for printing, NaN (unknown) as None """
+    if value != value:
+        return None
+    return round(value, 2)
+
 class CpuInterrupts:
-    def __init__(self, metric_repository, cpu_number, interrupts):
+    def __init__(self, metric_repository, cpu_number, names, rates):
         self.metric_repository = metric_repository
         self.cpu_num = cpu_number
-        self.interrupts = interrupts
+        self.interrupt_names = names
+        self.rates = rates
     def cpu_number(self):
         return self.cpu_num
     def cpu_online(self):
         return self.metric_repository.current_value('hinv.cpu.online', self.cpu_num)
-
-class HardInterruptUsage:
+    def names(self):
+        return self.interrupt_names
+    def values(self):
+        return self.rates
+
+class InterruptMatrix:
+    """
+    Per-CPU rates of a set of interrupt metrics, computed once per
+    interval as a (cpus x interrupts) matrix - a NumPy array when
+    available, otherwise one array of doubles per CPU.  Missing
+    values are NaN, and rounding is left to print time.
+    """
     def __init__(self, delta_time, metric_repository, interrupt_metrics):
         self.delta_time = delta_time
         self.metric_repository = metric_repository
         self.interrupt_metrics = interrupt_metrics
 
-    def get_percpu_interrupts(self):
-        return list(map((lambda cpuid: CpuInterrupts(self.metric_repository, cpuid, self.__get_all_interrupts_for_cpu(cpuid))), self.__cpus()))
-
-    def __cpus(self):
+    def cpus(self):
         cpu_dict = self.metric_repository.current_values('hinv.map.cpu_num')
         return sorted(cpu_dict.values())
 
-    def __get_all_interrupts_for_cpu(self, cpuid):
-        return list(map((lambda metric: InterruptUsage(self.delta_time, self.metric_repository, metric, cpuid)), self.interrupt_metrics))
-
-class SoftInterruptUsage:
-    def __init__(self, delta_time, metric_repository, interrupt_metrics):
-        self.delta_time = delta_time
-        self.metric_repository = metric_repository
-        self.interrupt_metrics = interrupt_metrics
+    def names(self):
+        return [InterruptUsage(self.delta_time, self.metric_repository, metric, None).name()
+                for metric in self.interrupt_metrics]
+
+    def __columns(self, values, cpus):
+        nan = float('nan')
+        columns = []
+        for metric in self.interrupt_metrics:
+            instances = values(metric) or {}
+            columns.append([instances.get(cpu, nan) for cpu in cpus])
+        return columns
+
+    def rates(self, cpus):
+        current = self.__columns(self.metric_repository.current_values, cpus)
+        previous = self.__columns(self.metric_repository.previous_values, cpus)
+        if numpy is not None:
+            shape = (len(self.interrupt_metrics), len(cpus))
+            current = numpy.array(current, dtype=float).reshape(shape)
+            previous = numpy.array(previous, dtype=float).reshape(shape)
+            return ((current - previous) / self.delta_time).T.tolist()
+        delta_time = self.delta_time
+        return [array('d', [(c[i] - p[i]) / delta_time for c, p in zip(current, previous)])
+                for i in range(len(cpus))]
 
     def get_percpu_interrupts(self):
-        return list(map((lambda cpuid: CpuInterrupts(self.metric_repository, cpuid, self.__get_all_interrupts_for_cpu(cpuid))), self.__cpus()))
+        cpus = self.cpus()
+        names = self.names()
+        rates = self.rates(cpus)
+        return [CpuInterrupts(self.metric_repository, cpu, names, rates[i])
+                for i, cpu in enumerate(cpus)]
 
-    def __cpus(self):
-        cpu_dict = self.metric_repository.current_values('hinv.map.cpu_num')
-        return sorted(cpu_dict.values())
+class HardInterruptUsage(InterruptMatrix):
+    pass
 
-    def __get_all_interrupts_for_cpu(self, cpuid):
-        return list(map((lambda metric: InterruptUsage(self.delta_time, self.metric_repository, metric, cpuid)), self.interrupt_metrics))
+class SoftInterruptUsage(InterruptMatrix):
+    pass
 
 
 class CpuFilter:
@@ -495,9 +532,9 @@ class InterruptUsageReporter:
         format_str = "%-10s\t%-4s\t"
 
         # use the first CPU in cpu_interrupts to get the interrupt names
-        for interrupt in cpu_interrupts[0].interrupts:
-            format_str += "%-"+str(len(interrupt.name())+2)+"s\t"
-            header_values += (interrupt.name() + "/s",)
+        for name in cpu_interrupts[0].names():
+            format_str += "%-"+str(len(name)+2)+"s\t"
+            header_values += (name + "/s",)
         if self.print_header:
             self.printer(format_str % header_values)
             self.print_header = False
@@ -506,7 +543,7 @@ class InterruptUsageReporter:
 
         cpu_interrupts_list = self.cpu_filter.filter_cpus(cpu_interrupts)
         for cpu_interrupt in cpu_interrupts_list:
-            values = (timestamp, cpu_interrupt.cpu_number()) + tuple(map((lambda interrupt: interrupt.value()), cpu_interrupt.interrupts))
+            values = (timestamp, cpu_interrupt.cpu_number()) + tuple(map(format_rate, cpu_interrupt.values()))
             self.printer(format_str % values)
 
 class NoneHandlingPrinterDecorator:
@@ -22,6 +22,7 @@ class TestHardInterruptUsage(unittest.TestCase):
     def setUp(self):
         self.metric_repository = Mock()
         self.metric_repository.current_values = Mock(side_effect = self.current_value_side_effect)
+        self.metric_repository.previous_values = Mock(return_value = None)
         self.interrupt_metric = ['kernel.percpu.interrupts.PIW','kernel.percpu.interrupts.PIN','kernel.percpu.interrupts.MIS']
 
     def current_value_side_effect(self, metric):
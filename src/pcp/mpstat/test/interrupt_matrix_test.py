@@ -0,0 +1,66 @@
+#!/usr/bin/env pmpython
+#
+# Copyright (c) 2026 Red Hat.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+
+import sys
+import unittest
+from unittest.mock import Mock
+from pcp_mpstat import InterruptMatrix
+
+class TestInterruptMatrix(unittest.TestCase):
+    def setUp(self):
+        self.metric_repository = Mock()
+        self.metric_repository.current_values = Mock(side_effect = self.current_values_side_effect)
+        self.metric_repository.previous_values = Mock(side_effect = self.previous_values_side_effect)
+        self.interrupt_metrics = ['kernel.percpu.interrupts.line12', 'kernel.percpu.interrupts.PIW']
+
+    def current_values_side_effect(self, metric):
+        if metric == 'hinv.map.cpu_num':
+            return {'cpu1':1, 'cpu0':0}
+        if metric == 'kernel.percpu.interrupts.line12':
+            return {0:1234, 1:2000}
+        if metric == 'kernel.percpu.interrupts.PIW':
+            return {0:2345}
+        return None
+
+    def previous_values_side_effect(self, metric):
+        if metric == 'kernel.percpu.interrupts.line12':
+            return {0:1232, 1:1000}
+        if metric == 'kernel.percpu.interrupts.PIW':
+            return {0:2341, 1:10}
+        return None
+
+    def test_names(self):
+        interrupt_matrix = InterruptMatrix(2.0, self.metric_repository, self.interrupt_metrics)
+
+        self.assertEqual(interrupt_matrix.names(), ['12', 'PIW'])
+
+    def test_get_percpu_interrupts(self):
+        interrupt_matrix = InterruptMatrix(2.0, self.metric_repository, self.interrupt_metrics)
+
+        percpu_interrupts = interrupt_matrix.get_percpu_interrupts()
+
+        self.assertEqual([cpu.cpu_number() for cpu in percpu_interrupts], [0, 1])
+        self.assertEqual(list(percpu_interrupts[0].values()), [1.0, 2.0])
+        self.assertEqual(percpu_interrupts[1].values()[0], 500.0)
+
+    def test_missing_value_is_nan(self):
+        interrupt_matrix = InterruptMatrix(2.0, self.metric_repository, self.interrupt_metrics)
+
+        value = interrupt_matrix.get_percpu_interrupts()[1].values()[1]
+
+        self.assertNotEqual(value, value)
+
+if __name__ == "__main__":
+    unittest.main()
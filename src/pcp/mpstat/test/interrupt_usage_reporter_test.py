@@ -21,20 +21,16 @@ from pcp_mpstat import InterruptUsageReporter
 
 class TestHardInterruptUsageReporter(unittest.TestCase):
     def setUp(self):
-        interrupts = [ Mock(), Mock()]
-        interrupts[0].configure_mock(
-                            name = Mock(return_value = 'SOME_INTERRUPT'),
-                            value = Mock(return_value = 1.23))
-        interrupts[1].configure_mock(
-                            name = Mock(return_value = 'ANOTHER_INTERRUPT'),
-                            value = Mock(return_value = 2.34))
+        names = Mock(return_value = ['SOME_INTERRUPT', 'ANOTHER_INTERRUPT'])
         self.cpu_interrupt_zero = Mock(
                                 cpu_number = Mock(return_value = 0) ,
-                                interrupts = interrupts
+                                names = names,
+                                values = Mock(return_value = [1.2345, 2.34])
                                 )
         self.cpu_interrupt_one = Mock(
                                 cpu_number = Mock(return_value = 1),
-                                interrupts = interrupts
+                                names = names,
+                                values = Mock(return_value = [1.23, float('nan')])
                                 )
     def test_print_report(self):
         interrupt_usage = Mock()
@@ -68,6 +64,23 @@ class TestHardInterruptUsageReporter(unittest.TestCase):
 
         report.print_report(interrupt_usage, timestamp)
 
+        printer.assert_has_calls(calls, any_order = False)
+
+    def test_print_report_with_unknown_value(self):
+        interrupt_usage = Mock()
+        printer = Mock()
+        options = Mock()
+        cpu_interrupts = [self.cpu_interrupt_one]
+        interrupt_usage.get_percpu_interrupts = Mock(return_value = cpu_interrupts)
+        cpu_filter = Mock()
+        cpu_filter.filter_cpus = Mock(return_value = cpu_interrupts)
+        report = InterruptUsageReporter(cpu_filter, printer, options)
+        timestamp = '2016-7-18 IST'
+        calls = [call('\nTimestamp\tCPU \tSOME_INTERRUPT/s\tANOTHER_INTERRUPT/s\t'),
+                call('2016-7-18 IST\t1   \t1.23            \tNone               \t')]
+
+        report.print_report(interrupt_usage, timestamp)
+
         printer.assert_has_calls(calls, any_order = False)
 if __name__ == '__main__':
     unittest.main()
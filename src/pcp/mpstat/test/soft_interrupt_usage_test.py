@@ -22,6 +22,7 @@ class TestSoftInterruptUsage(unittest.TestCase):
     def setUp(self):
         self.metric_repository = Mock()
         self.metric_repository.current_values = Mock(side_effect = self.current_value_side_effect)
+        self.metric_repository.previous_values = Mock(return_value = None)
         self.interrupt_metric = ['kernel.percpu.softirqs.RCU','kernel.percpu.softirqs.HRTIMER','kernel.percpu.softirqs.SCHED']
 
     def current_value_side_effect(self, metric):
@@ -1,6 +1,6 @@
 #!/usr/bin/env pmpython
 #
-# Copyright (C) 2020 Red Hat.
+# Copyright (C) 2020,2026 Red Hat.
 # Copyright (C) 2017 Alperen Karaoglu.
 # Copyright (C) 2016 Sitaram Shelke.
 #
@@ -26,6 +26,9 @@ import time
 import signal
 from pcp import pmcc
 from pcp import pmapi
+from pcp.proctable import ReportingMetricRepository, ProcessTable
+from pcp.proctable import MetricHistory
+from pcp.proctable import percent, rate, share
 
 process_state_info = {}
 # Metric list to be fetched
@@ -75,351 +78,156 @@ PIDSTAT_METRICS_L = PIDSTAT_METRICS_B + [
 
 SCHED_POLICY = ['NORMAL','FIFO','RR','BATCH','','IDLE','DEADLINE']
 
+# Columns of the process table, named after the row accessors used by
+# the reporters
+PIDSTAT_COLUMNS = {
+    'pid': 'proc.psinfo.pid',
+    'user_id': 'proc.id.uid',
+    'user_name': 'proc.id.uid_nm',
+    'process_name': 'proc.psinfo.cmd',
+    'process_name_with_args': 'proc.psinfo.psargs',
+    'cpu_number': 'proc.psinfo.processor',
+    'user_percent': lambda table: table.percents('proc.psinfo.utime'),
+    'guest_percent': lambda table: table.percents('proc.psinfo.guest_time'),
+    'system_percent': lambda table: table.percents('proc.psinfo.stime'),
+    'total_percent': lambda table: table.totals('user_percent', 'guest_percent', 'system_percent'),
+    'priority': 'proc.psinfo.rt_priority',
+    'policy_int': 'proc.psinfo.policy',
+    'policy': lambda table: [None if policy is None else SCHED_POLICY[policy]
+                             for policy in table.column('policy_int')],
+    'minflt': lambda table: table.rates('proc.psinfo.minflt'),
+    'majflt': lambda table: table.rates('proc.psinfo.maj_flt'),
+    'vsize': 'proc.psinfo.vsize',
+    'rss': 'proc.psinfo.rss',
+    'mem': lambda table: table.shares('proc.psinfo.rss', table.value('mem.physmem')),
+    'stack_size': 'proc.memory.vmstack',
+    's_name': 'proc.psinfo.sname',
+    'start_time': 'proc.psinfo.start_time',
+    'wchan_s': 'proc.psinfo.wchan_s',
+    'utime': lambda table: table.deltas('proc.psinfo.utime', '?'),
+    'stime': lambda table: table.deltas('proc.psinfo.stime', '?'),
+}
+
+def cpu_times(metric_repository):
+    """ Total user, system and guest time of each process """
+    times = [metric_repository.current_values(metric) or {}
+             for metric in ('proc.psinfo.utime', 'proc.psinfo.stime', 'proc.psinfo.guest_time')]
+    return dict((inst, sum(values[inst] for values in times))
+                for inst in times[0] if all(inst in values for values in times))
+
+def singular(metric):
+    """ History source for a singular metric, recorded as instance None """
+    return lambda metric_repository: dict((None, value) for _, _, value
+                                          in metric_repository.group[metric].netValues)
+
+# Metrics kept in the history for --window and --summary, proc metrics
+# under their own names so windowed previous values can be found
+PIDSTAT_HISTORY = dict((metric, metric) for metric in [
+    'proc.id.uid',
+    'proc.id.uid_nm',
+    'proc.memory.vmstack',
+    'proc.psinfo.cmd',
+    'proc.psinfo.guest_time',
+    'proc.psinfo.maj_flt',
+    'proc.psinfo.minflt',
+    'proc.psinfo.pid',
+    'proc.psinfo.psargs',
+    'proc.psinfo.rss',
+    'proc.psinfo.stime',
+    'proc.psinfo.utime',
+    'proc.psinfo.vsize',
+])
+PIDSTAT_HISTORY['cpu_time'] = cpu_times
+PIDSTAT_HISTORY['hinv.ncpu'] = singular('hinv.ncpu')
+PIDSTAT_HISTORY['mem.physmem'] = singular('mem.physmem')
+
+def summary_columns(peak):
+    """ Process table columns over a MetricHistory, run averages or peaks """
+    if peak:
+        rates, values = MetricHistory.peak_rates, MetricHistory.peaks
+    else:
+        rates, values = MetricHistory.average_rates, MetricHistory.averages
+    def percents(metric):
+        return lambda table: [percent(value, 0, 1)
+                              for value in rates(table.repository, metric, table.pids)]
+    def per_second(metric):
+        return lambda table: [rate(value, 0, 1)
+                              for value in rates(table.repository, metric, table.pids)]
+    def sizes(metric):
+        return lambda table: [None if value is None else int(round(value))
+                              for value in values(table.repository, metric, table.pids)]
+    columns = dict(PIDSTAT_COLUMNS)
+    columns.update({
+        'cpu_number': lambda table: ['-'] * len(table.pids),
+        'user_percent': percents('proc.psinfo.utime'),
+        'guest_percent': percents('proc.psinfo.guest_time'),
+        'system_percent': percents('proc.psinfo.stime'),
+        'total_percent': percents('cpu_time'),
+        'minflt': per_second('proc.psinfo.minflt'),
+        'majflt': per_second('proc.psinfo.maj_flt'),
+        'vsize': sizes('proc.psinfo.vsize'),
+        'rss': sizes('proc.psinfo.rss'),
+        'mem': lambda table: [share(rss, table.value('mem.physmem'))
+                              for rss in table.column('rss')],
+        'stack_size': sizes('proc.memory.vmstack'),
+    })
+    return columns
+
+PIDSTAT_AVERAGE_COLUMNS = summary_columns(False)
+PIDSTAT_PEAK_COLUMNS = summary_columns(True)
+
 class StdoutPrinter:
     def Print(self, args):
         print(args)
 
-# After fetching non singular metric values, create a mapping of instance id
-# to instance value rather than instance name to instance value.
-# The reason is, in PCP, instance names require a separate pmGetIndom() request
-# and some of the names may not be available.
-class ReportingMetricRepository:
-    def __init__(self,group):
-        self.group = group
-        self.current_cached_values = {}
-        self.previous_cached_values = {}
-    def __fetch_current_values(self,metric,instance):
-        if instance:
-            return dict(map(lambda x: (x[0].inst, x[2]), self.group[metric].netValues))
-        else:
-            return self.group[metric].netValues[0][2]
-
-    def __fetch_previous_values(self,metric,instance):
-        if instance:
-            return dict(map(lambda x: (x[0].inst, x[2]), self.group[metric].netPrevValues))
-        else:
-            return self.group[metric].netPrevValues[0][2]
-
-    def current_value(self, metric, instance):
-        if not metric in self.group:
-            return None
-        if instance:
-            if self.current_cached_values.get(metric, None) is None:
-                lst = self.__fetch_current_values(metric,instance)
-                self.current_cached_values[metric] = lst
-
-            return self.current_cached_values[metric].get(instance,None)
-        else:
-            if self.current_cached_values.get(metric, None) is None:
-                self.current_cached_values[metric] = self.__fetch_current_values(metric,instance)
-            return self.current_cached_values.get(metric, None)
-
-    def previous_value(self, metric, instance):
-        if not metric in self.group:
-            return None
-        if instance:
-            if self.previous_cached_values.get(metric, None) is None:
-                lst = self.__fetch_previous_values(metric,instance)
-                self.previous_cached_values[metric] = lst
-
-            return self.previous_cached_values[metric].get(instance,None)
-        else:
-            if self.previous_cached_values.get(metric, None) is None:
-                self.previous_cached_values[metric] = self.__fetch_previous_values(metric,instance)
-            return self.previous_cached_values.get(metric, None)
-
-    def current_values(self, metric_name):
-        if self.group.get(metric_name, None) is None:
-            return None
-        if self.current_cached_values.get(metric_name, None) is None:
-            self.current_cached_values[metric_name] = self.__fetch_current_values(metric_name,True)
-        return self.current_cached_values.get(metric_name, None)
-
-    def previous_values(self, metric_name):
-        if self.group.get(metric_name, None) is None:
-            return None
-        if self.previous_cached_values.get(metric_name, None) is None:
-            self.previous_cached_values[metric_name] = self.__fetch_previous_values(metric_name,True)
-        return self.previous_cached_values.get(metric_name, None)
-
-class ProcessCpuUsage:
-    def __init__(self, instance, delta_time, metrics_repository):
-        self.instance = instance
-        self.__delta_time = delta_time
-        self.__metric_repository = metrics_repository
-
-    def user_percent(self):
-        c_usertime = self.__metric_repository.current_value('proc.psinfo.utime', self.instance)
-        p_usertime = self.__metric_repository.previous_value('proc.psinfo.utime', self.instance)
-        if c_usertime is not None and p_usertime is not None:
-            percent_of_time =  100 * float(c_usertime - p_usertime) / float(1000 * self.__delta_time)
-            return float("%.2f"%percent_of_time)
-        else:
-            return None
-
-    def guest_percent(self):
-        c_guesttime = self.__metric_repository.current_value('proc.psinfo.guest_time', self.instance)
-        p_guesttime = self.__metric_repository.previous_value('proc.psinfo.guest_time', self.instance)
-        if  c_guesttime is not None and p_guesttime is not None:
-            percent_of_time =  100 * float(c_guesttime - p_guesttime) / float(1000 * self.__delta_time)
-            return float("%.2f"%percent_of_time)
-        else:
-            return None
-
-    def system_percent(self):
-        c_systemtime = self.__metric_repository.current_value('proc.psinfo.stime', self.instance)
-        p_systemtime = self.__metric_repository.previous_value('proc.psinfo.stime', self.instance)
-        if  c_systemtime is not None and p_systemtime is not None:
-            percent_of_time =  100 * float(c_systemtime - p_systemtime) / float(1000 * self.__delta_time)
-            return float("%.2f"%percent_of_time)
-        else:
-            return None
-
-    def total_percent(self):
-        if self.user_percent() is not None and self.guest_percent() is not None and self.system_percent() is not None:
-            return float("%.2f"%(self.user_percent()+self.guest_percent()+self.system_percent()))
-        else:
-            return None
-
-    def pid(self):
-        return self.__metric_repository.current_value('proc.psinfo.pid', self.instance)
-
-    def process_name(self):
-        return self.__metric_repository.current_value('proc.psinfo.cmd', self.instance)
-
-    def process_name_with_args(self):
-        return self.__metric_repository.current_value('proc.psinfo.psargs', self.instance)
-
-    def cpu_number(self):
-        return self.__metric_repository.current_value('proc.psinfo.processor', self.instance)
-
-    def user_id(self):
-        return self.__metric_repository.current_value('proc.id.uid', self.instance)
-
-    def user_name(self):
-        return self.__metric_repository.current_value('proc.id.uid_nm', self.instance)
-
 class CpuUsage:
     def __init__(self, metric_repository):
         self.__metric_repository = metric_repository
 
     def get_processes(self, delta_time):
-        return map(lambda pid: (ProcessCpuUsage(pid,delta_time,self.__metric_repository)), self.__pids())
-
-    def __pids(self):
-        pid_dict = self.__metric_repository.current_values('proc.psinfo.pid')
-        return sorted(pid_dict.values())
-
-
-class ProcessPriority:
-    def __init__(self, instance, metrics_repository):
-        self.instance = instance
-        self.__metric_repository = metrics_repository
-
-    def pid(self):
-        return self.__metric_repository.current_value('proc.psinfo.pid', self.instance)
-
-    def user_id(self):
-        return self.__metric_repository.current_value('proc.id.uid', self.instance)
+        return ProcessTable(self.__metric_repository, delta_time, PIDSTAT_COLUMNS).rows()
 
-    def process_name(self):
-        return self.__metric_repository.current_value('proc.psinfo.cmd', self.instance)
 
-    def process_name_with_args(self):
-        return self.__metric_repository.current_value('proc.psinfo.psargs', self.instance)
+class ProcessSummary:
+    def __init__(self, history, columns):
+        self.__history = history
+        self.__columns = columns
 
-    def priority(self):
-        return self.__metric_repository.current_value('proc.psinfo.rt_priority', self.instance)
+    def get_processes(self, delta_time=None):
+        # processes seen in two samples or more, i.e. in some interval
+        pids = self.__history.instances('proc.psinfo.pid', 2)
+        return ProcessTable(self.__history, delta_time, self.__columns, pids).rows()
 
-    def policy_int(self):
-        return self.__metric_repository.current_value('proc.psinfo.policy', self.instance)
-
-    def policy(self):
-        policy_int = self.__metric_repository.current_value('proc.psinfo.policy', self.instance)
-        if policy_int is not None:
-            return SCHED_POLICY[policy_int]
-        return None
-
-    def user_name(self):
-        return self.__metric_repository.current_value('proc.id.uid_nm', self.instance)
 
 class CpuProcessPriorities:
     def __init__(self, metric_repository):
         self.__metric_repository = metric_repository
     def get_processes(self):
-        return map((lambda pid: (ProcessPriority(pid,self.__metric_repository))), self.__pids())
-
-    def __pids(self):
-        pid_dict = self.__metric_repository.current_values('proc.psinfo.pid')
-        return sorted(pid_dict.values())
-
-class ProcessMemoryUtil:
-    def __init__(self, instance, delta_time,  metric_repository):
-        self.instance = instance
-        self.__metric_repository = metric_repository
-        self.delta_time = delta_time
-
-    def pid(self):
-        return self.__metric_repository.current_value('proc.psinfo.pid', self.instance)
-
-    def user_id(self):
-        return self.__metric_repository.current_value('proc.id.uid', self.instance)
-
-    def process_name(self):
-        return self.__metric_repository.current_value('proc.psinfo.cmd', self.instance)
-
-    def process_name_with_args(self):
-        return self.__metric_repository.current_value('proc.psinfo.psargs', self.instance)
-
-    def minflt(self):
-        c_min_flt = self.__metric_repository.current_value('proc.psinfo.minflt', self.instance)
-        p_min_flt = self.__metric_repository.previous_value('proc.psinfo.minflt', self.instance)
-        if c_min_flt is not None and p_min_flt is not None:
-            return float("%.2f" % ((c_min_flt - p_min_flt)/self.delta_time))
-        else:
-            return None
-
-    def majflt(self):
-        c_maj_flt = self.__metric_repository.current_value('proc.psinfo.maj_flt', self.instance)
-        p_maj_flt = self.__metric_repository.previous_value('proc.psinfo.maj_flt', self.instance)
-        if c_maj_flt is not None and p_maj_flt is not None:
-            return float("%.2f" % ((c_maj_flt - p_maj_flt)/self.delta_time))
-        else:
-            return None
-
-    def vsize(self):
-        return self.__metric_repository.current_value('proc.psinfo.vsize', self.instance)
-
-    def rss(self):
-        return self.__metric_repository.current_value('proc.psinfo.rss', self.instance)
-
-    def mem(self):
-        total_mem = self.__metric_repository.current_value('mem.physmem', None)
-        rss = self.__metric_repository.current_value('proc.psinfo.rss', self.instance)
-        if total_mem is not None and rss is not None:
-            return float("%.2f" % (100*float(rss)/total_mem))
-        else:
-            return None
-
-    def user_name(self):
-        return self.__metric_repository.current_value('proc.id.uid_nm', self.instance)
+        return ProcessTable(self.__metric_repository, None, PIDSTAT_COLUMNS).rows()
 
 class CpuProcessMemoryUtil:
     def __init__(self, metric_repository):
         self.__metric_repository = metric_repository
 
     def get_processes(self, delta_time):
-        return map((lambda pid: (ProcessMemoryUtil(pid, delta_time, self.__metric_repository))), self.__pids())
-
-    def __pids(self):
-        pid_dict = self.__metric_repository.current_values('proc.psinfo.pid')
-        return sorted(pid_dict.values())
-
-class ProcessStackUtil:
-    def __init__(self, instance, metric_repository):
-        self.instance = instance
-        self.__metric_repository = metric_repository
-
-    def pid(self):
-        return self.__metric_repository.current_value('proc.psinfo.pid', self.instance)
-
-    def user_id(self):
-        return self.__metric_repository.current_value('proc.id.uid', self.instance)
-
-    def process_name(self):
-        return self.__metric_repository.current_value('proc.psinfo.cmd', self.instance)
-
-    def process_name_with_args(self):
-        return self.__metric_repository.current_value('proc.psinfo.psargs', self.instance)
-
-    def stack_size(self):
-        return self.__metric_repository.current_value('proc.memory.vmstack', self.instance)
-
-    def user_name(self):
-        return self.__metric_repository.current_value('proc.id.uid_nm', self.instance)
-
+        return ProcessTable(self.__metric_repository, delta_time, PIDSTAT_COLUMNS).rows()
 
 class CpuProcessStackUtil:
     def __init__(self, metric_repository):
         self.__metric_repository = metric_repository
 
     def get_processes(self):
-        return map((lambda pid: (ProcessStackUtil(pid, self.__metric_repository))), self.__pids())
-
-    def __pids(self):
-        pid_dict = self.__metric_repository.current_values('proc.psinfo.pid')
-        return sorted(pid_dict.values())
+        return ProcessTable(self.__metric_repository, None, PIDSTAT_COLUMNS).rows()
 
 # ==============================================================================
 # process state reporting
 
-class ProcessState:
-#    def __init__(self, instance, metric_repository):
-    def __init__(self, instance, delta_time,  metric_repository):
-        self.instance = instance
-        self.__metric_repository = metric_repository
-
-    def pid(self):
-        return self.__metric_repository.current_value('proc.psinfo.pid', self.instance)
-
-    def user_id(self):
-        return self.__metric_repository.current_value('proc.id.uid', self.instance)
-
-    def process_name(self):
-        return self.__metric_repository.current_value('proc.psinfo.cmd', self.instance)
-
-    def process_name_with_args(self):
-        return self.__metric_repository.current_value('proc.psinfo.psargs', self.instance)
-
-    def s_name(self):
-        return self.__metric_repository.current_value('proc.psinfo.sname', self.instance)
-
-    def start_time(self):
-        return self.__metric_repository.current_value('proc.psinfo.start_time', self.instance)
-
-    def wchan_s(self):
-        return self.__metric_repository.current_value('proc.psinfo.wchan_s', self.instance)
-
-    def user_name(self):
-        return self.__metric_repository.current_value('proc.id.uid_nm', self.instance)
-
-    #def process_blocked(self):
-    #   return self.__metric_repository.current_value('proc.psinfo.blocked', self.instance)
-
-    def utime(self):
-        #return self.__metric_repository.current_value('proc.psinfo.utime', self.instance)
-        c_usertime = self.__metric_repository.current_value('proc.psinfo.utime', self.instance)
-        p_usertime = self.__metric_repository.previous_value('proc.psinfo.utime', self.instance)
-        # sometimes the previous_value seems to be Nonetype, not sure why
-        if p_usertime is None: # print a '?' here
-            #return c_usertime
-            return '?'
-        else:
-            return c_usertime - p_usertime
-
-    def stime(self):
-        c_systime = self.__metric_repository.current_value('proc.psinfo.stime', self.instance)
-        p_systime = self.__metric_repository.previous_value('proc.psinfo.stime', self.instance)
-        # sometimes the previous_value seems to be Nonetype, not sure why
-        if p_systime is None: # print a '?' here
-            return '?'
-        else:
-            return c_systime - p_systime
-
-
 class CpuProcessState:
     def __init__(self, metric_repository):
         self.__metric_repository = metric_repository
 
-#   def get_processes(self):
-#        return map((lambda pid: (ProcessState(pid, self.__metric_repository))), self.__pids())
     def get_processes(self, delta_time):
-#       return map(lambda pid: (ProcessState(pid,delta_time,self.__metric_repository)), self.__pids())
-        return map((lambda pid: (ProcessState(pid, delta_time, self.__metric_repository))), self.__pids())
-
-    def __pids(self):
-        pid_dict = self.__metric_repository.current_values('proc.psinfo.pid')
-        return sorted(pid_dict.values())
+        return ProcessTable(self.__metric_repository, delta_time, PIDSTAT_COLUMNS).rows()
 
 class CpuProcessStateReporter:
     def __init__(self, process_state, process_filter, delta_time, printer, pidstat_options):
@@ -561,50 +369,28 @@ class ProcessFilter:
     def __init__(self,options):
         self.options = options
 
-    def filter_processes(self, processes):
-        return filter(lambda p: self.__predicate(p), processes)
-
-    def __predicate(self, process):
-        return bool(self.__matches_process_username(process)
-                    and self.__matches_process_pid(process)
-                    and self.__matches_process_name(process)
-                    and self.__matches_process_priority(process)
-                    and self.__matches_process_memory_util(process)
-                    and self.__matches_process_stack_size(process))
-
-    def __matches_process_username(self, process):
-        if self.options.filtered_process_user is not None:
-            return self.options.filtered_process_user == process.user_name()
-        return True
-
-    def __matches_process_pid(self, process):
-        if self.options.pid_filter is not None:
-            pid = process.pid()
-            return bool(pid in self.options.pid_list)
-        return True
-
-    def __matches_process_name(self, process):
-        name = process.process_name()
-        if name is None:
-            return False # no match
-        if self.options.process_name is not None:
-            return re.search(self.options.process_name, name)
-        return True # all match
-
-    def __matches_process_priority(self, process):
-        if self.options.show_process_priority and process.priority() is not None:
-            return process.priority() > 0
-        return True
-
-    def __matches_process_memory_util(self, process):
-        if self.options.show_process_memory_util and process.vsize() is not None:
-            return process.vsize() > 0
-        return True
-
-    def __matches_process_stack_size(self, process):
-        if self.options.show_process_stack_util and process.stack_size() is not None:
-            return process.stack_size() > 0
-        return True
+    def filter_processes(self, rows):
+        # each test is applied to a whole column of the process table
+        options = self.options
+        if options.filtered_process_user is not None:
+            user = options.filtered_process_user
+            rows = rows.where('user_name', lambda name: name == user)
+        if options.pid_filter is not None:
+            pids = options.pid_list
+            pids = set(pids) if isinstance(pids, list) else set([pids])
+            rows = rows.where('pid', lambda pid: pid in pids)
+        if options.process_name is not None:
+            pattern = re.compile(options.process_name)
+            rows = rows.where('process_name', lambda name: name is not None and pattern.search(name))
+        else:
+            rows = rows.where('process_name', lambda name: name is not None)
+        if options.show_process_priority:
+            rows = rows.where('priority', lambda priority: priority is None or priority > 0)
+        if options.show_process_memory_util:
+            rows = rows.where('vsize', lambda vsize: vsize is None or vsize > 0)
+        if options.show_process_stack_util:
+            rows = rows.where('stack_size', lambda size: size is None or size > 0)
+        return rows
 
 class CpuUsageReporter:
     def __init__(self, cpu_usage, process_filter, delta_time, printer, pidstat_options):
@@ -794,6 +580,8 @@ class PidstatOptions(pmapi.pmOptions):
     pid_filter = None
     pid_list = []
     timefmt = "%H:%M:%S"
+    window = 1
+    summary = False
 
     def checkOptions(self):
         if self.show_process_priority and self.show_process_memory_util:
@@ -881,6 +669,16 @@ class PidstatOptions(pmapi.pmOptions):
             if PidstatOptions.process_name_with_args:
                 PidstatOptions.ps_args_flag=True
             PidstatOptions.process_name_with_args = True
+        elif opt == 'window':
+            try:
+                PidstatOptions.window = int(optarg)
+            except ValueError:
+                PidstatOptions.window = 0
+            if PidstatOptions.window < 1:
+                print("Invalid window: use a positive number of intervals")
+                sys.exit(1)
+        elif opt == 'summary':
+            PidstatOptions.summary = True
 
     def override(self, opt):
         """ Override standard PCP options to match pidstat(1) """
@@ -917,12 +715,19 @@ class PidstatOptions(pmapi.pmOptions):
         self.pmSetLongOptionTimeZone()
         self.pmSetLongOptionHostZone()
         self.pmSetLongOption("", 0, "l", "", "Display the process command name and all its arguments.")
+        self.pmSetLongOption("window", 1, "", "N",
+                             "Report CPU usage and fault rates over the last N intervals.")
+        self.pmSetLongOption("summary", 0, "", "",
+                             "Report average and peak values of each process on exit.")
         self.pmSetLongOptionHelp()
 
 
 class PidstatReport(pmcc.MetricGroupPrinter):
     Machine_info_count = 0
 
+    def __init__(self, history=None):
+        self.history = history
+
     def timeStampDelta(self, group):
         s = group.timestamp.tv_sec - group.prevTimestamp.tv_sec
         n = group.timestamp.tv_nsec - group.prevTimestamp.tv_nsec
@@ -946,8 +751,19 @@ class PidstatReport(pmcc.MetricGroupPrinter):
     def get_ncpu(self,group):
         return group['hinv.ncpu'].netValues[0][2]
 
+    def indentation(self, timestamp):
+        header_indentation = "        " if len(timestamp)<9 else (len(timestamp)-7)*" "
+        value_indentation = ((len(header_indentation)+9)-len(timestamp))*" "
+        return header_indentation, value_indentation
+
     def report(self,manager):
         group = manager['pidstat']
+        # process state times accumulate per interval, so are never windowed
+        window = 1 if PidstatOptions.show_process_state else PidstatOptions.window
+        metric_repository = ReportingMetricRepository(group, self.history, window)
+        if self.history is not None:
+            self.history.record(metric_repository, float(group.timestamp))
+
         if group['proc.psinfo.utime'].netPrevValues is None:
             # need two fetches to report rate converted counter metrics
             return
@@ -967,10 +783,9 @@ class PidstatReport(pmcc.MetricGroupPrinter):
         ts = group.contextCache.pmLocaltime(int(group.timestamp))
         timestamp = time.strftime(PidstatOptions.timefmt, ts.struct_time())
         interval_in_seconds = self.timeStampDelta(group)
-        header_indentation = "        " if len(timestamp)<9 else (len(timestamp)-7)*" "
-        value_indentation = ((len(header_indentation)+9)-len(timestamp))*" "
-
-        metric_repository = ReportingMetricRepository(group)
+        if metric_repository.span() > 1:
+            interval_in_seconds = self.history.elapsed(metric_repository.span())
+        header_indentation, value_indentation = self.indentation(timestamp)
 
         if PidstatOptions.show_process_stack_util:
             process_stack_util = CpuProcessStackUtil(metric_repository)
@@ -1022,6 +837,34 @@ class PidstatReport(pmcc.MetricGroupPrinter):
                                       printdecorator.Print, PidstatOptions)
             report.print_report(timestamp, ncpu, header_indentation, value_indentation)
 
+    def print_summary(self):
+        """ Average and peak values of each process over the whole run """
+        if self.history is None or self.history.samples < 2:
+            return
+        if PidstatOptions.show_process_priority or PidstatOptions.show_process_state:
+            return # nothing rate or size based to summarise
+        ncpu = self.history.current_value('hinv.ncpu', None)
+        for timestamp, columns in (("Average:", PIDSTAT_AVERAGE_COLUMNS),
+                                   ("Peak:", PIDSTAT_PEAK_COLUMNS)):
+            header_indentation, value_indentation = self.indentation(timestamp)
+            summary = ProcessSummary(self.history, columns)
+            process_filter = ProcessFilter(PidstatOptions)
+            stdout = StdoutPrinter()
+            printdecorator = NoneHandlingPrinterDecorator(stdout)
+            print("")
+            if PidstatOptions.show_process_stack_util:
+                report = CpuProcessStackUtilReporter(summary, process_filter,
+                                                     printdecorator.Print, PidstatOptions)
+                report.print_report(timestamp, header_indentation, value_indentation)
+            elif PidstatOptions.show_process_memory_util:
+                report = CpuProcessMemoryUtilReporter(summary, process_filter, None,
+                                                      printdecorator.Print, PidstatOptions)
+                report.print_report(timestamp, header_indentation, value_indentation)
+            else:
+                report = CpuUsageReporter(summary, process_filter, None,
+                                          printdecorator.Print, PidstatOptions)
+                report.print_report(timestamp, ncpu, header_indentation, value_indentation)
+
 
 if __name__ == "__main__":
     try:
@@ -1044,8 +887,14 @@ if __name__ == "__main__":
             manager['pidstat'] = PIDSTAT_METRICS_B
         else:
             manager['pidstat'] = PIDSTAT_METRICS
-        manager.printer = PidstatReport()
+        history = None
+        if opts.window > 1 or opts.summary:
+            history = MetricHistory(opts.window + 1, PIDSTAT_HISTORY, opts.summary)
+        report = PidstatReport(history)
+        manager.printer = report
         sts = manager.run()
+        if opts.summary:
+            report.print_summary()
         sys.exit(sts)
     except pmapi.pmErr as pmerror:
         sys.stderr.write('%s: %s\n' % (pmerror.progname,pmerror.message()))
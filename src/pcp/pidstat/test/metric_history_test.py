@@ -0,0 +1,145 @@
+#!/usr/bin/env pmpython
+#
+# Copyright (c) 2026 Red Hat.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+import unittest
+from mock import Mock
+from pcp.proctable import MetricHistory
+from pcp_pidstat import ReportingMetricRepository, ProcessSummary
+from pcp_pidstat import PIDSTAT_AVERAGE_COLUMNS, PIDSTAT_PEAK_COLUMNS, cpu_times
+
+HISTORY = {
+    'proc.psinfo.pid': 'proc.psinfo.pid',
+    'proc.psinfo.cmd': 'proc.psinfo.cmd',
+    'proc.psinfo.utime': 'proc.psinfo.utime',
+    'proc.psinfo.rss': 'proc.psinfo.rss',
+}
+
+def group(values, previous=None):
+    """ A metric group with the given instance to value mappings """
+    def metric(current, prior):
+        return Mock(netValues=[(Mock(inst=inst), None, value) for inst, value in current.items()],
+                    netPrevValues=[(Mock(inst=inst), None, value) for inst, value in prior.items()])
+    previous = previous or {}
+    return dict((name, metric(current, previous.get(name, {})))
+                for name, current in values.items())
+
+def sample(utime, rss=None):
+    """ Values of a few processes, utime and rss keyed by pid """
+    return {
+        'proc.psinfo.pid': dict((pid, pid) for pid in utime),
+        'proc.psinfo.cmd': dict((pid, 'cmd%d' % pid) for pid in utime),
+        'proc.psinfo.utime': utime,
+        'proc.psinfo.rss': rss or dict((pid, 100) for pid in utime),
+    }
+
+class MetricHistoryTest(unittest.TestCase):
+
+    def record(self, history, samples, interval=1.0):
+        for index, values in enumerate(samples):
+            history.record(ReportingMetricRepository(group(values)), index * interval)
+
+    def test_keeps_values_of_the_last_depth_samples(self):
+        history = MetricHistory(3, HISTORY)
+        self.record(history, [sample({1: 10}), sample({1: 20}), sample({1: 40}), sample({1: 80})])
+
+        self.assertEqual(history.span(5), 2)
+        self.assertEqual(history.values('proc.psinfo.utime', 1), {1: 40})
+        self.assertEqual(history.values('proc.psinfo.utime', 2), {1: 20})
+        self.assertEqual(history.elapsed(2), 2.0)
+
+    def test_window_is_limited_by_the_samples_so_far(self):
+        history = MetricHistory(5, HISTORY)
+        self.record(history, [sample({1: 10}), sample({1: 20})])
+
+        self.assertEqual(history.span(4), 1)
+
+    def test_new_and_restarted_instances_have_no_older_values(self):
+        history = MetricHistory(4, HISTORY)
+        self.record(history, [sample({1: 10, 2: 5}), sample({1: 20}),
+                              sample({1: 30, 2: 7, 3: 1})])
+
+        self.assertEqual(history.values('proc.psinfo.utime', 2), {1: 10})
+        self.assertEqual(history.values('proc.psinfo.utime', 0), {1: 30, 2: 7, 3: 1})
+
+    def test_rings_of_exited_instances_are_released(self):
+        history = MetricHistory(4, HISTORY)
+        self.record(history, [sample({1: 10, 2: 5}), sample({1: 20})])
+
+        self.assertIsNone(history.entries['proc.psinfo.utime'][2].ring)
+        self.assertEqual(history.instances('proc.psinfo.utime'), [1, 2])
+        self.assertEqual(history.instances('proc.psinfo.utime', 2), [1])
+
+    def test_nothing_is_kept_for_exited_instances_without_summaries(self):
+        history = MetricHistory(4, HISTORY, summaries=False)
+        self.record(history, [sample({1: index, 100 + index: 0}) for index in range(1000)])
+
+        for name in HISTORY:
+            self.assertEqual(sorted(history.entries[name]), [1, 1099])
+
+    def test_reused_instances_start_a_new_summary(self):
+        history = MetricHistory(4, HISTORY)
+        self.record(history, [sample({100: 10000}), sample({100: 50000}), sample({}),
+                              sample({100: 10}), sample({100: 20})])
+
+        self.assertEqual(history.average_rates('proc.psinfo.utime', [100]), [10.0])
+        self.assertEqual(history.peak_rates('proc.psinfo.utime', [100]), [10.0])
+        self.assertEqual(history.averages('proc.psinfo.utime', [100]), [15.0])
+        self.assertEqual(history.values('proc.psinfo.utime', 1), {100: 10})
+
+    def test_summarises_the_whole_run(self):
+        history = MetricHistory(2, HISTORY)
+        self.record(history, [sample({1: 0}, {1: 100}), sample({1: 10}, {1: 400}),
+                              sample({1: 40}, {1: 100}), sample({1: 60}, {1: 200})], 2.0)
+
+        self.assertEqual(history.averages('proc.psinfo.rss', [1, 9]), [200.0, None])
+        self.assertEqual(history.peaks('proc.psinfo.rss', [1]), [400])
+        self.assertEqual(history.average_rates('proc.psinfo.utime', [1]), [10.0])
+        self.assertEqual(history.peak_rates('proc.psinfo.utime', [1]), [15.0])
+
+    def test_non_numeric_values_keep_the_latest_only(self):
+        history = MetricHistory(2, HISTORY)
+        self.record(history, [sample({1: 0}), sample({1: 10})])
+
+        self.assertEqual(history.current_values('proc.psinfo.cmd'), {1: 'cmd1'})
+        self.assertIsNone(history.entries['proc.psinfo.cmd'][1].ring)
+
+    def test_repository_previous_values_span_the_window(self):
+        history = MetricHistory(3, HISTORY)
+        self.record(history, [sample({1: 10}), sample({1: 20})])
+        values = sample({1: 40})
+        repository = ReportingMetricRepository(group(values, sample({1: 20})), history, 2)
+        history.record(repository, 2.0)
+
+        self.assertEqual(repository.span(), 2)
+        self.assertEqual(repository.previous_value('proc.psinfo.utime', 1), 10)
+        self.assertEqual(ReportingMetricRepository(group(values, sample({1: 20})))
+                         .previous_value('proc.psinfo.utime', 1), 20)
+
+    def test_summary_rows_of_processes_seen_in_an_interval(self):
+        history = MetricHistory(2, dict(HISTORY, cpu_time=cpu_times))
+        self.record(history, [sample({1: 0, 2: 0}), sample({1: 100}, {1: 300}),
+                              sample({1: 500}, {1: 200})])
+
+        averages = list(ProcessSummary(history, PIDSTAT_AVERAGE_COLUMNS).get_processes())
+        peaks = list(ProcessSummary(history, PIDSTAT_PEAK_COLUMNS).get_processes())
+
+        self.assertEqual([row.pid() for row in averages], [1])
+        self.assertEqual(averages[0].user_percent(), 25.0)
+        self.assertEqual(averages[0].rss(), 200)
+        self.assertEqual(averages[0].cpu_number(), '-')
+        self.assertEqual(peaks[0].user_percent(), 40.0)
+        self.assertEqual(peaks[0].rss(), 300)
+
+if __name__ == '__main__':
+    unittest.main()
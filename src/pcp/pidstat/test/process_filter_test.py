@@ -1,5 +1,6 @@
 #!/usr/bin/env pmpython
 #
+# Copyright (c) 2026 Red Hat.
 # Copyright (C) 2016 Sitaram Shelke.
 #
 # This program is free software; you can redistribute it and/or modify it
@@ -15,7 +16,20 @@
 
 from mock import Mock
 import unittest
-from pcp_pidstat import ProcessFilter
+from pcp_pidstat import CpuUsage, ProcessFilter
+
+CURRENT = {
+    'proc.psinfo.pid': {1: 1, 2: 2, 3: 3, 4: 4},
+    'proc.psinfo.cmd': {1: 'process_1', 2: 'process_two', 3: 'proc_3', 4: 'a_short_process'},
+    'proc.id.uid_nm': {1: 'pcp', 2: 'pcp1', 3: 'pcp1', 4: 'pcp'},
+    'proc.psinfo.vsize': {1: 136, 2: 136, 3: 0, 4: 0},
+    'proc.psinfo.rt_priority': {1: 99, 2: 0, 3: 99, 4: 0},
+    'proc.memory.vmstack': {1: 123, 2: 0, 3: 0, 4: 50},
+}
+
+class MetricRepository(object):
+    def current_values(self, metric):
+        return CURRENT.get(metric)
 
 class TestProcessFilter(unittest.TestCase):
     def setUp(self):
@@ -29,81 +43,55 @@ class TestProcessFilter(unittest.TestCase):
                         pid_filter = None,
                         pid_list = [])
 
-        self.process_1 = Mock(pid = Mock(return_value = 1),
-                        process_name = Mock(return_value = "process_1"),
-                        user_name = Mock(return_value='pcp'),
-                        vsize = Mock(return_value=136),
-                        priority = Mock(return_value=99),
-                        stack_size = Mock(return_value=123),)
-        self.process_2 = Mock(pid = Mock(return_value = 2),
-                        process_name = Mock(return_value = "process_two"),
-                        user_name = Mock(return_value='pcp1'),
-                        vsize = Mock(return_value=136),
-                        priority = Mock(return_value=0),
-                        stack_size = Mock(return_value=0),)
-        self.process_3 = Mock(pid = Mock(return_value = 3),
-                        process_name = Mock(return_value = "proc_3"),
-                        user_name = Mock(return_value='pcp1'),
-                        vsize = Mock(return_value=0),
-                        priority = Mock(return_value=99),
-                        stack_size = Mock(return_value=0),)
-        self.process_4 = Mock(pid = Mock(return_value = 4),
-                        process_name = Mock(return_value = "a_short_process"),
-                        user_name = Mock(return_value='pcp'),
-                        vsize = Mock(return_value=0),
-                        priority = Mock(return_value=0),
-                        stack_size = Mock(return_value=50),)
-
-        self.processes = [self.process_1, self.process_2, self.process_3, self.process_4]
+        self.processes = CpuUsage(MetricRepository()).get_processes(1.0)
+
+    def filtered_pids(self):
+        processes = ProcessFilter(self.options).filter_processes(self.processes)
+        return [process.pid() for process in processes]
 
     def test_filter_processes_for_given_user_name(self):
         self.options.filtered_process_user = 'pcp1'
-        processs_filter = ProcessFilter(self.options)
-
-        test_filtered_processes = processs_filter.filter_processes(self.processes)
 
-        self.assertEqual(test_filtered_processes,[self.process_2,self.process_3])
+        self.assertEqual(self.filtered_pids(), [2, 3])
 
     def test_filter_processes_for_given_process_name(self):
         self.options.process_name = 'process'
-        processs_filter = ProcessFilter(self.options)
 
-        test_filtered_processes = processs_filter.filter_processes(self.processes)
-
-        self.assertEqual(test_filtered_processes,[self.process_1, self.process_2, self.process_4])
+        self.assertEqual(self.filtered_pids(), [1, 2, 4])
 
     def test_filter_processes_for_given_pid_list(self):
         self.options.pid_filter = 'ALL'
         self.options.pid_list = [1,4]
-        processs_filter = ProcessFilter(self.options)
 
-        test_filtered_processes = processs_filter.filter_processes(self.processes)
+        self.assertEqual(self.filtered_pids(), [1, 4])
+
+    def test_filter_processes_for_own_pid(self):
+        self.options.pid_filter = 'SELF'
+        self.options.pid_list = 3
 
-        self.assertEqual(test_filtered_processes,[self.process_1,self.process_4])
+        self.assertEqual(self.filtered_pids(), [3])
 
     def test_filter_processes_for_process_vsize(self):
         self.options.show_process_memory_util = True
-        processs_filter = ProcessFilter(self.options)
 
-        test_filtered_processes = processs_filter.filter_processes(self.processes)
-
-        self.assertEqual(test_filtered_processes,[self.process_1,self.process_2])
+        self.assertEqual(self.filtered_pids(), [1, 2])
 
     def test_filter_processes_for_process_priority(self):
         self.options.show_process_priority = True
-        processs_filter = ProcessFilter(self.options)
-
-        test_filtered_processes = processs_filter.filter_processes(self.processes)
 
-        self.assertEqual(test_filtered_processes,[self.process_1,self.process_3])
+        self.assertEqual(self.filtered_pids(), [1, 3])
 
     def test_filter_processes_for_process_stack_size(self):
         self.options.show_process_stack_util = True
-        processs_filter = ProcessFilter(self.options)
 
-        test_filtered_processes = processs_filter.filter_processes(self.processes)
+        self.assertEqual(self.filtered_pids(), [1, 4])
 
-        self.assertEqual(test_filtered_processes,[self.process_1,self.process_4])
+    def test_filter_processes_without_a_name(self):
+        CURRENT['proc.psinfo.cmd'][2] = None
+        try:
+            self.assertEqual(self.filtered_pids(), [1, 3, 4])
+        finally:
+            CURRENT['proc.psinfo.cmd'][2] = 'process_two'
 
 if __name__ == "__main__":
     unittest.main()
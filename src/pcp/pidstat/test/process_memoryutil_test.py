@@ -1,5 +1,6 @@
 #!/usr/bin/env pmpython
 #
+# Copyright (c) 2026 Red Hat.
 # Copyright (C) 2016 Sitaram Shelke.
 #
 # This program is free software; you can redistribute it and/or modify it
@@ -13,149 +14,76 @@
 # for more details.
 #
 
-import mock
 import unittest
-from pcp_pidstat import ProcessMemoryUtil
+from pcp_pidstat import CpuProcessMemoryUtil
+
+# pid 1 has current and previous values, pid 2 no previous values and
+# pid 3 no current fault counts
+CURRENT = {
+    'proc.psinfo.pid': {1: 1, 2: 2, 3: 3},
+    'proc.psinfo.vsize': {1: 120084, 2: 120084, 3: 120084},
+    'proc.psinfo.rss': {1: 6272, 2: 6272, 3: 6272},
+    'proc.psinfo.minflt': {1: 14509, 2: 14509},
+    'proc.psinfo.maj_flt': {1: 54, 2: 54},
+    'proc.psinfo.cmd': {1: 'test', 2: 'test', 3: 'test'},
+    'proc.id.uid': {1: 1, 2: 1, 3: 1},
+}
+PREVIOUS = {
+    'proc.psinfo.minflt': {1: 14500, 3: 14500},
+    'proc.psinfo.maj_flt': {1: 50, 3: 50},
+}
+SINGULAR = {'mem.physmem': 3794764}
+
+class MetricRepository(object):
+    def current_values(self, metric):
+        return CURRENT.get(metric)
+
+    def previous_values(self, metric):
+        return PREVIOUS.get(metric)
+
+    def current_value(self, metric, instance):
+        return SINGULAR.get(metric)
 
 class TestProcessMemoryUtil(unittest.TestCase):
     def setUp(self):
-        self.__metric_repository = mock.Mock()
-        self.__metric_repository.current_value = mock.Mock(side_effect=self.metric_repo_current_value_side_effect)
-        self.__metric_repository.previous_value = mock.Mock(side_effect=self.metric_repo_previous_value_side_effect)
-
-    def metric_repo_current_value_side_effect(self, metric_name,instance):
-        if metric_name == 'proc.psinfo.vsize' and instance == 1:
-            return 120084
-        if metric_name == 'proc.psinfo.rss' and instance == 1:
-            return 6272
-        if metric_name == 'proc.psinfo.minflt' and instance == 1:
-            return 14509
-        if metric_name == 'proc.psinfo.maj_flt' and instance == 1:
-            return 54
-        if metric_name == 'mem.physmem':
-            return 3794764
-        if metric_name == 'proc.psinfo.cmd' and instance == 1:
-            return "test"
-        if metric_name == 'proc.psinfo.processor' and instance == 1:
-            return 0
-        if metric_name == 'proc.id.uid' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.pid' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.vsize' and instance == 2:
-            return 120084
-        if metric_name == 'proc.psinfo.rss' and instance == 2:
-            return 6272
-        if metric_name == 'proc.psinfo.minflt' and instance == 2:
-            return 14509
-        if metric_name == 'proc.psinfo.maj_flt' and instance == 2:
-            return 54
-        return None
-
-    def metric_repo_previous_value_side_effect(self, metric_name,instance):
-        if metric_name == 'proc.psinfo.cmin_flt' and instance == 1:
-            return 573930
-        if metric_name == 'proc.psinfo.minflt' and instance == 1:
-            return 14500
-        if metric_name == 'proc.psinfo.cmaj_flt' and instance == 1:
-            return 645
-        if metric_name == 'proc.psinfo.maj_flt' and instance == 1:
-            return 50
-        if metric_name == 'proc.psinfo.cmin_flt' and instance == 3:
-            return 573930
-        if metric_name == 'proc.psinfo.minflt' and instance == 3:
-            return 14500
-        if metric_name == 'proc.psinfo.cmaj_flt' and instance == 3:
-            return 645
-        if metric_name == 'proc.psinfo.maj_flt' and instance == 3:
-            return 50
-        return None
+        rows = CpuProcessMemoryUtil(MetricRepository()).get_processes(1.34)
+        self.processes = dict((row.pid(), row) for row in rows)
 
     def test_vsize(self):
-        process_memory_usage = ProcessMemoryUtil(1,1.34,self.__metric_repository)
-
-        vsize = process_memory_usage.vsize()
-
-        self.assertEquals(vsize, 120084)
+        self.assertEqual(self.processes[1].vsize(), 120084)
 
     def test_rss(self):
-        process_memory_usage = ProcessMemoryUtil(1,1.34,self.__metric_repository)
-
-        rss = process_memory_usage.rss()
-
-        self.assertEquals(rss, 6272)
+        self.assertEqual(self.processes[1].rss(), 6272)
 
     def test_mem(self):
-        process_memory_usage = ProcessMemoryUtil(1,1.34,self.__metric_repository)
-
-        mem = process_memory_usage.mem()
-
-        self.assertEquals(mem, 0.17)
+        self.assertEqual(self.processes[1].mem(), 0.17)
 
     def test_min_flt(self):
-        process_memory_usage = ProcessMemoryUtil(1,1.34,self.__metric_repository)
-
-        min_flt = process_memory_usage.minflt()
-
-        self.assertEquals(min_flt, 6.72)
+        self.assertEqual(self.processes[1].minflt(), 6.72)
 
     def test_min_flt_if_current_value_is_None(self):
-        process_memory_usage = ProcessMemoryUtil(3,1.34,self.__metric_repository)
-
-        min_flt = process_memory_usage.minflt()
-
-        self.assertIsNone(min_flt)
+        self.assertIsNone(self.processes[3].minflt())
 
     def test_min_flt_if_previous_value_is_None(self):
-        process_memory_usage = ProcessMemoryUtil(2,1.34,self.__metric_repository)
-
-        min_flt = process_memory_usage.minflt()
-
-        self.assertIsNone(min_flt)
+        self.assertIsNone(self.processes[2].minflt())
 
     def test_maj_flt(self):
-        process_memory_usage = ProcessMemoryUtil(1,1.34,self.__metric_repository)
-
-        maj_flt = process_memory_usage.majflt()
-
-        self.assertEquals(maj_flt, 2.99)
+        self.assertEqual(self.processes[1].majflt(), 2.99)
 
     def test_maj_flt_if_current_value_is_None(self):
-        process_memory_usage = ProcessMemoryUtil(3,1.34,self.__metric_repository)
-
-        maj_flt = process_memory_usage.majflt()
-
-        self.assertIsNone(maj_flt)
-
+        self.assertIsNone(self.processes[3].majflt())
 
     def test_maj_flt_if_previous_value_is_None(self):
-        process_memory_usage = ProcessMemoryUtil(2,1.34,self.__metric_repository)
-
-        maj_flt = process_memory_usage.majflt()
-
-        self.assertIsNone(maj_flt)
+        self.assertIsNone(self.processes[2].majflt())
 
     def test_pid(self):
-        process_memory_usage = ProcessMemoryUtil(1,1.34,self.__metric_repository)
-
-        pid = process_memory_usage.pid()
-
-        self.assertEqual(pid,1)
+        self.assertEqual(self.processes[1].pid(), 1)
 
     def test_process_name(self):
-        process_memory_usage = ProcessMemoryUtil(1,1.34,self.__metric_repository)
-
-        name = process_memory_usage.process_name()
-
-        self.assertEqual(name,'test')
-
+        self.assertEqual(self.processes[1].process_name(), 'test')
 
     def test_user_id(self):
-        process_memory_usage = ProcessMemoryUtil(1,1.34,self.__metric_repository)
-
-        user_id = process_memory_usage.user_id()
-
-        self.assertEqual(user_id,1)
+        self.assertEqual(self.processes[1].user_id(), 1)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 #!/usr/bin/env pmpython
 #
+# Copyright (c) 2026 Red Hat.
 # Copyright (C) 2016 Sitaram Shelke.
 #
 # This program is free software; you can redistribute it and/or modify it
@@ -13,61 +14,42 @@
 # for more details.
 #
 
-import mock
 import unittest
-from pcp_pidstat import ProcessPriority
+from pcp_pidstat import CpuProcessPriorities
+
+CURRENT = {
+    'proc.psinfo.pid': {1: 1, 2: 2},
+    'proc.id.uid': {1: 0, 2: 0},
+    'proc.psinfo.rt_priority': {1: 99, 2: 0},
+    'proc.psinfo.cmd': {1: 'test', 2: 'other'},
+    'proc.psinfo.policy': {1: 1},
+}
+
+class MetricRepository(object):
+    def current_values(self, metric):
+        return CURRENT.get(metric)
 
 class TestProcessPriority(unittest.TestCase):
     def setUp(self):
-        self.__metric_repository = mock.Mock()
-        self.__metric_repository.current_value = mock.Mock(side_effect=self.metric_repo_current_value_side_effect)
-
-    def metric_repo_current_value_side_effect(self, metric_name,instance):
-        if metric_name == 'proc.psinfo.pid' and instance == 1:
-            return 1
-        if metric_name == 'proc.id.uid' and instance == 1:
-            return 0
-        if metric_name == 'proc.psinfo.rt_priority' and instance == 1:
-            return 99
-        if metric_name == 'proc.psinfo.cmd' and instance == 1:
-            return "test"
-        if metric_name == 'proc.psinfo.policy' and instance == 1:
-            return 1
+        self.processes = CpuProcessPriorities(MetricRepository()).get_processes()
 
     def test_pid(self):
-        process_priority = ProcessPriority(1,self.__metric_repository)
-
-        pid = process_priority.pid()
-
-        self.assertEqual(pid,1)
+        self.assertEqual(self.processes[0].pid(), 1)
 
     def test_process_name(self):
-        process_priority = ProcessPriority(1,self.__metric_repository)
-
-        name = process_priority.process_name()
-
-        self.assertEqual(name,'test')
+        self.assertEqual(self.processes[0].process_name(), 'test')
 
     def test_policy(self):
-        process_priority = ProcessPriority(1,self.__metric_repository)
-
-        policy = process_priority.policy()
+        self.assertEqual(self.processes[0].policy(), 'FIFO')
 
-        self.assertEqual(policy,'FIFO')
+    def test_policy_if_value_is_None(self):
+        self.assertIsNone(self.processes[1].policy())
 
     def test_user_id(self):
-        process_priority = ProcessPriority(1,self.__metric_repository)
-
-        user_id = process_priority.user_id()
-
-        self.assertEqual(user_id,0)
+        self.assertEqual(self.processes[0].user_id(), 0)
 
     def test_priority(self):
-        process_priority = ProcessPriority(1,self.__metric_repository)
-
-        priority = process_priority.priority()
-
-        self.assertEqual(priority,99)
+        self.assertEqual(self.processes[0].priority(), 99)
 
 if __name__ == '__main__':
     unittest.main()
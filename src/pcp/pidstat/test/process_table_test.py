@@ -0,0 +1,140 @@
+#!/usr/bin/env pmpython
+#
+# Copyright (c) 2026 Red Hat.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+import unittest
+from mock import Mock
+from pcp.proctable import ProcessTable, ProcessRows
+from pcp_pidstat import CpuUsage, ProcessFilter
+
+CURRENT = {
+    'proc.psinfo.pid': {1: 1, 2: 2, 10: 10},
+    'proc.psinfo.cmd': {1: 'init', 2: 'kthreadd', 10: 'bash'},
+    'proc.psinfo.utime': {1: 112233, 2: 112233, 10: 5000},
+    'proc.psinfo.stime': {1: 112243, 2: 112243, 10: 7000},
+    'proc.psinfo.rss': {1: 400, 2: None, 10: 1600},
+}
+PREVIOUS = {
+    'proc.psinfo.pid': {1: 1, 10: 10},
+    'proc.psinfo.utime': {1: 112223, 10: 4000},
+    'proc.psinfo.stime': {1: 112233, 10: 6990},
+}
+SINGULAR = {'mem.physmem': 16000}
+
+COLUMNS = {
+    'pid': 'proc.psinfo.pid',
+    'process_name': 'proc.psinfo.cmd',
+    'user_percent': lambda table: table.percents('proc.psinfo.utime'),
+    'system_percent': lambda table: table.percents('proc.psinfo.stime'),
+    'total_percent': lambda table: table.totals('user_percent', 'system_percent'),
+    'utime': lambda table: table.deltas('proc.psinfo.utime', '?'),
+    'minflt': lambda table: table.rates('proc.psinfo.stime'),
+    'mem': lambda table: table.shares('proc.psinfo.rss', table.value('mem.physmem')),
+}
+
+class MetricRepository(object):
+    def __init__(self):
+        self.fetched = []
+
+    def current_values(self, metric):
+        self.fetched.append(metric)
+        return CURRENT.get(metric)
+
+    def previous_values(self, metric):
+        return PREVIOUS.get(metric)
+
+    def current_value(self, metric, instance):
+        return SINGULAR.get(metric)
+
+class TestProcessTable(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = MetricRepository()
+        self.table = ProcessTable(self.repository, 1.34, COLUMNS)
+
+    def test_rows_are_ordered_by_pid(self):
+        self.assertEqual(self.table.pids, [1, 2, 10])
+        self.assertEqual(self.table.rows().column('process_name'), ['init', 'kthreadd', 'bash'])
+
+    def test_percent_columns(self):
+        self.assertEqual(self.table.column('user_percent'), [0.75, None, 74.63])
+        self.assertEqual(self.table.column('system_percent'), [0.75, None, 0.75])
+        self.assertEqual(self.table.column('total_percent'), [1.5, None, 75.38])
+
+    def test_delta_rate_and_share_columns(self):
+        self.assertEqual(self.table.column('utime'), [10, '?', 1000])
+        self.assertEqual(self.table.column('minflt'), [7.46, None, 7.46])
+        self.assertEqual(self.table.column('mem'), [2.5, None, 10.0])
+
+    def test_columns_are_computed_once(self):
+        self.table.column('process_name')
+        self.table.column('process_name')
+        self.assertEqual(self.repository.fetched.count('proc.psinfo.cmd'), 1)
+
+    def test_row_accessors(self):
+        rows = self.table.rows()
+        self.assertIsInstance(rows, ProcessRows)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual([row.pid() for row in rows], [1, 2, 10])
+        self.assertEqual(rows[2].user_percent(), 74.63)
+
+    def test_where_narrows_the_table(self):
+        rows = self.table.rows().where('process_name', lambda name: name != 'kthreadd')
+        self.assertEqual(rows.table.pids, [1, 10])
+        self.assertEqual([row.total_percent() for row in rows], [1.5, 75.38])
+
+    def test_sort_puts_missing_values_last(self):
+        rows = self.table.rows().sort('user_percent', reverse=True)
+        self.assertEqual(rows.column('pid'), [10, 1, 2])
+
+    def test_empty_table(self):
+        CURRENT['proc.psinfo.pid'], pids = {}, CURRENT['proc.psinfo.pid']
+        try:
+            table = ProcessTable(self.repository, 1.0, COLUMNS)
+        finally:
+            CURRENT['proc.psinfo.pid'] = pids
+        self.assertEqual(len(table.rows()), 0)
+        self.assertEqual(table.column('user_percent'), [])
+
+class TestPidstatProcessTable(unittest.TestCase):
+
+    def setUp(self):
+        self.options = Mock(process_name = None,
+                        show_process_memory_util = False,
+                        show_process_priority = False,
+                        show_process_stack_util = False,
+                        filtered_process_user = None,
+                        pid_filter = None,
+                        pid_list = [])
+        self.processes = CpuUsage(MetricRepository()).get_processes(1.34)
+
+    def test_cpu_usage_rows(self):
+        process = self.processes[0]
+        self.assertEqual(process.pid(), 1)
+        self.assertEqual(process.user_percent(), 0.75)
+        self.assertIsNone(process.guest_percent())
+        self.assertIsNone(process.total_percent())
+
+    def test_filter_rows_by_process_name(self):
+        self.options.process_name = '^b'
+        processes = ProcessFilter(self.options).filter_processes(self.processes)
+        self.assertEqual([process.pid() for process in processes], [10])
+
+    def test_filter_rows_by_pid(self):
+        self.options.pid_filter = 'SELF'
+        self.options.pid_list = 2
+        processes = ProcessFilter(self.options).filter_processes(self.processes)
+        self.assertEqual([process.process_name() for process in processes], ['kthreadd'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,6 +24,7 @@ import time
 import signal
 from pcp import pmcc
 from pcp import pmapi
+from pcp.proctable import ReportingMetricRepository, ProcessTable
 from cpmapi import PM_CONTEXT_ARCHIVE
 
 process_state_info = {}
@@ -39,6 +40,78 @@ PSSTAT_METRICS = ['kernel.uname.nodename', 'kernel.uname.release', 'kernel.uname
 SCHED_POLICY = ['NORMAL', 'FIFO', 'RR', 'BATCH', '', 'IDLE', 'DEADLINE']
 
 
+# Process table columns, named after the row accessors used by the
+# reporters (see PIDINFO_PAIR)
+
+def padded(values, width, limit=None, missing=None):
+    return [missing if value is None else value[:limit].ljust(width) for value in values]
+
+def start_column(table):
+    group = table.repository.group
+    kernel_boottime = group['kernel.all.boottime'].netValues[0][2]
+    starts, stamps = [], {}
+    for s_time in table.current('proc.psinfo.start_time'):
+        if s_time is None:
+            starts.append(None)
+            continue
+        started = kernel_boottime + (s_time / 1000)
+        if group.timestamp.tv_sec - started >= 24*60*60:
+            # started one day or more ago, use MmmDD HH:MM
+            key = ("%b%d %H:%M", int(started))
+        else:
+            # started less than one day ago, use HH:MM:SS
+            key = ("%H:%M:%S", int(started))
+        if key not in stamps:
+            ts = group.contextCache.pmLocaltime(key[1])
+            stamps[key] = time.strftime(key[0], ts.struct_time())
+        starts.append(stamps[key])
+    return starts
+
+def total_time_column(table):
+    times = []
+    for c_usertime, p_guesttime in zip(table.current('proc.psinfo.stime'),
+                                       table.previous('proc.psinfo.utime')):
+        if c_usertime and p_guesttime is not None:
+            total_time = (c_usertime / 1000) + (p_guesttime / 1000)
+        else:
+            total_time = 0
+        times.append(time.strftime("%H:%M:%S", time.gmtime(total_time)))
+    return times
+
+def func_state_column(table):
+    return ['N/A' if s_name == 'R' else '?' if s_name is None else wchan
+            for s_name, wchan in zip(table.column('s_name'), table.column('wchan_s'))]
+
+PSSTAT_COLUMNS = {
+    'pid': lambda table: [str(pid).ljust(8) for pid in table.current('proc.psinfo.pid')],
+    'ppid': lambda table: [str(ppid).ljust(8) for ppid in table.current('proc.psinfo.ppid')],
+    'user_name': lambda table: padded(table.current('proc.id.uid_nm'), 10, 10),
+    'process_name': lambda table: padded(table.current('proc.psinfo.cmd'), 20, 20, '-'),
+    'process_name_with_args': lambda table: padded(table.current('proc.psinfo.psargs'), 30, 30),
+    'process_name_with_args_last': lambda table: padded(table.current('proc.psinfo.psargs'), 30),
+    'vsize': 'proc.psinfo.vsize',
+    'rss': 'proc.psinfo.rss',
+    'mem': lambda table: table.shares('proc.psinfo.rss', table.value('mem.physmem')),
+    's_name': 'proc.psinfo.sname',
+    'cpu_number': 'proc.psinfo.processor',
+    'system_percent': lambda table: table.percents('proc.psinfo.stime'),
+    'wchan_s': lambda table: padded(table.current('proc.psinfo.wchan_s'), 30, 30, '-'),
+    'priority': 'proc.psinfo.priority',
+    'user_percent': lambda table: table.percents('proc.psinfo.utime'),
+    'guest_percent': lambda table: table.percents('proc.psinfo.guest_time'),
+    'total_percent': lambda table: table.totals('user_percent', 'guest_percent', 'system_percent'),
+    'stime': lambda table: table.deltas('proc.psinfo.stime', '?'),
+    'start': start_column,
+    'total_time': total_time_column,
+    'tty_name': 'proc.psinfo.ttyname',
+    'user_id': 'proc.id.uid',
+    'start_time': 'proc.psinfo.start_time',
+    'func_state': func_state_column,
+    'policy': lambda table: [SCHED_POLICY[policy] if policy is not None and policy < len(SCHED_POLICY)
+                             else None for policy in table.current('proc.psinfo.policy')],
+}
+
+
 class StdoutPrinter:
     def Print(self, args):
         print(args)
@@ -53,321 +126,50 @@ class NoneHandlingPrinterDecorator:
         self.printer.Print(new_args)
 
 
-# After fetching non singular metric values, create a mapping of instance id
-# to instance value rather than instance name to instance value.
-# The reason is, in PCP, instance names require a separate pmGetIndom() request
-# and some of the names may not be available.
-class ReportingMetricRepository:
-    def __init__(self, group):
-        self.group = group
-        self.current_cached_values = {}
-        self.previous_cached_values = {}
-
-    def __fetch_current_values(self, metric, instance):
-        if instance:
-            return dict(map(lambda x: (x[0].inst, x[2]), self.group[metric].netValues))
-        else:
-            return self.group[metric].netValues[0][2]
-
-    def __fetch_previous_values(self, metric, instance):
-        if instance:
-            return dict(map(lambda x: (x[0].inst, x[2]), self.group[metric].netPrevValues))
-        else:
-            return self.group[metric].netPrevValues[0][2]
-
-    def current_value(self, metric, instance):
-        if not metric in self.group:
-            return None
-        if instance:
-            if self.current_cached_values.get(metric, None) is None:
-                lst = self.__fetch_current_values(metric, instance)
-                self.current_cached_values[metric] = lst
-
-            return self.current_cached_values[metric].get(instance, None)
-        else:
-            if self.current_cached_values.get(metric, None) is None:
-                self.current_cached_values[metric] = self.__fetch_current_values(metric, instance)
-            return self.current_cached_values.get(metric, None)
-
-    def previous_value(self, metric, instance):
-        if not metric in self.group:
-            return None
-        if instance:
-            if self.previous_cached_values.get(metric, None) is None:
-                lst = self.__fetch_previous_values(metric, instance)
-                self.previous_cached_values[metric] = lst
-
-            return self.previous_cached_values[metric].get(instance, None)
-        else:
-            if self.previous_cached_values.get(metric, None) is None:
-                self.previous_cached_values[metric] = self.__fetch_previous_values(metric, instance)
-            return self.previous_cached_values.get(metric, None)
-
-    def current_values(self, metric_name):
-        if self.group.get(metric_name, None) is None:
-            return None
-        if self.current_cached_values.get(metric_name, None) is None:
-            self.current_cached_values[metric_name] = self.__fetch_current_values(metric_name, True)
-        return self.current_cached_values.get(metric_name, None)
-
-    def previous_values(self, metric_name):
-        if self.group.get(metric_name, None) is None:
-            return None
-        if self.previous_cached_values.get(metric_name, None) is None:
-            self.previous_cached_values[metric_name] = self.__fetch_previous_values(metric_name, True)
-        return self.previous_cached_values.get(metric_name, None)
-
-
 class ProcessFilter:
     def __init__(self, options):
         self.options = options
 
-    def filter_processes(self, processes):
-        return filter(lambda p: self.__predicate(p), processes)
-
-    def __predicate(self, process):
-        if self.options.filter_flag:
-            return bool(self.__matches_process_username(process)
-                        and self.__matches_process_pid(process)
-                        and self.__matches_process_name(process)
-                        and self.__matches_process_ppid(process))
-        else:
-            return True
-
-    def __matches_process_username(self, process):
-        if self.options.username_filter_flag is True and self.options.filtered_process_user is not None:
-            return process.user_name().strip() == self.options.filtered_process_user.strip()
-        else:
-            return True
-
-    def __matches_process_pid(self, process):
-        if self.options.pid_filter_flag:
-            if self.options.pid_list is not None:
-                pid = int(process.pid())
-                return bool(pid in self.options.pid_list)
-        return True
-
-    def __matches_process_ppid(self, process):
-        if self.options.ppid_filter_flag:
-            if self.options.ppid_list is not None:
-                ppid = int(process.ppid())
-                return bool(ppid in self.options.ppid_list)
-        return True
-
-    def __matches_process_name(self, process):
-        name = process.process_name()
-        if self.options.command_filter_flag is True and self.options.command_list is not None and name is not None:
-            return name.strip() in self.options.command_list
-        else:
-            return True
-
-
-class ProcessStatusUtil:
-    def __init__(self, instance, manager, delta_time, metrics_repository):
-        self.instance = instance
-        self.manager = manager
-        self.__delta_time = delta_time
-        self.__metric_repository = metrics_repository
-
-    def pid(self):
-        data = str(self.__metric_repository.current_value('proc.psinfo.pid', self.instance))
-        if len(str(data)) < 8:
-            whitespace = 8 - len(str(data))
-            res = data.ljust(whitespace + len(str(data)), ' ')
-            return res
-        else:
-            return data
-
-    def ppid(self):
-        data = str(self.__metric_repository.current_value('proc.psinfo.ppid', self.instance))
-        if len(str(data)) < 8:
-            whitespace = 8 - len(str(data))
-            res = data.ljust(whitespace + len(str(data)), ' ')
-            return res
-        else:
-            return data
-
-    def user_name(self):
-        data = self.__metric_repository.current_value('proc.id.uid_nm', self.instance)[:10]
-        if len(data) < 10:
-            whitespace = 10 - len(data)
-            res = data.ljust(whitespace + len(data), ' ')
-            return res
-        else:
-            return data
-
-    def process_name(self):
-        try:
-            data = self.__metric_repository.current_value('proc.psinfo.cmd', self.instance)[:20]
-            if len(data) < 20:
-                whitespace = 20 - len(data)
-                res = data.ljust(whitespace + len(data), ' ')
-                return res
-            else:
-                return data
-        except TypeError:
-            data = '-'
-            return data
-
-    def process_name_with_args(self,flag = False):
-        if flag is True:
-            data = self.__metric_repository.current_value('proc.psinfo.psargs', self.instance)
-        else:
-            data = self.__metric_repository.current_value('proc.psinfo.psargs', self.instance)[:30]
-        if len(data) < 30:
-            whitespace = 30 - len(data)
-            res = data.ljust(whitespace + len(data), ' ')
-            return res
-        else:
-            return data
-
-    def process_name_with_args_last(self):
-        return self.process_name_with_args(True)
-    def vsize(self):
-        return self.__metric_repository.current_value('proc.psinfo.vsize', self.instance)
-
-    def rss(self):
-        return self.__metric_repository.current_value('proc.psinfo.rss', self.instance)
-
-    def mem(self):
-        total_mem = self.__metric_repository.current_value('mem.physmem', None)
-        rss = self.__metric_repository.current_value('proc.psinfo.rss', self.instance)
-        if total_mem is not None and rss is not None:
-            return float("%.2f" % (100 * float(rss) / total_mem))
-        else:
-            return None
-
-    def s_name(self):
-        return self.__metric_repository.current_value('proc.psinfo.sname', self.instance)
-
-    def cpu_number(self):
-        return self.__metric_repository.current_value('proc.psinfo.processor', self.instance)
-
-    def system_percent(self):
-        c_systemtime = self.__metric_repository.current_value('proc.psinfo.stime', self.instance)
-        p_systemtime = self.__metric_repository.previous_value('proc.psinfo.stime', self.instance)
-        if c_systemtime is not None and p_systemtime is not None:
-            percent_of_time = 100 * float(c_systemtime - p_systemtime) / float(1000 * self.__delta_time)
-            return float("%.2f" % percent_of_time)
-        else:
-            return None
-
-    def wchan_s(self):
-        process = self.__metric_repository.current_value('proc.psinfo.wchan_s', self.instance)
-        if process is None:
-            process = '-'
-            return process
-        elif len(process) < 30:
-            whitespace = 30 - len(process)
-            res = process.ljust(whitespace + len(process), ' ')
-            return res
-        return process[:30]
-
-    def priority(self):
-        return self.__metric_repository.current_value('proc.psinfo.priority', self.instance)
-
-    def user_percent(self):
-        c_usertime = self.__metric_repository.current_value('proc.psinfo.utime', self.instance)
-        p_usertime = self.__metric_repository.previous_value('proc.psinfo.utime', self.instance)
-        if c_usertime is not None and p_usertime is not None:
-            percent_of_time = 100 * float(c_usertime - p_usertime) / float(1000 * self.__delta_time)
-            return float("%.2f" % percent_of_time)
-        else:
-            return None
-
-    def guest_percent(self):
-        c_guesttime = self.__metric_repository.current_value('proc.psinfo.guest_time', self.instance)
-        p_guesttime = self.__metric_repository.previous_value('proc.psinfo.guest_time', self.instance)
-        if c_guesttime is not None and p_guesttime is not None:
-            percent_of_time = 100 * float(c_guesttime - p_guesttime) / float(1000 * self.__delta_time)
-            return float("%.2f" % percent_of_time)
-        else:
-            return None
-
-    def total_percent(self):
-        if self.user_percent() is not None and self.guest_percent() is not None and self.system_percent() is not None:
-            return float("%.2f" % (self.user_percent() + self.guest_percent() + self.system_percent()))
-        else:
-            return None
-
-    def stime(self):
-        c_systime = self.__metric_repository.current_value('proc.psinfo.stime', self.instance)
-        p_systime = self.__metric_repository.previous_value('proc.psinfo.stime', self.instance)
-        # sometimes the previous_value seems to be Nonetype, not sure why
-        if p_systime is None:  # print a '?' here
-            return '?'
-        else:
-            return c_systime - p_systime
-
-    def start(self):
-        s_time = self.__metric_repository.current_value('proc.psinfo.start_time', self.instance)
-        group = self.manager['psstat']
-        kernel_boottime = group['kernel.all.boottime'].netValues[0][2]
-        ts = group.contextCache.pmLocaltime(int(kernel_boottime + (s_time / 1000)))
-        if group.timestamp.tv_sec - (kernel_boottime + s_time / 1000) >= 24*60*60:
-            # started one day or more ago, use MmmDD HH:MM
-            return time.strftime("%b%d %H:%M", ts.struct_time())
-        else:
-            # started less than one day ago, use HH:MM:SS
-            return time.strftime("%H:%M:%S", ts.struct_time())
-
-
-    def total_time(self):
-        c_usertime = self.__metric_repository.current_value('proc.psinfo.stime', self.instance)
-        p_guesttime = self.__metric_repository.previous_value('proc.psinfo.utime', self.instance)
-        timefmt = "%H:%M:%S"
-        if c_usertime and p_guesttime is not None:
-            total_time = (c_usertime / 1000) + (p_guesttime / 1000)
-        else:
-            total_time = 0
-        return time.strftime(timefmt, time.gmtime(total_time))
-
-    def tty_name(self):
-        return self.__metric_repository.current_value('proc.psinfo.ttyname', self.instance)
-
-    def user_id(self):
-        return self.__metric_repository.current_value('proc.id.uid', self.instance)
-
-    def start_time(self):
-        return self.__metric_repository.current_value('proc.psinfo.start_time', self.instance)
-
-    def func_state(self):
-        s_name = self.__metric_repository.current_value('proc.psinfo.sname', self.instance)
-        if s_name == 'R':
-            return 'N/A'
-        elif s_name is None:
-            return '?'
-        else:
-            return self.wchan_s()
-
-    def policy(self):
-        policy_int = self.__metric_repository.current_value('proc.psinfo.policy', self.instance)
-        if policy_int is not None and policy_int <= len(SCHED_POLICY):
-            # return policy_int
-            return SCHED_POLICY[policy_int]
-        return None
-
-
-PIDINFO_PAIR = {"%cpu": ('%CPU', ProcessStatusUtil.system_percent),
-                "%mem": ('%MEM', ProcessStatusUtil.mem),
-                "start": ("START\t", ProcessStatusUtil.start),
-                "time": ("TIME\t", ProcessStatusUtil.total_time),
-                "cls": ("CLS", ProcessStatusUtil.policy),
-                "cmd": ("Command\t\t\t", ProcessStatusUtil.process_name),
-                "args": ("Command\t\t\t", ProcessStatusUtil.process_name_with_args),
-                "args_last": ("Command\t\t\t", ProcessStatusUtil.process_name_with_args_last),
-                "pid": ("PID\t", ProcessStatusUtil.pid),
-                "ppid": ("PPID\t", ProcessStatusUtil.ppid),
-                "pri": ("PRI", ProcessStatusUtil.priority),
-                "state": ("S", ProcessStatusUtil.s_name),
-                "rss": ("RSS", ProcessStatusUtil.rss),
-                "rtprio": ("RTPRIO", ProcessStatusUtil.priority),
-                "tty": ("TTY\t", ProcessStatusUtil.tty_name),
-                "pname": ("Pname\t\t", ProcessStatusUtil.process_name),
-                "vsize": ("VSZ", ProcessStatusUtil.vsize),
-                "uname": ("USER\t", ProcessStatusUtil.user_name),
-                "uid": ("USER_ID", ProcessStatusUtil.user_id),
-                "wchan": ("WCHAN\t\t\t", ProcessStatusUtil.wchan_s)}
+    def filter_processes(self, rows):
+        # each test is applied to a whole column of the process table
+        options = self.options
+        if not options.filter_flag:
+            return rows
+        if options.username_filter_flag is True and options.filtered_process_user is not None:
+            user = options.filtered_process_user.strip()
+            rows = rows.where('user_name', lambda name: name is not None and name.strip() == user)
+        if options.pid_filter_flag and options.pid_list is not None:
+            pids = set(options.pid_list)
+            rows = rows.where('pid', lambda pid: int(pid) in pids)
+        if options.command_filter_flag is True and options.command_list is not None:
+            commands = options.command_list
+            rows = rows.where('process_name', lambda name: name.strip() in commands)
+        if options.ppid_filter_flag and options.ppid_list is not None:
+            ppids = set(options.ppid_list)
+            rows = rows.where('ppid', lambda ppid: int(ppid) in ppids)
+        return rows
+
+
+PIDINFO_PAIR = {"%cpu": ('%CPU', "system_percent"),
+                "%mem": ('%MEM', "mem"),
+                "start": ("START\t", "start"),
+                "time": ("TIME\t", "total_time"),
+                "cls": ("CLS", "policy"),
+                "cmd": ("Command\t\t\t", "process_name"),
+                "args": ("Command\t\t\t", "process_name_with_args"),
+                "args_last": ("Command\t\t\t", "process_name_with_args_last"),
+                "pid": ("PID\t", "pid"),
+                "ppid": ("PPID\t", "ppid"),
+                "pri": ("PRI", "priority"),
+                "state": ("S", "s_name"),
+                "rss": ("RSS", "rss"),
+                "rtprio": ("RTPRIO", "priority"),
+                "tty": ("TTY\t", "tty_name"),
+                "pname": ("Pname\t\t", "process_name"),
+                "vsize": ("VSZ", "vsize"),
+                "uname": ("USER\t", "user_name"),
+                "uid": ("USER_ID", "user_id"),
+                "wchan": ("WCHAN\t\t\t", "wchan_s")}
 
 
 class ProcessStatus:
@@ -376,12 +178,7 @@ class ProcessStatus:
         self.__metric_repository = metric_repository
 
     def get_processes(self, delta_time):
-        return map(lambda pid:
-                   (ProcessStatusUtil(pid, self.__manager, delta_time, self.__metric_repository)), self.__pids())
-
-    def __pids(self):
-        pid_dict = self.__metric_repository.current_values('proc.psinfo.pid')
-        return sorted(pid_dict.values())
+        return ProcessTable(self.__metric_repository, delta_time, PSSTAT_COLUMNS).rows()
 
 
 class DynamicProcessReporter:
@@ -452,9 +249,9 @@ class DynamicProcessReporter:
                 data_to_print = timestamp + '\t'
                 for key in self.processStatOptions.colum_list:
                     if self._is_last_and_args(key):
-                        data_to_print += str(PIDINFO_PAIR["args_last"][1](process)) + '\t\t'
+                        data_to_print += str(getattr(process, PIDINFO_PAIR["args_last"][1])()) + '\t\t'
                     elif key in PIDINFO_PAIR:
-                        data_to_print += str(PIDINFO_PAIR[key][1](process)) + '\t\t'
+                        data_to_print += str(getattr(process, PIDINFO_PAIR[key][1])()) + '\t\t'
                 print(data_to_print)
 
 
@@ -480,7 +277,7 @@ class ProcessStatusReporter:
             self.printer("Timestamp" + header_indentation + "PID\t\t\tTTY\tTIME\t\tCMD")
             processes = self.process_filter.filter_processes(self.process_report.get_processes(self.delta_time))
             for process in processes:
-                command = process.process_name_with_args(True)
+                command = process.process_name_with_args_last()
                 ttyname = process.tty_name()
                 self.printer("%s%s%s\t\t%s\t%s\t%s" % (timestamp, value_indentation, process.pid(), ttyname,
                                                        process.total_time(), command))
@@ -0,0 +1,95 @@
+#!/usr/bin/env pmpython
+#
+# Copyright (c) 2026 Red Hat.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+#
+
+from mock import Mock
+import unittest
+from pcp_ps import ProcessStatus, ProcessFilter
+
+CURRENT = {
+    'proc.psinfo.pid': {1: 1, 2: 2, 3: 3, 4: 4},
+    'proc.psinfo.ppid': {1: 0, 2: 1, 3: 1, 4: 2},
+    'proc.psinfo.cmd': {1: 'systemd', 2: 'bash', 3: 'pmcd', 4: 'top'},
+    'proc.id.uid_nm': {1: 'root', 2: 'pcp', 3: 'pcp', 4: None},
+}
+
+class MetricRepository(object):
+    def current_values(self, metric):
+        return CURRENT.get(metric)
+
+    def previous_values(self, metric):
+        return None
+
+    def current_value(self, metric, instance):
+        return None
+
+class TestProcessFilter(unittest.TestCase):
+    def setUp(self):
+        self.options = Mock(filter_flag = True,
+                            username_filter_flag = False,
+                            filtered_process_user = None,
+                            pid_filter_flag = False,
+                            pid_list = None,
+                            command_filter_flag = False,
+                            command_list = None,
+                            ppid_filter_flag = False,
+                            ppid_list = None)
+        self.rows = ProcessStatus(None, MetricRepository()).get_processes(1.0)
+
+    def filtered_pids(self):
+        rows = ProcessFilter(self.options).filter_processes(self.rows)
+        return [int(row.pid()) for row in rows]
+
+    def test_all_rows_are_kept_without_filters(self):
+        self.options.filter_flag = False
+        self.options.pid_list = [1]
+
+        self.assertEqual(self.filtered_pids(), [1, 2, 3, 4])
+
+    def test_filter_by_user_name(self):
+        self.options.username_filter_flag = True
+        self.options.filtered_process_user = 'pcp'
+
+        self.assertEqual(self.filtered_pids(), [2, 3])
+
+    def test_filter_by_pid(self):
+        self.options.pid_filter_flag = True
+        self.options.pid_list = [1, 4, 5]
+
+        self.assertEqual(self.filtered_pids(), [1, 4])
+
+    def test_filter_by_command(self):
+        self.options.command_filter_flag = True
+        self.options.command_list = ['pmcd', 'top']
+
+        self.assertEqual(self.filtered_pids(), [3, 4])
+
+    def test_filter_by_ppid(self):
+        self.options.ppid_filter_flag = True
+        self.options.ppid_list = [1]
+
+        self.assertEqual(self.filtered_pids(), [2, 3])
+
+    def test_filters_combine(self):
+        self.options.username_filter_flag = True
+        self.options.filtered_process_user = 'pcp'
+        self.options.ppid_filter_flag = True
+        self.options.ppid_list = [1, 2]
+        self.options.command_filter_flag = True
+        self.options.command_list = ['bash', 'top']
+
+        self.assertEqual(self.filtered_pids(), [2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,59 +14,61 @@
 # for more details.
 #
 
-import mock
+import time
 import unittest
-from pcp_ps import ProcessStatusUtil
-
-
-class TestProcessStackUtil(unittest.TestCase):
+from mock import Mock, MagicMock
+from pcp_ps import ProcessStatus
+
+# pid 1 has current and previous values, pid 2 only current ones
+CURRENT = {
+    'proc.psinfo.pid': {1: 1, 2: 2},
+    'proc.psinfo.ppid': {1: 0, 2: 1},
+    'proc.psinfo.cmd': {1: 'test'},
+    'proc.id.uid': {1: 1},
+    'proc.id.uid_nm': {1: 'test'},
+    'proc.psinfo.psargs': {1: 'test'},
+    'proc.psinfo.vsize': {1: 1},
+    'proc.psinfo.rss': {1: 1},
+    'proc.psinfo.sname': {1: 'R', 2: 'S'},
+    'proc.psinfo.processor': {1: 1},
+    'proc.psinfo.wchan_s': {1: 'test', 2: 'do_wait'},
+    'proc.psinfo.priority': {1: 1},
+    'proc.psinfo.utime': {1: 1340, 2: 1340},
+    'proc.psinfo.guest_time': {1: 0, 2: 0},
+    'proc.psinfo.stime': {1: 3600000, 2: 670},
+    'proc.psinfo.start_time': {1: 1000},
+    'proc.psinfo.ttyname': {1: 'tty'},
+    'proc.psinfo.policy': {1: 1, 2: 9},
+}
+PREVIOUS = {
+    'proc.psinfo.utime': {1: 0},
+    'proc.psinfo.guest_time': {1: 0},
+    'proc.psinfo.stime': {1: 3599330},
+}
+SINGULAR = {'mem.physmem': 1}
+BOOTTIME = 86400 * 365
+
+class MetricRepository(object):
+    def __init__(self):
+        self.group = MagicMock(timestamp=Mock(tv_sec=BOOTTIME + 3600),
+                               contextCache=Mock(pmLocaltime=lambda seconds:
+                                                 Mock(struct_time=lambda: time.gmtime(seconds))))
+        self.group.__getitem__.return_value = Mock(netValues=[(None, None, BOOTTIME)])
+
+    def current_values(self, metric):
+        return CURRENT.get(metric)
+
+    def previous_values(self, metric):
+        return PREVIOUS.get(metric)
+
+    def current_value(self, metric, instance):
+        return SINGULAR.get(metric)
+
+
+class TestProcessStatus(unittest.TestCase):
     def setUp(self):
-        self.__metric_repository = mock.Mock()
-        self.__metric_repository.current_value = mock.Mock(side_effect=self.metric_repo_current_value_side_effect)
-
-    def metric_repo_current_value_side_effect(self, metric_name, instance):
-        if metric_name == 'proc.psinfo.cmd' and instance == 1:
-            return "test"
-        if metric_name == 'proc.id.uid' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.pid' and instance == 1:
-            return 1
-        if metric_name == 'proc.id.uid_nm' and instance == 1:
-            return "test"
-        if metric_name == 'proc.psinfo.cmd' and instance == 1:
-            return "test"
-        if metric_name == 'proc.psinfo.psargs' and instance == 1:
-            return "test"
-        if metric_name == 'proc.psinfo.vsize' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.rss' and instance == 1:
-            return 1
-        if metric_name == 'mem.physmem' and instance is None:
-            return 1
-        if metric_name == 'proc.psinfo.sname' and instance == 1:
-            return 'R'
-        if metric_name == 'proc.psinfo.processor' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.stime' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.wchan_s' and instance == 1:
-            return "test"
-        if metric_name == 'proc.psinfo.priority' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.utime' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.guest_time' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.stime' and instance == 1:
-            return 1
-        if metric_name == 'proc.psinfo.start_time' and instance == 1:
-            return 1
-        if metric_name == 'kernel.all.uptime' and instance is None:
-            return 1
-        if metric_name == 'proc.psinfo.ttyname' and instance == 1:
-            return 'tty'
-        if metric_name == 'proc.psinfo.policy' and instance == 1:
-            return 1
+        rows = ProcessStatus(None, MetricRepository()).get_processes(1.34)
+        self.process, self.other = rows[0], rows[1]
 
     def test_stack_referenced_size(self):
         self.skipTest(reason="Implement when suitable metric is found")
@@ -74,89 +76,75 @@ class TestProcessStackUtil(unittest.TestCase):
     #These are blank spaces in assert case been addded 
     #to match the format of function ouput.please don't remove
     def test_username(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.user_name()
-        self.assertEqual(name, "test      ")
+        self.assertEqual(self.process.user_name(), "test      ")
+        self.assertIsNone(self.other.user_name())
 
-    def test_Processname(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.process_name()
-        self.assertEqual(name, "test                ")
+    def test_process_name(self):
+        self.assertEqual(self.process.process_name(), "test                ")
+        self.assertEqual(self.other.process_name(), "-")
 
     def test_process_name_with_args(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.process_name_with_args()
-        self.assertEqual(name, "test                          ")
+        self.assertEqual(self.process.process_name_with_args(), "test                          ")
 
-    def test_vszie(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        vsize = process_status_usage.vsize()
-        self.assertEqual(vsize, 1)
+    def test_vsize(self):
+        self.assertEqual(self.process.vsize(), 1)
 
     def test_rss(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        vsize = process_status_usage.rss()
-        self.assertEqual(vsize, 1)
+        self.assertEqual(self.process.rss(), 1)
 
     def test_mem(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        vsize = process_status_usage.mem()
-        self.assertEqual(vsize, 100)
+        self.assertEqual(self.process.mem(), 100)
 
     def test_pid(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        pid = process_status_usage.pid()
-        self.assertEqual(pid,'1       ')       
-
-    def test_process_name(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.process_name()
-        self.assertEqual(name, 'test                ')
+        self.assertEqual(self.process.pid(), '1       ')
+        self.assertEqual(self.other.ppid(), '1       ')
 
     def test_user_id(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        user_id = process_status_usage.user_id()
-        self.assertEqual(user_id, 1)
+        self.assertEqual(self.process.user_id(), 1)
 
     def test_s_name(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.s_name()
-        self.assertEqual(name, 'R')
+        self.assertEqual(self.process.s_name(), 'R')
 
     def test_cpu_number(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.cpu_number()
-        self.assertEqual(name, 1)
+        self.assertEqual(self.process.cpu_number(), 1)
 
     def test_wchan_s(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.wchan_s()
-        self.assertEqual(name, 'test                          ')
+        self.assertEqual(self.process.wchan_s(), 'test                          ')
 
     def test_priority(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.priority()
-        self.assertEqual(name, 1)
+        self.assertEqual(self.process.priority(), 1)
+
+    def test_percents(self):
+        self.assertEqual(self.process.user_percent(), 100.0)
+        self.assertEqual(self.process.system_percent(), 50.0)
+        self.assertEqual(self.process.total_percent(), 150.0)
+        self.assertIsNone(self.other.total_percent())
+
+    def test_stime(self):
+        self.assertEqual(self.process.stime(), 670)
+        self.assertEqual(self.other.stime(), '?')
 
     def test_tty_name(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.tty_name()
-        self.assertEqual(name, 'tty')
+        self.assertEqual(self.process.tty_name(), 'tty')
 
     def test_start_time(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.start_time()
-        self.assertEqual(name, 1)
+        self.assertEqual(self.process.start_time(), 1000)
+
+    def test_start(self):
+        self.assertEqual(self.process.start(), '00:00:01')
+        self.assertIsNone(self.other.start())
+
+    def test_total_time(self):
+        self.assertEqual(self.process.total_time(), '01:00:00')
+        self.assertEqual(self.other.total_time(), '00:00:00')
 
     def test_func_state(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.func_state()
-        self.assertEqual(name, 'N/A')
+        self.assertEqual(self.process.func_state(), 'N/A')
+        self.assertEqual(self.other.func_state(), 'do_wait                       ')
 
     def test_policy(self):
-        process_status_usage = ProcessStatusUtil(1, 1.34, self.__metric_repository)
-        name = process_status_usage.policy()
-        self.assertEqual(name, 'FIFO')
+        self.assertEqual(self.process.policy(), 'FIFO')
+        self.assertIsNone(self.other.policy())
 
 
 if __name__ == '__main__':
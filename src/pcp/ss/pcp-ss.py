@@ -1,6 +1,6 @@
 #!/usr/bin/env pmpython
 #
-# Copyright (C) 2021 Red Hat.
+# Copyright (C) 2021,2026 Red Hat.
 #
 # This program is free software; you can redistribute it and/or modify it
 # under the terms of the GNU General Public License as published by the
@@ -18,16 +18,31 @@
 
 """ Display socket statistics """
 
-import os, sys, argparse, errno
+import os, sys, argparse, errno, signal
+from ctypes import POINTER, addressof, c_void_p, cast, create_string_buffer, memmove, string_at
 
 # PCP Python PMAPI
 from pcp import pmapi
-from cpmapi import PM_CONTEXT_ARCHIVE, PM_CONTEXT_HOST
-from cpmapi import PM_ERR_EOL, PM_MODE_INTERP
+from cpmapi import PM_CONTEXT_ARCHIVE, PM_CONTEXT_HOST, PM_CONTEXT_LOCAL
+from cpmapi import PM_ERR_BADSTORE, PM_ERR_EOL, PM_ERR_TOOBIG, PM_ERR_VALUE, PM_MODE_INTERP
+from cpmapi import PM_TYPE_STRING, PM_VAL_DPTR, PM_VAL_HDR_SIZE
 
 # pmns prefix for pmdasockets(1) metrics
 pmns = "network.persocket"
 
+# per-socket metrics (without pmns prefix) needed for the basic report
+# and filtering, and those additionally needed for each output option
+basic_metrics = ["netid", "state", "recvq", "sendq", "src", "dst"]
+option_metrics = {
+    "options": ["timer.str"],
+    "extended": ["uid", "inode", "sk", "cgroup", "v6only"],
+    "memory": ["skmem.str"],
+    "info": ["ts", "sack", "cubic", "wscale.str", "round_trip.str", "ato",
+             "mss", "cwnd", "pmtu", "ssthresh", "bytes_sent", "bytes_acked",
+             "bytes_received", "segs_out", "segs_in", "send", "lastsnd",
+             "lastrcv", "lastack", "pacing_rate", "delivery_rate", "rcv_space"],
+}
+
 def remove_prefix(text, prefix):
     """ remove prefix from text (for python < 3.9) """
     return text[text.startswith(prefix) and len(prefix):]
@@ -47,6 +62,10 @@ class SS(object):
         self.valuesD = {} # { name: {instid: value} }
         self.context = None
         self.pmfg = None
+        self.maxnum = 0 # fetchgroup instances per metric, from the indom
+        self.interval = None
+        self.samples = None
+        self.saved_filter = None
 
     def options(self):
         """ define command line arguments """
@@ -79,6 +98,7 @@ class SS(object):
         #p.add_argument('-x', '--unix', action='store_true', help='display only Unix domain sockets (not implemented)')
         p.add_argument('-H', '--noheader', action='store_true', help='Suppress header line')
         p.add_argument('-O', '--oneline', action='store_true', help='print each socket\'s data on a single line')
+        p.add_argument('filter', nargs='*', help='ss(8) filter expression, applied by the sockets PMDA (live mode only)')
         args = p.parse_args()
 
         # special cases
@@ -101,6 +121,7 @@ class SS(object):
         # source
         pcp_host = os.getenv("PCP_HOST")
         pcp_archive = os.getenv("PCP_ARCHIVE")
+        pcp_localmode = os.getenv("PCP_LOCALMODE")
 
         # time window - only via environment: too many clashes with ss args
         pcp_origin = os.getenv("PCP_ORIGIN_TIME")
@@ -110,11 +131,32 @@ class SS(object):
         pcp_hostzone = os.getenv("PCP_HOSTZONE")
         pcp_debug = os.getenv("PCP_DEBUG")
 
+        # repeating report - only via environment, as for the time window
+        pcp_interval = os.getenv("PCP_INTERVAL")
+        pcp_samples = os.getenv("PCP_SAMPLES")
+        if pcp_interval is not None:
+            try:
+                self.interval = pmapi.pmContext.pmParseInterval(pcp_interval)[0]
+            except pmapi.pmErr as pmerr:
+                sys.stderr.write("Error: invalid interval '%s': %s\n" % (pcp_interval, pmerr.message()))
+                return False
+        if pcp_samples is not None:
+            try:
+                self.samples = int(pcp_samples)
+            except ValueError:
+                sys.stderr.write("Error: invalid sample count '%s'\n" % pcp_samples)
+                return False
+            if self.interval is None:
+                self.interval = pmapi.pmContext.pmParseInterval("1")[0]
+
         if pcp_archive is not None:
             self.context_type = PM_CONTEXT_ARCHIVE
             if pcp_origin is None and pcp_start_time is None:
                 pcp_origin = "-0" # end of archive
             self.source = pcp_archive
+        elif pcp_localmode is not None:
+            self.context_type = PM_CONTEXT_LOCAL
+            self.source = None
         else:
             self.context_type = PM_CONTEXT_HOST
             if pcp_host is not None:
@@ -123,6 +165,9 @@ class SS(object):
                 self.source = "localhost"
 
         try:
+            if self.context_type == PM_CONTEXT_LOCAL:
+                # any namespace and local PMDA table are set from the environment
+                pmapi.pmContext.fromOptions(pmapi.pmOptions("L"), ["pcp-ss"])
             self.pmfg = pmapi.fetchgroup(self.context_type, self.source)
             self.context = self.pmfg.get_context()
             if pcp_archive:
@@ -140,15 +185,15 @@ class SS(object):
                     optargv.append("-O%s" % pcp_origin)
                     pmapi.pmContext.fromOptions(options, optargv)
                     origin = options.pmGetOptionOrigin()
-                    self.context.pmSetMode(PM_MODE_INTERP, origin, None)
+                    self.context.pmSetMode(PM_MODE_INTERP, origin, self.interval)
                 elif pcp_start_time:
                     optargv.append("-S%s" % pcp_start_time)
                     pmapi.pmContext.fromOptions(options, optargv)
                     start = options.pmGetOptionStart()
-                    self.context.pmSetMode(PM_MODE_INTERP, start, None)
+                    self.context.pmSetMode(PM_MODE_INTERP, start, self.interval)
 
         except pmapi.pmErr as pmerr:
-            sys.stderr.write("%s: %s '%s'\n" % (pmerr.progname(), pmerr.message(), self.source))
+            sys.stderr.write("%s: %s '%s'\n" % (pmerr.progname(), pmerr.message(), self.source or "local context"))
             return False
 
         # check network.persocket metrics are available
@@ -157,6 +202,8 @@ class SS(object):
         except Exception:
             if self.context_type == PM_CONTEXT_HOST:
                 msg = "on host %s.\nIs the 'sockets' PMDA installed and enabled? See pmdasockets(1)." % self.source
+            elif self.context_type == PM_CONTEXT_LOCAL:
+                msg = "in local context.\nIs the 'sockets' PMDA available? See pmdasockets(1)."
             else:
                 msg = "in archive %s" % self.source
             print("Error: metrics for '%s' not found %s" % (pmns, msg))
@@ -168,38 +215,156 @@ class SS(object):
         if not name.endswith(".filter"):
             self.metrics.append(name)
 
-    def fetch(self):
-        """ fetch metrics and report as per given options """
+    def needed_metrics(self):
+        """ per-socket metrics needed for filtering and the requested output """
+        names = list(basic_metrics)
+        for option in option_metrics:
+            if getattr(self.args, option):
+                names.extend(option_metrics[option])
+        return names
+
+    def store_filter(self, text):
+        """ store text as the sockets PMDA filter, returning the previous filter """
+        pmids = self.context.pmLookupName(pmns + ".filter")
+        result = self.context.pmFetch(pmids)
+        if result.contents.get_numval(0) != 1 or result.contents.get_valfmt(0) != PM_VAL_DPTR:
+            self.context.pmFreeResult(result)
+            raise pmapi.pmErr(PM_ERR_VALUE)
+        value = result.contents.get_vlist(0, 0).value
+        previous = cast(value.pval, c_void_p).value # address, not a view of the field
+        old = string_at(previous + PM_VAL_HDR_SIZE).decode('utf-8')
+        data = text.encode('utf-8') + b'\0'
+        buf = create_string_buffer(PM_VAL_HDR_SIZE + len(data))
+        block = cast(buf, POINTER(pmapi.pmValueBlock)).contents
+        block.vtype = PM_TYPE_STRING
+        block.vlen = PM_VAL_HDR_SIZE + len(data)
+        memmove(addressof(buf) + PM_VAL_HDR_SIZE, data, len(data))
+        try:
+            value.pval = cast(buf, POINTER(pmapi.pmValueBlock))
+            self.context.pmStore(result)
+        finally:
+            # pmFreeResult must only free the value block it allocated
+            value.pval = cast(c_void_p(previous), POINTER(pmapi.pmValueBlock))
+            self.context.pmFreeResult(result)
+        return old
+
+    def filter_expression(self):
+        """ the filter expression to push down, with -l (or the default of
+            hiding listening sockets) added as its state filter unless -a is
+            given or the expression selects states itself.  The PMDA filter
+            cannot express -t, -u, -4 or -6, these are applied in report().
+        """
+        words = list(self.args.filter)
+        if words[0] not in ("state", "exclude", "excl") and not self.args.all:
+            if self.args.listening:
+                words = ["state", "listening"] + words
+            else:
+                words = ["exclude", "listening"] + words
+        return " ".join(words)
+
+    def push_filter(self):
+        """ push any filter expression down into the sockets PMDA,
+            exiting if it cannot be applied rather than reporting
+            unfiltered sockets
+        """
+        if not self.args.filter:
+            return
+        if self.context_type == PM_CONTEXT_ARCHIVE:
+            sys.stderr.write("Error: filter '%s' cannot be applied in archive mode\n" % " ".join(self.args.filter))
+            sys.exit(1)
+        expression = self.filter_expression()
+        try:
+            self.saved_filter = self.store_filter(expression)
+        except pmapi.pmErr as pmerr:
+            sys.stderr.write("Error: failed to set %s.filter to '%s': %s\n" % (pmns, expression, pmerr.message()))
+            if pmerr.args[0] == PM_ERR_BADSTORE:
+                sys.stderr.write("The sockets PMDA accepts only letters, digits, spaces and parentheses in a filter.\n")
+            sys.exit(1)
+        self.set_signal_handler()
+
+    def set_signal_handler(self):
+        """ restore the sockets PMDA filter when terminated by a signal,
+            as it applies to all clients of the PMDA, not just pcp-ss
+        """
+        def handler(_signum, _frame):
+            """ restore filter and exit """
+            self.restore_filter()
+            sys.exit(0)
+        for sig in "SIGHUP", "SIGTERM":
+            try:
+                signum = getattr(signal, sig)
+                signal.signal(signum, handler)
+            except Exception:
+                pass
+
+    def restore_filter(self):
+        """ restore the sockets PMDA filter changed by push_filter, if any """
+        if self.saved_filter is not None:
+            try:
+                self.store_filter(self.saved_filter)
+            except pmapi.pmErr as pmerr:
+                sys.stderr.write("Warning: failed to restore %s.filter to '%s': %s\n" % (pmns, self.saved_filter, pmerr.message()))
+            self.saved_filter = None
+
+    def indom_size(self, desc):
+        """ current number of instances in the sockets instance domain """
+        try:
+            return len(self.context.pmGetInDom(desc)[0])
+        except pmapi.pmErr:
+            return 0
+
+    def setup(self):
+        """ (re)build the fetchgroup for the metrics needed, sized to the indom """
+        self.pmfg.clear()
+        self.metricsD = {}
 
         # filter and timestamp
         self.filter = self.pmfg.extend_item(pmns + ".filter")
         self.timestamp = self.pmfg.extend_timestamp()
 
-        self.context.pmTraversePMNS(pmns, self.traverseCB)
-        self.pmids = self.context.pmLookupName(self.metrics)
-        descs = self.context.pmLookupDescs(self.pmids)
-
-        # Create metrics dict keyed by metric name (without pmns prefix).
-        nmetrics = len(self.metrics)
-        for i in range (0, nmetrics):
-            pmnsname = self.metrics[i]
-            name = remove_prefix(pmnsname, pmns + ".")
+        for name in self.descsD:
             try:
                 # do not want rate conversion, so use "instant" scale and only one fetch
-                self.descsD[name] = descs[i]
-                self.metricsD[name] = self.pmfg.extend_indom(pmnsname,
-                    descs[i].contents.type, scale="instant", maxnum=10000)
+                self.metricsD[name] = self.pmfg.extend_indom(pmns + "." + name,
+                    self.descsD[name].contents.type, scale="instant", maxnum=self.maxnum)
             except Exception as e:
                 print("Warning: Failed to add %s to fetch group: %s" % (name, e))
 
-        # fetch the lot
-        try:
-            self.pmfg.fetch()
-        except Exception as e:
-            print("Error: fetch failed: %s" % e)
-            sys.exit(1)
+    def prepare(self):
+        """ lookup the metrics needed for the requested report, and set up fetching """
+        self.context.pmTraversePMNS(pmns, self.traverseCB)
+        available = [remove_prefix(name, pmns + ".") for name in self.metrics]
+        names = [name for name in self.needed_metrics() if name in available]
+        self.pmids = self.context.pmLookupName([pmns + "." + name for name in names])
+        descs = self.context.pmLookupDescs(self.pmids)
+
+        # Create descs dict keyed by metric name (without pmns prefix).
+        for i, name in enumerate(names):
+            self.descsD[name] = descs[i]
+
+        # allow for some growth in the number of sockets before refetching
+        size = self.indom_size(descs[0]) if descs else 0
+        self.maxnum = max(size + size // 4, 256)
+        self.setup()
+
+    def fetch(self):
+        """ fetch metrics, growing the fetchgroup if there are more sockets """
+        while True:
+            try:
+                self.pmfg.fetch()
+            except pmapi.pmErr as e:
+                if e.args[0] == PM_ERR_EOL:
+                    raise
+                print("Error: fetch failed: %s" % e)
+                sys.exit(1)
+            if not [v for v in self.metricsD.values() if v.sts.value == PM_ERR_TOOBIG]:
+                break
+            self.maxnum *= 2
+            self.setup()
 
         # extract instances and values
+        self.instD = {}
+        self.valuesD = {}
         for name in self.metricsD:
             try:
                 instvalsD = {}
@@ -214,6 +379,24 @@ class SS(object):
             except Exception as e:
                 pass # instance went away, socket probably closed
 
+    def run(self):
+        """ report once, or repeatedly at the given interval """
+        self.prepare()
+        self.push_filter()
+        try:
+            sample = 0
+            while True:
+                self.fetch()
+                self.report()
+                sample += 1
+                if self.interval is None or (self.samples is not None and sample >= self.samples):
+                    break
+                sys.stdout.flush()
+                if self.context_type != PM_CONTEXT_ARCHIVE:
+                    self.interval.sleep()
+        finally:
+            self.restore_filter()
+
     def strfield(self, fmt, metric, inst, default=""):
         """ return formatted field, if metric and inst are available else default string """
         try:
@@ -370,8 +553,7 @@ if __name__ == '__main__':
         if not ss.connect():
             # failed to connect or metrics not found - error already reported.
             sys.exit(1)
-        ss.fetch()
-        ss.report()
+        ss.run()
     except pmapi.pmErr as error:
         if error.args[0] == PM_ERR_EOL:
             sys.exit(0)
@@ -1,6 +1,6 @@
 #!/usr/bin/env pmpython
 #
-# Copyright (C) 2015 Red Hat.
+# Copyright (C) 2015,2026 Red Hat.
 #
 # This program is free software; you can redistribute it and/or modify it
 # under the terms of the GNU General Public License as published by the
@@ -16,8 +16,11 @@
 """ Verify various aspects of a PCP collector installation """
 
 import sys
+import math
+import time
+from ctypes import c_uint
 from pcp import pmapi, pmcc
-from cpmapi import PM_CONTEXT_ARCHIVE, PM_MODE_FORW
+from cpmapi import PM_CONTEXT_ARCHIVE, PM_MODE_FORW, PM_ID_NULL, PM_OPTFLAG_MULTI
 
 STATUS = 0	# exit code indicating success/failure
 
@@ -37,6 +40,11 @@ class Verifier(pmcc.MetricGroupPrinter):
     def current(self, group, metric):
         return dict(map(lambda x: (x[1], x[2]), group[metric].netValues))
 
+    """ Name the host or archive being checked, when there are several """
+    def heading(self, manager):
+        if len(manager.hosts) > 1:
+            print('== INFO: verifying %s' % manager.source)
+
 
 class BasicReport(Verifier):
     """ Verifies high-level issues for a PCP collector """
@@ -44,6 +52,7 @@ class BasicReport(Verifier):
 
     def report(self, manager):
         global STATUS
+        self.heading(manager)
         group = manager[self._name]
         status = self.current(group, 'pmcd.agent.status')
         for pmda in sorted(status):
@@ -71,6 +80,7 @@ class SecureReport(Verifier):
 
     def report(self, manager):
         global STATUS
+        self.heading(manager)
         group = manager[self._name]
         status = self.current(group, 'pmcd.feature.secure')
         if status[''] != 1:
@@ -93,6 +103,7 @@ class ContainersReport(Verifier):
 
     def report(self, manager):
         global STATUS
+        self.heading(manager)
         group = manager[self._name]
         pmdas = self.current(group, 'pmcd.agent.status')
         if 'linux' not in pmdas:
@@ -137,16 +148,162 @@ class ContainersReport(Verifier):
             print('** DEBUG: completed containers verification')
 
 
+class PerformanceReport(Verifier):
+    """ Verifies fetch latency of each agent and pmlogger sampling lag """
+    _metrics = [ 'pmcd.agent.status', 'pmcd.control.timeout',
+                 'pmcd.pmlogger.archive' ]
+    _repeat = 10	# timed fetches per agent
+    _limit = 50	# percentage of pmcd.control.timeout
+    _lag = 120	# maximum seconds since pmlogger last wrote
+    _permetric = 16	# representative metrics fetched per agent
+
+    def setup(self, manager, name, verbose):
+        if manager.type == PM_CONTEXT_ARCHIVE:	# checks need live pmcd
+            self._metrics = BasicReport._metrics
+        return Verifier.setup(self, manager, name, verbose)
+
+    def thresholds(self, repeat, limit, lag):
+        self._repeat = repeat
+        self._limit = limit
+        self._lag = lag
+        return self
+
+    @staticmethod
+    def percentile(values, percent):
+        """ Nearest-rank percentile of a sorted list of values """
+        rank = int(math.ceil(percent / 100.0 * len(values)))
+        return values[max(rank, 1) - 1]
+
+    def agents(self, group):
+        """ Map domain numbers of the running agents to their names """
+        agents = {}
+        for inst, name, status in group['pmcd.agent.status'].netValues:
+            if status & 0xff == 0:
+                agents[inst.inst] = name
+        return agents
+
+    def representatives(self, manager, agents):
+        """ Choose the first few metrics of each agent in the namespace """
+        # walk one top-level subtree at a time, those named after an agent
+        # first, until every agent has metrics chosen from some subtree
+        tops = manager.pmGetChildren('') or []
+        names = set(agents.values())
+        tops = [top for top in tops if top in names] + \
+               [top for top in tops if top not in names]
+        chosen = {}
+        for top in tops:
+            if len(chosen) == len(agents):
+                break
+            subtree = []
+            manager.pmTraversePMNS(top, subtree.append)
+            for pmid in manager.pmLookupName(subtree, relaxed=1):
+                if pmid == PM_ID_NULL:
+                    continue
+                domain = manager.pmID_domain(pmid)
+                if domain not in agents:
+                    continue
+                metrics = chosen.setdefault(domain, [])
+                if len(metrics) < self._permetric and pmid not in metrics:
+                    metrics.append(pmid)
+        return chosen
+
+    def latencies(self, manager, pmids):
+        """ Time repeated fetches of a set of metrics, in milliseconds """
+        pmidA = (c_uint * len(pmids))(*pmids)
+        times = []
+        for _ in range(self._repeat):
+            start = time.time()
+            result = manager.pmFetch(pmidA)
+            times.append((time.time() - start) * 1000.0)
+            try:	# agent errors (timeout, not ready) come back per-metric
+                for i in range(result.contents.numpmid):
+                    if result.contents.get_numval(i) < 0:
+                        raise pmapi.pmErr(result.contents.get_numval(i))
+            finally:
+                manager.pmFreeResult(result)
+        return sorted(times)
+
+    def fetches(self, manager, group):
+        """ Report fetch latency percentiles per agent (PMDA) """
+        global STATUS
+        timeout = group['pmcd.control.timeout'].netValues[0][2] * 1000.0
+        agents = self.agents(group)
+        chosen = self.representatives(manager, agents)
+        print('%-16s %6s %7s %9s %9s %9s %8s' % ('Agent', 'Domain', 'Metrics',
+              'p50 ms', 'p95 ms', 'max ms', 'Timeout%'))
+        for domain in sorted(chosen, key=lambda d: agents[d]):
+            pmda = agents[domain]
+            try:
+                times = self.latencies(manager, chosen[domain])
+            except pmapi.pmErr as error:
+                print('== FAIL: the pmda%s(1) fetch failed: %s' % (pmda, error.message()))
+                STATUS = 2
+                continue
+            worst = times[-1]
+            proximity = 100.0 * worst / timeout if timeout else 0.0
+            print('%-16s %6d %7d %9.3f %9.3f %9.3f %8.1f' % (pmda, domain,
+                  len(chosen[domain]), self.percentile(times, 50),
+                  self.percentile(times, 95), worst, proximity))
+            if timeout and worst >= timeout:
+                print('== FAIL: the pmda%s(1) took %.3f msec, beyond the pmcd timeout.' % (pmda, worst))
+                STATUS = 2
+            elif timeout and proximity >= self._limit:
+                print('== WARN: the pmda%s(1) took %.3f msec, %.0f%% of the pmcd timeout.' %
+                      (pmda, worst, proximity))
+                STATUS = max(STATUS, 1)
+        if self._verbose:
+            print('** DEBUG: timed %d fetches of %d agents, pmcd timeout %.0f msec' %
+                  (self._repeat, len(chosen), timeout))
+
+    def loggers(self, manager, group):
+        """ Report pmlogger sampling lag from the end of each archive """
+        global STATUS
+        now = float(group.timestamp)
+        for inst, name, archive in group['pmcd.pmlogger.archive'].netValues:
+            if inst.inst == 0:	# "primary" duplicates its pid instance
+                continue
+            try:
+                context = pmapi.pmContext(PM_CONTEXT_ARCHIVE, archive)
+                end = context.pmGetArchiveEnd()
+            except pmapi.pmErr as error:
+                print('== INFO: pmlogger(1) archive %s is not accessible: %s' %
+                      (archive, error.message()))
+                continue
+            lag = now - (end.tv_sec + end.tv_nsec / 1000000000.0)
+            if self._verbose:
+                print('** DEBUG: pmlogger(1) pid %s lags %.1f sec, archive %s' %
+                      (name, lag, archive))
+            if lag > self._lag:
+                print('== FAIL: pmlogger(1) pid %s last wrote %.0f sec ago (limit %d).' %
+                      (name, lag, self._lag))
+                print('\tCheck pmlogger_check(1) and %s/pmlogger logs.' %
+                      manager.pmGetConfig('PCP_LOG_DIR'))
+                STATUS = 2
+
+    def report(self, manager):
+        self.heading(manager)
+        group = manager[self._name]
+        if manager.type == PM_CONTEXT_ARCHIVE:
+            print('== INFO: performance checks need a live pmcd(1) connection.')
+            return
+        self.fetches(manager, group)
+        self.loggers(manager, group)
+        if self._verbose:
+            print('** DEBUG: completed performance verification')
+
+
 class VerifyOptions(pmapi.pmOptions):
     def __init__(self):
-        pmapi.pmOptions.__init__(self, "a:csD:h:vV?")
+        pmapi.pmOptions.__init__(self, "a:csD:h:H:l:Pr:vVw:?")
         self._mode = PM_MODE_FORW
         self.pmSetOptionSamples('1')	# one-shot
+        self.pmSetOptionFlags(PM_OPTFLAG_MULTI)	# one or more hosts
         self.pmSetOptionCallback(self.option)
         self.pmSetOverrideCallback(self.override)
         self.pmSetLongOptionHeader('General Options')
         self.pmSetLongOptionDebug()
         self.pmSetLongOptionHost()
+        self.pmSetLongOptionHostsFile()
         self.pmSetLongOptionArchive()
         self.pmSetLongOptionVersion()
         self.pmSetLongOption("verbose", 0, 'v', '', "increase check verbosity")
@@ -154,8 +311,16 @@ class VerifyOptions(pmapi.pmOptions):
         self.pmSetLongOptionHeader('Verification Modes')
         self.pmSetLongOption("containers", 0, 'c', '', "check containers setup")
         self.pmSetLongOption("secure", 0, 's', '', "check secure connections setup")
+        self.pmSetLongOption("performance", 0, 'P', '', "check agent fetch latency and pmlogger lag")
+        self.pmSetLongOptionHeader('Performance Options')
+        self.pmSetLongOption("repeat", 1, 'r', 'N', "timed fetches per agent (default 10)")
+        self.pmSetLongOption("limit", 1, 'l', 'PERCENT', "flag agents above this percentage of the pmcd timeout (default 50)")
+        self.pmSetLongOption("lag", 1, 'w', 'SECONDS', "flag pmloggers that have not written for longer (default 120)")
         self.verify = 'basic'	# default, basic verification checks
         self.verbose = 0	# be quiet by default
+        self.repeat = 10
+        self.limit = 50
+        self.lag = 120
 
     def override(self, opt):
         """ Override any few standard PCP options we use here """
@@ -170,8 +335,24 @@ class VerifyOptions(pmapi.pmOptions):
             self.verify = 'containers'
         elif opt == 's':
             self.verify = 'secure'
+        elif opt == 'P':
+            self.verify = 'performance'
         elif opt == 'v':
             self.verbose = 1
+        else:
+            try:
+                value = int(optarg)
+                if value <= 0:
+                    raise ValueError(optarg)
+            except ValueError:
+                sys.stderr.write('Invalid -%s argument "%s", expected a positive integer\n' % (opt, optarg))
+                sys.exit(1)
+            if opt == 'r':
+                self.repeat = value
+            elif opt == 'l':
+                self.limit = value
+            elif opt == 'w':
+                self.lag = value
 
 if __name__ == '__main__':
     try:
@@ -183,6 +364,9 @@ if __name__ == '__main__':
             manager.printer = ContainersReport().setup(manager, report, verbose)
         elif report == 'secure':
             manager.printer = SecureReport().setup(manager, report, verbose)
+        elif report == 'performance':
+            performance = PerformanceReport().setup(manager, report, verbose)
+            manager.printer = performance.thresholds(options.repeat, options.limit, options.lag)
         else:
             manager.printer = BasicReport().setup(manager, report, verbose)
         sts = manager.run() 
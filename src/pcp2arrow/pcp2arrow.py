@@ -246,6 +246,9 @@ class PCP2ARROW(object):
         if self.check == 1:
             return
 
+        # Align poll interval to host clock
+        self.pmconfig.align()
+
         # Main loop
         refresh_metrics = 0
         while self.samples != 0:
@@ -23,7 +23,6 @@
 from collections import OrderedDict
 import errno
 import math
-import time
 import sys
 
 # Our imports
@@ -369,9 +368,7 @@ class pcp2elasticsearch(object):
             self.opts.daemonize()
 
         # Align poll interval to host clock
-        if self.context.type != PM_CONTEXT_ARCHIVE and self.opts.pmGetOptionAlignment():
-            align = float(self.opts.pmGetOptionAlignment()) - (time.time() % float(self.opts.pmGetOptionAlignment()))
-            time.sleep(align)
+        self.pmconfig.align()
 
         # Main loop
         refresh_metrics = 0
@@ -23,9 +23,8 @@
 """ PCP to Graphite Bridge """
 
 # Common imports
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import errno
-import time
 import sys
 
 # Our imports
@@ -35,6 +34,7 @@ except ImportError:
     import pickle
 import struct
 import socket
+import os
 import re
 
 # PCP Python PMAPI
@@ -50,6 +50,8 @@ CONFVER = 1
 SERVER = "localhost"
 PORT = 2004
 PREFIX = "pcp."
+SPOOL = 0
+CACHE_SIZE = 100000
 
 class PCP2Graphite(object):
     """ PCP to Graphite """
@@ -69,7 +71,7 @@ class PCP2Graphite(object):
                      'type_prefer', 'precision_force', 'limit_filter', 'limit_filter_force',
                      'live_filter', 'rank', 'invert_filter', 'predicate', 'names_change',
                      'speclocal', 'instances', 'ignore_incompat', 'ignore_unknown',
-                     'omit_flat')
+                     'omit_flat', 'spool_size', 'spool_file')
 
         # Ignored for pmrep(1) compatibility
         self.keys_ignore = (
@@ -124,10 +126,16 @@ class PCP2Graphite(object):
         self.pickle = 1
         self.pickle_protocol = 0
         self.prefix = PREFIX
+        self.spool_size = SPOOL
+        self.spool_file = None
 
         # Internal
         self.runtime = -1
         self.socket = None
+        self.spool = None
+
+        # Sanitized metric paths per metric instance
+        self.paths = {}
 
         # Performance metrics store
         # key - metric name
@@ -203,6 +211,8 @@ class PCP2Graphite(object):
         opts.pmSetLongOption("pickle-protocol", 1, "X", "PROTOCOL", "pickle protocol version (default: 0)")
         opts.pmSetLongOption("text-port", 1, "E", "TEXT-PORT", "Graphite plaintext port (usually: 2003)")
         opts.pmSetLongOption("prefix", 1, "x", "PREFIX", "prefix for metric names (default: " + PREFIX + ")")
+        opts.pmSetLongOption("spool-size", 1, "", "COUNT", "samples to keep for resending (default: " + str(SPOOL) + ")")
+        opts.pmSetLongOption("spool-file", 1, "", "FILE", "file to keep unsent samples in over restarts")
 
         return opts
 
@@ -297,6 +307,10 @@ class PCP2Graphite(object):
             self.pickle = 0
         elif opt == 'x':
             self.prefix = optarg
+        elif opt == 'spool-size':
+            self.spool_size = int(optarg)
+        elif opt == 'spool-file':
+            self.spool_file = optarg
         else:
             raise pmapi.pmUsageErr()
 
@@ -321,6 +335,18 @@ class PCP2Graphite(object):
         self.pmconfig.validate_metrics(curr_insts=not self.live_filter)
         self.pmconfig.finalize_options()
 
+        try:
+            self.spool_size = int(self.spool_size)
+            if self.spool_size < 0:
+                raise ValueError
+        except ValueError:
+            sys.stderr.write("Invalid spool size '%s' specified.\n" % self.spool_size)
+            sys.exit(1)
+
+        self.spool = deque(maxlen=self.spool_size)
+        if self.spool_size and self.spool_file:
+            self.read_spool()
+
     def execute(self):
         """ Fetch and report """
         # Debug
@@ -350,9 +376,7 @@ class PCP2Graphite(object):
             self.opts.daemonize()
 
         # Align poll interval to host clock
-        if self.context.type != PM_CONTEXT_ARCHIVE and self.opts.pmGetOptionAlignment():
-            align = float(self.opts.pmGetOptionAlignment()) - (time.time() % float(self.opts.pmGetOptionAlignment()))
-            time.sleep(align)
+        self.pmconfig.align()
 
         # Main loop
         refresh_metrics = 0
@@ -399,59 +423,121 @@ class PCP2Graphite(object):
         else:
             sys.stdout.write("...\n(Ctrl-C to stop)\n")
 
+    def metric_path(self, metric, name):
+        """ Get sanitized Carbon/Graphite path for metric instance """
+        key = (metric, name)
+        if key not in self.paths:
+            path = self.prefix + metric
+            if name:
+                path += "._" + re.sub('[^a-zA-Z_0-9-]', '_', name)
+            # Avoid unbounded growth with short-lived instances
+            if len(self.paths) >= CACHE_SIZE:
+                self.paths.clear()
+            self.paths[key] = path
+        return self.paths[key]
+
     def write_graphite(self, timestamp):
         """ Write (send) metrics to a Graphite host """
         if timestamp is None:
             # Silent goodbye, close in finalize()
             return
 
-        def sanitize_name_indom(string):
-            """ Sanitize the instance domain string for Carbon/Graphite """
-            return "_" + re.sub('[^a-zA-Z_0-9-]', '_', string)
-
         results = self.pmconfig.get_ranked_results(valid_only=True)
 
-        # Prepare data for easier processing below
-        miv_tuples = []
-        for metric in results:
-            for _, name, value in results[metric]:
-                key = self.prefix + metric
-                if name:
-                    key += "." + sanitize_name_indom(name)
-                value = round(value, self.metrics[metric][6]) if isinstance(value, float) else value
-                miv_tuples.append((key, value))
-
-        ts = self.context.datetime_to_secs(self.pmfg_ts(), PM_TIME_SEC)
-
+        ts = int(self.context.datetime_to_secs(self.pmfg_ts(), PM_TIME_SEC))
+
+        # Assemble one message per sample
+        if self.pickle:
+            pickled_input = []
+            for metric in results:
+                precision = self.metrics[metric][6]
+                for _, name, value in results[metric]:
+                    value = round(value, precision) if isinstance(value, float) else value
+                    pickled_input.append((self.metric_path(metric, name), (ts, value)))
+            pickled_output = pickle.dumps(pickled_input, protocol=self.pickle_protocol)
+            header = struct.pack("!L", len(pickled_output))
+            msg = header + pickled_output
+            if self.context.pmDebug("appl0"):
+                print("Sending %s #tuples %d" % (timestamp, len(pickled_input)))
+        else:
+            lines = []
+            suffix = " %d\n" % ts
+            for metric in results:
+                precision = self.metrics[metric][6]
+                for _, name, value in results[metric]:
+                    value = round(value, precision) if isinstance(value, float) else value
+                    lines.append(self.metric_path(metric, name) + " " + str(value) + suffix)
+            msg = "".join(lines).encode()
+            if self.context.pmDebug("appl0"):
+                for line in lines:
+                    print("Sending %s: %s" % (timestamp, line.rstrip()))
+
+        self.send_graphite(msg)
+
+    def send_graphite(self, msg):
+        """ Send message to a Graphite host, replaying spooled messages first """
         try:
             if self.socket is None:
                 self.socket = socket.create_connection((self.graphite_host,
                                                         self.graphite_port))
 
-            if self.pickle:
-                pickled_input = []
-                for metric, value in miv_tuples:
-                    pickled_input.append((metric, (int(ts), value)))
-                pickled_output = pickle.dumps(pickled_input, protocol=self.pickle_protocol)
-                header = struct.pack("!L", len(pickled_output))
-                msg = header + pickled_output
-                if self.context.pmDebug("appl0"):
-                    print("Sending %s #tuples %d" % (timestamp, len(pickled_input)))
-                self.socket.send(msg) # pylint: disable=no-member
-            else:
-                for metric, value in miv_tuples:
-                    message = "%s %s %s\n" % (metric, value, int(ts))
-                    msg = message.encode()
-                    if self.context.pmDebug("appl0"):
-                        print("Sending %s: %s" % (timestamp, msg.rstrip().decode()))
-                    self.socket.send(msg) # pylint: disable=no-member
+            while self.spool:
+                self.socket.sendall(self.spool[0]) # pylint: disable=no-member
+                self.spool.popleft()
+
+            self.socket.sendall(msg) # pylint: disable=no-member
         except socket.error as send_error:
-            sys.stderr.write("Can't send message to Graphite server %s:%d, %s, continuing.\n" %
-                             (self.graphite_host, self.graphite_port, send_error.strerror))
+            if self.spool_size:
+                self.spool.append(msg)
+                spooled = " (%d samples spooled)" % len(self.spool)
+            else:
+                spooled = ""
+            sys.stderr.write("Can't send message to Graphite server %s:%d, %s, continuing%s.\n" %
+                             (self.graphite_host, self.graphite_port, send_error.strerror, spooled))
+            if self.socket:
+                try:
+                    self.socket.close()
+                except socket.error:
+                    pass
             self.socket = None
 
+    def read_spool(self):
+        """ Read unsent messages from spool file """
+        try:
+            with open(self.spool_file, 'rb') as f:
+                data = f.read()
+        except IOError as error:
+            if error.errno != errno.ENOENT:
+                sys.stderr.write("Can't read spool file %s: %s.\n" % (self.spool_file, error.strerror))
+            return
+
+        offset = 0
+        while offset + 4 <= len(data):
+            length = struct.unpack("!L", data[offset:offset+4])[0]
+            offset += 4
+            self.spool.append(data[offset:offset+length])
+            offset += length
+
+    def write_spool(self):
+        """ Write unsent messages to spool file """
+        try:
+            if not self.spool:
+                if os.path.exists(self.spool_file):
+                    os.unlink(self.spool_file)
+                return
+            tmp = self.spool_file + ".tmp"
+            with open(tmp, 'wb') as f:
+                for msg in self.spool:
+                    f.write(struct.pack("!L", len(msg)))
+                    f.write(msg)
+            os.rename(tmp, self.spool_file)
+        except (IOError, OSError) as error:
+            sys.stderr.write("Can't write spool file %s: %s.\n" % (self.spool_file, error.strerror))
+
     def finalize(self):
         """ Finalize and clean up """
+        if self.spool_size and self.spool_file and self.spool is not None:
+            self.write_spool()
         if self.socket:
             try:
                 self.socket.close()
@@ -29,6 +29,7 @@ import time
 import sys
 
 # Our imports
+import gzip
 import re
 import requests
 
@@ -44,6 +45,10 @@ CONFVER = 1
 TIMEOUT = 2.5 # seconds
 SERVER = "http://127.0.0.1:8086"
 DB = "pcp"
+BATCH = 1
+RETRIES = 3
+BACKOFF = 0.5 # seconds
+CACHE_SIZE = 100000
 
 class Metric(object):
     """ A wrapper around metrics, due to InfluxDB's non-hierarchical way of
@@ -65,8 +70,8 @@ class Metric(object):
     This class deals with this format.
     """
 
-    def __init__(self, name):
-        self.name = self.sanitize_name(name)
+    def __init__(self, name, sanitize=True):
+        self.name = self.sanitize_name(name) if sanitize else name
         self.fields = {}
         self.tags = None
         self.ts = None
@@ -165,7 +170,7 @@ class PCP2InfluxDB(object):
                      'type_prefer', 'precision_force', 'limit_filter', 'limit_filter_force',
                      'live_filter', 'rank', 'invert_filter', 'predicate', 'names_change',
                      'speclocal', 'instances', 'ignore_incompat', 'ignore_unknown',
-                     'omit_flat')
+                     'omit_flat', 'influx_batch', 'influx_gzip', 'influx_retries')
 
         # Ignored for pmrep(1) compatibility
         self.keys_ignore = (
@@ -221,9 +226,18 @@ class PCP2InfluxDB(object):
         self.influx_user = None
         self.influx_pass = None
         self.influx_tags = ""
+        self.influx_batch = BATCH
+        self.influx_gzip = 0
+        self.influx_retries = RETRIES
 
         # Internal
         self.runtime = -1
+        self.session = None
+        self.batch = []
+
+        # Sanitized measurement and field names
+        self.names = {}
+        self.fields = {}
 
         # Performance metrics store
         # key - metric name
@@ -299,6 +313,9 @@ class PCP2InfluxDB(object):
         opts.pmSetLongOption("db-user", 1, "U", "USERNAME", "username for database")
         opts.pmSetLongOption("db-pass", 1, "E", "PASSWORD", "password for database")
         opts.pmSetLongOption("db-tags", 1, "X", "TAGS", "string of tags to add to metrics")
+        opts.pmSetLongOption("db-batch", 1, "", "COUNT", "samples to send per request (default: " + str(BATCH) + ")")
+        opts.pmSetLongOption("db-gzip", 0, "", "", "compress requests with gzip")
+        opts.pmSetLongOption("db-retries", 1, "", "COUNT", "retries on server errors (default: " + str(RETRIES) + ")")
 
         return opts
 
@@ -390,6 +407,12 @@ class PCP2InfluxDB(object):
             self.influx_pass = optarg
         elif opt == 'X':
             self.influx_tags = optarg
+        elif opt == 'db-batch':
+            self.influx_batch = optarg
+        elif opt == 'db-gzip':
+            self.influx_gzip = 1
+        elif opt == 'db-retries':
+            self.influx_retries = optarg
         else:
             raise pmapi.pmUsageErr()
 
@@ -414,6 +437,23 @@ class PCP2InfluxDB(object):
         self.pmconfig.validate_metrics(curr_insts=not self.live_filter)
         self.pmconfig.finalize_options()
 
+        for key in ('influx_batch', 'influx_retries'):
+            try:
+                setattr(self, key, int(getattr(self, key)))
+                if getattr(self, key) < (1 if key == 'influx_batch' else 0):
+                    raise ValueError
+            except ValueError:
+                sys.stderr.write("Error while reading option %s: Invalid value '%s'.\n" % (key, getattr(self, key)))
+                sys.exit(1)
+
+        # Reuse connections to the server over samples
+        self.session = requests.Session()
+        if self.influx_user and self.influx_pass:
+            self.session.auth = requests.auth.HTTPBasicAuth(self.influx_user,
+                                                            self.influx_pass)
+        if self.influx_gzip:
+            self.session.headers['Content-Encoding'] = 'gzip'
+
     def execute(self):
         """ Fetch and report """
         # Debug
@@ -443,9 +483,7 @@ class PCP2InfluxDB(object):
             self.opts.daemonize()
 
         # Align poll interval to host clock
-        if self.context.type != PM_CONTEXT_ARCHIVE and self.opts.pmGetOptionAlignment():
-            align = float(self.opts.pmGetOptionAlignment()) - (time.time() % float(self.opts.pmGetOptionAlignment()))
-            time.sleep(align)
+        self.pmconfig.align()
 
         # Main loop
         refresh_metrics = 0
@@ -493,78 +531,112 @@ class PCP2InfluxDB(object):
         else:
             sys.stdout.write("...\n(Ctrl-C to stop)\n")
 
+    def sanitize_metric(self, metric):
+        """ Get cached measurement name for metric """
+        if metric not in self.names:
+            self.names[metric] = Metric(metric).name
+        return self.names[metric]
+
+    def sanitize_field(self, name):
+        """ Get cached field name for instance """
+        if name not in self.fields:
+            # Avoid unbounded growth with short-lived instances
+            if len(self.fields) >= CACHE_SIZE:
+                self.fields.clear()
+            self.fields[name] = "_" + re.sub('[^a-zA-Z_0-9-]', '_', name) if name else "value"
+        return self.fields[name]
+
     def write_influxdb(self, timestamp):
         """ Write (send) metrics to InfluxDB """
         if timestamp is None:
-            # Silent goodbye
+            # Flush any remaining batched samples on goodbye
+            if self.batch:
+                self.send_influxdb()
             return
 
-        def sanitize_name_indom(string):
-            """ Sanitize instance domain string for InfluxDB """
-            return "_" + re.sub('[^a-zA-Z_0-9-]', '_', string)
-
         results = self.pmconfig.get_ranked_results(valid_only=True)
 
-        # Prepare data for easier processing below
-        metrics = []
+        ts = int(self.context.datetime_to_secs(self.pmfg_ts(), PM_TIME_NSEC))
+
+        body = WriteBody()
+
         for metric in results:
-            tmp = Metric(metric)
+            tmp = Metric(self.sanitize_metric(metric), False)
+            precision = self.metrics[metric][6]
             for _, name, value in results[metric]:
-                suffix = sanitize_name_indom(name) if name else "value"
-                value = round(value, self.metrics[metric][6]) if isinstance(value, float) else value
-                tmp.add_field(suffix, value)
-            metrics.append(tmp)
+                value = round(value, precision) if isinstance(value, float) else value
+                tmp.add_field(self.sanitize_field(name), value)
+            tmp.set_tag_string(self.influx_tags)
+            tmp.set_timestamp(ts)
+            body.add(tmp)
 
-        ts = self.context.datetime_to_secs(self.pmfg_ts(), PM_TIME_NSEC)
+        try:
+            self.batch.append(str(body))
+        except ValueError:
+            sys.stderr.write("Can't send request that has no metrics.\n")
+            return
 
-        body = WriteBody()
+        if len(self.batch) >= self.influx_batch:
+            self.send_influxdb()
 
-        for metric in metrics:
-            metric.set_tag_string(self.influx_tags)
-            metric.set_timestamp(int(ts))
-            body.add(metric)
+    def send_influxdb(self):
+        """ Send batched samples to InfluxDB, retrying on server errors """
+        body = "\n".join(self.batch)
+        self.batch = []
 
         url = self.influx_server + '/write'
         params = {'db': self.influx_db}
-        auth = None
-
-        if self.influx_user and self.influx_pass:
-            auth = requests.auth.HTTPBasicAuth(self.influx_user,
-                                               self.influx_pass)
+        data = body.encode()
+        if self.influx_gzip:
+            data = gzip.compress(data)
+
+        res = None
+        for attempt in range(self.influx_retries + 1):
+            if attempt:
+                time.sleep(BACKOFF * 2 ** (attempt - 1))
+            try:
+                res = self.session.post(url, params=params, data=data,
+                                        timeout=self.influx_timeout)
+                if res.status_code < 500:
+                    break
+            except requests.exceptions.Timeout as post_error:
+                res = None
+                if attempt == self.influx_retries:
+                    sys.stderr.write("Timeout sending to InfluxDB server %s: %s, continuing.\n" % (self.influx_server, str(post_error)))
+                    return
+            except requests.exceptions.ConnectionError as post_error:
+                sys.stderr.write("Can't connect to InfluxDB server %s: %s, continuing.\n" % (self.influx_server, str(post_error)))
+                return
+
+        if res.status_code != 204:
+            msg = "Could not send metrics: "
+
+            if res.status_code == 200:
+                msg += "InfluxDB could not complete the request."
+            elif res.status_code == 404:
+                msg += "Got HTTP code 404. This most likely means "
+                msg += "that the requested database '"
+                msg += self.influx_db
+                msg += "' does not exist.\n"
+            else:
+                msg += "request to "
+                msg += res.url
+                msg += " failed with code "
+                msg += str(res.status_code)
+                msg += ".\n"
+                msg += "Body of the request is:\n"
+                msg += body
+                msg += "\n"
 
-        try:
-            res = requests.post(url, params=params, data=str(body), auth=auth,
-                                timeout=self.influx_timeout)
-
-            if res.status_code != 204:
-                msg = "Could not send metrics: "
-
-                if res.status_code == 200:
-                    msg += "InfluxDB could not complete the request."
-                elif res.status_code == 404:
-                    msg += "Got HTTP code 404. This most likely means "
-                    msg += "that the requested database '"
-                    msg += self.influx_db
-                    msg += "' does not exist.\n"
-                else:
-                    msg += "request to "
-                    msg += res.url
-                    msg += " failed with code "
-                    msg += str(res.status_code)
-                    msg += ".\n"
-                    msg += "Body of the request is:\n"
-                    msg += str(body)
-                    msg += "\n"
-
-                sys.stderr.write(msg)
-        except ValueError:
-            sys.stderr.write("Can't send request that has no metrics.\n")
-        except requests.exceptions.ConnectionError as post_error:
-            sys.stderr.write("Can't connect to InfluxDB server %s: %s, continuing.\n" % (self.influx_server, str(post_error)))
+            sys.stderr.write(msg)
 
     def finalize(self):
         """ Finalize and clean up """
-        return
+        if self.session:
+            if self.batch:
+                self.send_influxdb()
+            self.session.close()
+            self.session = None
 
 if __name__ == '__main__':
     try:
@@ -24,7 +24,6 @@
 # Common imports
 from collections import OrderedDict
 import errno
-import time
 import sys
 
 # Our imports
@@ -341,9 +340,7 @@ class PCP2XXX(object):
             self.opts.daemonize()
 
         # Align poll interval to host clock
-        if self.context.type != PM_CONTEXT_ARCHIVE and self.opts.pmGetOptionAlignment():
-            align = float(self.opts.pmGetOptionAlignment()) - (time.time() % float(self.opts.pmGetOptionAlignment()))
-            time.sleep(align)
+        self.pmconfig.align()
 
         # Main loop
         refresh_metrics = 0
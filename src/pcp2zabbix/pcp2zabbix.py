@@ -58,6 +58,7 @@ import sys
 import json
 import socket
 import struct
+import re
 
 # PCP Python PMAPI
 from pcp import pmapi, pmconfig
@@ -72,17 +73,14 @@ CONFVER = 1
 ZBXSERVER = "localhost"
 ZBXPORT = 10051
 ZBXPREFIX = "pcp."
+ZBXITEMS = 250 # See zabbix_sender(8)
+CACHE_SIZE = 100000
 
-class ZabbixMetric(object): # pylint: disable=too-few-public-methods
-    """ A Zabbix metric """
-    def __init__(self, host, key, value, clock):
-        self.host = host
-        self.key = key
-        self.value = value
-        self.clock = clock
-
-    def __repr__(self):
-        return 'Metric(%r, %r, %r, %r)' % (self.host, self.key, self.value, self.clock)
+# Zabbix trapper request envelope around the JSON items
+ZBXREQHEAD = b'{\n\t"request":"sender data",\n\t"data":[\n'
+ZBXREQTAIL = b']\n}'
+ZBXHDRSIZE = 13 # b'ZBXD\1' and the 8 byte data length
+ZBXREQSIZE = ZBXHDRSIZE + len(ZBXREQHEAD) + len(ZBXREQTAIL)
 
 class PCP2Zabbix(object):
     """ PCP to Zabbix """
@@ -98,6 +96,7 @@ class PCP2Zabbix(object):
                      'samples', 'interval', 'type', 'precision', 'daemonize',
                      'zabbix_server', 'zabbix_port', 'zabbix_host',
                      'zabbix_interval', 'zabbix_prefix', 'zabbix_lld',
+                     'zabbix_batch_size', 'zabbix_stats',
                      'count_scale', 'space_scale', 'time_scale', 'version',
                      'count_scale_force', 'space_scale_force', 'time_scale_force',
                      'type_prefer', 'precision_force', 'limit_filter', 'limit_filter_force',
@@ -163,11 +162,18 @@ class PCP2Zabbix(object):
         # Dictionary storing metric:[instance, instance ...] objects
         self.lld_history = {}
 
+        self.zabbix_batch_size = 0
+        self.zabbix_stats = 0
+        # Dictionary storing (host, key):item JSON prefix strings
+        self.zabbix_templates = {}
+
         # Internal
         self.runtime = -1
 
         self.zabbix_prevsend = None
         self.zabbix_metrics = []
+        self.zabbix_pending = 0
+        self.zabbix_totals = [0, 0, 0, 0.0] # batches, processed, failed, seconds
 
         # Performance metrics store
         # key - metric name
@@ -244,6 +250,8 @@ class PCP2Zabbix(object):
         opts.pmSetLongOption("zabbix-interval", 1, "E", "INTERVAL", "interval to send collected metrics")
         opts.pmSetLongOption("zabbix-prefix", 1, "x", "PREFIX", "prefix for metric names (default: " + ZBXPREFIX + ")")
         opts.pmSetLongOption("zabbix-lld", 0, "l", "", "emit low level discovery keys for each metric")
+        opts.pmSetLongOption("zabbix-batch-size", 1, "", "BYTES", "maximum size of a single request to send")
+        opts.pmSetLongOption("zabbix-stats", 0, "", "", "report per-request send statistics")
 
         return opts
 
@@ -337,6 +345,10 @@ class PCP2Zabbix(object):
             self.zabbix_prefix = optarg
         elif opt == 'l':
             self.zabbix_lld = 1
+        elif opt == 'zabbix-batch-size':
+            self.zabbix_batch_size = optarg
+        elif opt == 'zabbix-stats':
+            self.zabbix_stats = 1
         else:
             raise pmapi.pmUsageErr()
 
@@ -372,6 +384,14 @@ class PCP2Zabbix(object):
         else:
             self.zabbix_interval = float(self.interval)
 
+        try:
+            self.zabbix_batch_size = int(self.zabbix_batch_size)
+            if self.zabbix_batch_size < 0:
+                raise ValueError
+        except ValueError:
+            sys.stderr.write("Error while reading option zabbix_batch_size: Invalid value '%s'.\n" % self.zabbix_batch_size)
+            sys.exit(1)
+
     def execute(self):
         """ Fetch and report """
         # Debug
@@ -401,9 +421,7 @@ class PCP2Zabbix(object):
             self.opts.daemonize()
 
         # Align poll interval to host clock
-        if self.context.type != PM_CONTEXT_ARCHIVE and self.opts.pmGetOptionAlignment():
-            align = float(self.opts.pmGetOptionAlignment()) - (time.time() % float(self.opts.pmGetOptionAlignment()))
-            time.sleep(align)
+        self.pmconfig.align()
 
         # Main loop
         refresh_metrics = 0
@@ -438,7 +456,7 @@ class PCP2Zabbix(object):
     def write_header(self):
         """ Write info header """
         if self.context.type == PM_CONTEXT_ARCHIVE:
-            self.zabbix_interval = 250 # See zabbix_sender(8)
+            self.zabbix_interval = ZBXITEMS
             sys.stdout.write("Sending %d archived metrics to Zabbix server %s...\n(Ctrl-C to stop)\n" % (len(self.metrics), self.zabbix_server))
             return
 
@@ -461,29 +479,53 @@ class PCP2Zabbix(object):
             buf += chunk
         return buf
 
-    def send_to_zabbix(self, metrics, zabbix_host, zabbix_port, timeout=15):
-        """ Send set of metrics to Zabbix server """
-        j = json.dumps
+    def format_zabbix_metric(self, key, value, clock):
+        """ Format Zabbix metric as an encoded JSON item """
         # Zabbix has a very fragile JSON parser, so we cannot use json to
-        # dump the whole packet
-        metrics_data = []
-        for m in metrics:
-            clock = m.clock or time.time()
-            metrics_data.append(('\t\t{\n'
-                                 '\t\t\t"host":%s,\n'
-                                 '\t\t\t"key":%s,\n'
-                                 '\t\t\t"value":%s,\n'
-                                 '\t\t\t"clock":%d}') % (j(m.host),
-                                                         j(m.key),
-                                                         j(m.value),
-                                                         clock))
-        json_data = ('{\n'
-                     '\t"request":"sender data",\n'
-                     '\t"data":[\n%s]\n'
-                     '}') % (',\n'.join(metrics_data))
-
-        data_len = struct.pack('<Q', len(json_data))
-        packet = b'ZBXD\1' + data_len + json_data.encode('utf-8')
+        # dump the whole packet.  The host and key part of each item stays
+        # the same over samples so only the value and clock are formatted.
+        if key not in self.zabbix_templates:
+            if len(self.zabbix_templates) >= CACHE_SIZE:
+                self.zabbix_templates.clear()
+            self.zabbix_templates[key] = ('\t\t{\n'
+                                          '\t\t\t"host":' + json.dumps(self.zabbix_host) + ',\n'
+                                          '\t\t\t"key":' + json.dumps(key) + ',\n'
+                                          '\t\t\t"value":')
+        clock = clock or time.time()
+        item = self.zabbix_templates[key] + json.dumps(value) + ',\n\t\t\t"clock":%d}' % clock
+        return item.encode('utf-8')
+
+    def request_fits(self, size, item):
+        """ Check if an item fits in a request with items of given size """
+        # Items are sized with their separator, the last one needs none
+        return ZBXREQSIZE + size + len(item) <= self.zabbix_batch_size
+
+    def send_to_zabbix(self, metrics_data, zabbix_host, zabbix_port, timeout=15):
+        """ Send set of encoded JSON items to Zabbix server """
+        if not self.zabbix_batch_size:
+            return self.send_zabbix_request(metrics_data, zabbix_host, zabbix_port, timeout)
+
+        # Split into requests not exceeding the configured size
+        ret = True
+        batch = []
+        size = 0
+        for item in metrics_data:
+            if batch and not self.request_fits(size, item):
+                ret = self.send_zabbix_request(batch, zabbix_host, zabbix_port, timeout) and ret
+                batch = []
+                size = 0
+            batch.append(item)
+            size += len(item) + 2
+        if batch:
+            ret = self.send_zabbix_request(batch, zabbix_host, zabbix_port, timeout) and ret
+        return ret
+
+    def send_zabbix_request(self, metrics_data, zabbix_host, zabbix_port, timeout):
+        """ Send single trapper request of JSON items to Zabbix server """
+        data = ZBXREQHEAD + b',\n'.join(metrics_data) + ZBXREQTAIL
+        data_len = struct.pack('<Q', len(data))
+        packet = b'ZBXD\1' + data_len + data
+        start = time.time()
         try:
             # NB: Zabbix trapper protocol (as of Zabbix 3.4) supports only one
             # transaction per connection, so we can't use a long-lived socket.
@@ -493,17 +535,19 @@ class PCP2Zabbix(object):
             # send metrics to zabbix
             zabbix.sendall(packet)
             # get response header from zabbix
-            resp_hdr = self.recv_from_zabbix(zabbix, 13)
-            if not bytes.decode(resp_hdr).startswith('ZBXD\1') or len(resp_hdr) != 13:
+            resp_hdr = self.recv_from_zabbix(zabbix, ZBXHDRSIZE)
+            if not bytes.decode(resp_hdr).startswith('ZBXD\1') or len(resp_hdr) != ZBXHDRSIZE:
                 if self.context.pmDebug("appl0"):
                     print("Invalid Zabbix response len=%d" % len(resp_hdr))
                 return False
             resp_body_len = struct.unpack('<Q', resp_hdr[5:])[0]
             # get response body from zabbix
-            resp_body = zabbix.recv(resp_body_len)
+            resp_body = self.recv_from_zabbix(zabbix, resp_body_len)
             resp = json.loads(bytes.decode(resp_body))
             if self.context.pmDebug("appl0"):
                 print("Got response from Zabbix: %s" % resp)
+            if self.zabbix_stats:
+                self.report_zabbix_stats(len(metrics_data), len(packet), time.time() - start, resp)
             if resp.get('response') != 'success':
                 sys.stderr.write("Error response from Zabbix: %s\n" % str(resp))
                 return False
@@ -516,13 +560,44 @@ class PCP2Zabbix(object):
         finally:
             zabbix.close()
 
+    def report_zabbix_stats(self, items, size, elapsed, resp):
+        """ Report Zabbix request send statistics """
+        # Zabbix response info, e.g.:
+        # processed: 3; failed: 0; total: 3; seconds spent: 0.000055
+        processed, failed = 0, 0
+        match = re.search(r'processed: (\d+); failed: (\d+)', str(resp.get('info', '')))
+        if match:
+            processed, failed = int(match.group(1)), int(match.group(2))
+        self.zabbix_totals[0] += 1
+        self.zabbix_totals[1] += processed
+        self.zabbix_totals[2] += failed
+        self.zabbix_totals[3] += elapsed
+        sys.stdout.write("Sent %d items (%d bytes) in %.3f sec: %d processed, %d failed.\n" % (items, size, elapsed, processed, failed))
+
+    def queue_zabbix_metric(self, key, value, clock):
+        """ Queue metric for sending, accounting for its size in a request """
+        item = self.format_zabbix_metric(key, value, clock)
+        if self.zabbix_batch_size:
+            # Send a full request before the item would exceed the size
+            if self.context.type == PM_CONTEXT_ARCHIVE and self.zabbix_metrics and \
+               not self.request_fits(self.zabbix_pending, item):
+                self.flush_zabbix()
+            # The JSON item and separator, as split by send_to_zabbix
+            self.zabbix_pending += len(item) + 2
+        self.zabbix_metrics.append(item)
+
+    def flush_zabbix(self):
+        """ Send queued metrics to Zabbix server """
+        self.send_to_zabbix(self.zabbix_metrics, self.zabbix_server, self.zabbix_port)
+        self.zabbix_metrics = []
+        self.zabbix_pending = 0
+
     def write_zabbix(self, timestamp):
         """ Write (send) metrics to Zabbix server """
         if timestamp is None:
             # Send any remaining buffered values
             if self.zabbix_metrics:
-                self.send_to_zabbix(self.zabbix_metrics, self.zabbix_server, self.zabbix_port)
-                self.zabbix_metrics = []
+                self.flush_zabbix()
             return
 
         ts = self.context.datetime_to_secs(self.pmfg_ts(), PM_TIME_SEC)
@@ -549,7 +624,7 @@ class PCP2Zabbix(object):
                         send_lld = True
                     key += "[" + name + "]"
                 value = format(value, fmt) if isinstance(value, float) else str(value)
-                self.zabbix_metrics.append(ZabbixMetric(self.zabbix_host, key, value, ts))
+                self.queue_zabbix_metric(key, value, ts)
 
             # Construct extra LLD pseudo-metric if needed
             if self.zabbix_lld and send_lld:
@@ -566,23 +641,26 @@ class PCP2Zabbix(object):
                     values.append("{ " + macro_name + ":" + macro_value + "}")
                 value += ",".join(values)
                 value += "] }"
-                self.zabbix_metrics.append(ZabbixMetric(self.zabbix_host, key, value, ts))
+                self.queue_zabbix_metric(key, value, ts)
 
-        # Send when needed
+        # Send when needed; archive samples limited by request size are
+        # accumulated and sent by queue_zabbix_metric once a request is full
         if self.context.type == PM_CONTEXT_ARCHIVE:
-            if len(self.zabbix_metrics) >= self.zabbix_interval:
-                self.send_to_zabbix(self.zabbix_metrics, self.zabbix_server, self.zabbix_port)
-                self.zabbix_metrics = []
+            if not self.zabbix_batch_size and len(self.zabbix_metrics) >= self.zabbix_interval:
+                self.flush_zabbix()
         elif not self.zabbix_prevsend or ts - self.zabbix_prevsend > self.zabbix_interval:
-            self.send_to_zabbix(self.zabbix_metrics, self.zabbix_server, self.zabbix_port)
-            self.zabbix_metrics = []
+            self.flush_zabbix()
             self.zabbix_prevsend = ts
 
     def finalize(self):
         """ Finalize and clean up """
         if self.zabbix_metrics:
-            self.send_to_zabbix(self.zabbix_metrics, self.zabbix_server, self.zabbix_port)
-            self.zabbix_metrics = []
+            self.flush_zabbix()
+        if self.zabbix_stats and self.zabbix_totals[0]:
+            sys.stdout.write("Sent %d requests in %.3f sec: %d processed, %d failed.\n" %
+                             (self.zabbix_totals[0], self.zabbix_totals[3],
+                              self.zabbix_totals[1], self.zabbix_totals[2]))
+            self.zabbix_totals = [0, 0, 0, 0.0]
 
 if __name__ == '__main__':
     try:
@@ -191,7 +191,7 @@ sockets_store(pmdaResult *result, pmdaExt *pmda)
 	    	case 0: /* network.persocket.filter */
 		    if ((sts = pmExtractValue(vsp->valfmt, &vsp->vlist[0],
 			PM_TYPE_STRING, &av, PM_TYPE_STRING)) >= 0) {
-			if (sockets_check_filter(av.cp)) {
+			if (!sockets_check_filter(av.cp)) {
 			    sts = PM_ERR_BADSTORE;
 			    free(av.cp);
 			    break;
@@ -85,7 +85,7 @@ class PMReporter(object):
                      'type_prefer', 'precision_force', 'limit_filter', 'limit_filter_force',
                      'live_filter', 'rank', 'invert_filter', 'predicate', 'names_change',
                      'speclocal', 'instances', 'ignore_incompat', 'ignore_unknown',
-                     'omit_flat', 'instinfo', 'include_labels', 'include_texts')
+                     'omit_flat', 'instinfo', 'include_labels', 'include_texts', 'stats')
 
         # The order of preference for options (as present):
         # 1 - command line options
@@ -124,6 +124,7 @@ class PMReporter(object):
         self.omit_flat = 0
         self.include_labels = 0
         self.include_texts = 0
+        self.stats = 0
         self.colxrow = None
         self.width = 0
         self.width_force = None
@@ -197,6 +198,7 @@ class PMReporter(object):
         opts.pmSetLongOption("output-file", 1, "F", "OUTFILE", "output file")
         opts.pmSetLongOption("derived", 1, "e", "FILE|DFNT", "derived metrics definitions")
         opts.pmSetLongOption("daemonize", 0, "", "", "daemonize on startup")
+        opts.pmSetLongOption("stats", 0, "", "", "report sampling overruns and timing on exit")
         opts.pmSetLongOptionDebug()        # -D/--debug
         opts.pmSetLongOptionVersion()      # -V/--version
         opts.pmSetLongOptionHelp()         # -?/--help
@@ -269,6 +271,8 @@ class PMReporter(object):
             self.daemonize = 1
         elif opt == 'include-texts':
             self.include_texts = 1
+        elif opt == 'stats':
+            self.stats = 1
         elif opt == 'no-inst-info':
             self.instinfo = 0
         elif opt == 'K':
@@ -551,9 +555,7 @@ class PMReporter(object):
             self.opts.daemonize()
 
         # Align poll interval to host clock
-        if self.context.type != PM_CONTEXT_ARCHIVE and self.opts.pmGetOptionAlignment():
-            align = float(self.opts.pmGetOptionAlignment()) - (time.time() % float(self.opts.pmGetOptionAlignment()))
-            time.sleep(align)
+        self.pmconfig.align()
 
         # Main loop
         refresh_metrics = 0
@@ -1532,6 +1534,9 @@ class PMReporter(object):
 
     def finalize(self):
         """ Finalize and clean up """
+        if self.stats:
+            self.pmconfig.write_stats()
+            self.stats = 0
         if self.writer:
             try:
                 self.writer.flush()
@@ -1,6 +1,6 @@
 """ Convenience Classes building on the base PMAPI extension module """
 #
-# Copyright (C) 2013-2016,2019 Red Hat
+# Copyright (C) 2013-2016,2019,2026 Red Hat
 # Copyright (C) 2009-2012 Michael T. Werner
 #
 # This file is part of the "pcp" module, the python interfaces for the
@@ -22,11 +22,13 @@
 #
 
 import sys
+from concurrent.futures import ThreadPoolExecutor, wait
 from ctypes import c_int, c_uint, c_char_p, cast, POINTER
-from pcp.pmapi import pmContext, pmValue, pmDesc, pmErr, timeval, timespec
+from pcp.pmapi import pmContext, pmValue, pmDesc, pmErr, pmUsageErr, timeval, timespec
+from pcp.schedule import Scheduler
 from cpmapi import (PM_CONTEXT_HOST, PM_CONTEXT_ARCHIVE, PM_INDOM_NULL,
                     PM_IN_NULL, PM_ID_NULL, PM_SEM_COUNTER, PM_ERR_EOL,
-                    PM_TYPE_DOUBLE)
+                    PM_TYPE_DOUBLE, pmSetContextOptions)
 
 
 class MetricCore(object):
@@ -508,6 +510,13 @@ class MetricGroupManager(dict, MetricCache):
     """
     Manages a dictionary of MetricGroups which can be pmFetch'ed
     inherits from MetricCache, which inherits from pmContext
+
+    When the command line names several hosts or archives (the tool
+    sets PM_OPTFLAG_MULTI, and -h is repeated or -H/--hostsfile used)
+    the builder creates one manager per source, each with its own
+    context.  Groups added to the first manager are added to all of
+    them, they are fetched concurrently and the printer is then called
+    once per source with the manager for that source.
     """
 
     ##
@@ -533,6 +542,23 @@ class MetricGroupManager(dict, MetricCache):
     def _R_counter(self):	# fetch iteration count, useful for printer
         return self._counter
 
+    def _R_hosts(self):		# managers for each host or archive
+        return self._hosts
+    def _R_source(self):	# host or archive name of this context
+        if self.target is None:
+            return 'local context'
+        return self.target
+    def _R_deadline(self):	# per-host fetch time limit, in seconds
+        return self._deadline
+    def _W_deadline(self, deadline):
+        self._deadline = deadline
+    def _R_stats(self):		# report schedule statistics after run
+        return self._stats
+    def _W_stats(self, stats):
+        self._stats = stats
+    def _R_scheduler(self):	# sampling schedule of the run loop
+        return self._scheduler
+
     ##
     # property definitions
 
@@ -542,6 +568,11 @@ class MetricGroupManager(dict, MetricCache):
 
     printer = property(None, _W_printer, None, None)
     counter = property(_R_counter, None, None, None)
+    hosts = property(_R_hosts, None, None, None)
+    source = property(_R_source, None, None, None)
+    deadline = property(_R_deadline, _W_deadline, None, None)
+    stats = property(_R_stats, _W_stats, None, None)
+    scheduler = property(_R_scheduler, None, None, None)
 
     ##
     # overloads
@@ -554,11 +585,23 @@ class MetricGroupManager(dict, MetricCache):
         self._default_pause = None
         self._printer = None
         self._counter = 0
+        self._hosts = [self]
+        self._deadline = None
+        self._pool = None	# fetch threads, multiple hosts only
+        self._pending = None	# this host's fetch still in progress
+        self._ready = []	# hosts fetched in time on this round
+        self._active = []	# hosts neither failed nor at end of log
+        self._status = 0
+        self._stats = False
+        self._scheduler = None
 
     def __setitem__(self, attr, value):
         if attr in self:
             raise KeyError("metric group with that key already exists")
         dict.__setitem__(self, attr, MetricGroup(self, inL=value))
+        if self._hosts[0] is self:
+            for host in self._hosts[1:]:
+                host[attr] = value
 
     @classmethod
     def builder(cls, options, argv):
@@ -566,11 +609,46 @@ class MetricGroupManager(dict, MetricCache):
         manager = cls.fromOptions(options, argv)
         manager._default_delta = timespec(options.delta, 0)
         manager._options = options
+        manager._connect()
         return manager
 
     ##
     # methods
 
+    def _connect(self):
+        """ Create contexts for any further hosts or archives named on
+            the command line, concurrently.  Those that cannot be reached
+            are reported and left out, the first must be reachable (as
+            it is this manager) and is created by the builder itself.
+        """
+        options = self._options
+        if self.type == PM_CONTEXT_ARCHIVE:
+            sources = options.pmGetOptionArchives()
+        elif self.type == PM_CONTEXT_HOST:
+            sources = options.pmGetOptionHosts()
+        else:
+            sources = None
+        if not sources or len(sources) < 2:
+            return
+        with ThreadPoolExecutor(len(sources) - 1) as pool:
+            futures = [pool.submit(type(self), self.type, source)
+                       for source in sources[1:]]
+        for future in futures:
+            try:
+                host = future.result()
+            except pmErr as error:
+                sys.stderr.write("%s: %s\n" % (error.progname(), error.message()))
+                self._status = 1
+                continue
+            # time window and timezone setup, as pmContext.fromOptions
+            if pmSetContextOptions(host.ctx, options.mode, options.delta):
+                raise pmUsageErr
+            host._options = options
+            host._default_delta = self._default_delta
+            host._hosts = self._hosts
+            self._hosts.append(host)
+        self._active = list(self._hosts)
+
     def _ts2float(self, ts):
         """ convert timespec to epoch seconds as a float """
         if ts is None:
@@ -657,6 +735,12 @@ class MetricGroupManager(dict, MetricCache):
 
     def fetch(self):
         """ Perform fetch operation on all of the groups. """
+        if len(self._hosts) > 1 and self._hosts[0] is self:
+            return self._fetchHosts()
+        return self._fetchGroups()
+
+    def _fetchGroups(self):
+        """ Fetch all of the groups of this context """
         fetchtime = None
         rmax = 0.0
         for group in self.keys():
@@ -666,30 +750,113 @@ class MetricGroupManager(dict, MetricCache):
                 rmax = self._ts2float(stamp)
         return fetchtime
 
+    def _fetchDeadline(self):
+        """ Seconds each host has to complete a fetch - by default the
+            sampling interval for live hosts, unlimited for archives.
+        """
+        if self._deadline is not None:
+            return self._deadline
+        if self.type == PM_CONTEXT_ARCHIVE:
+            return None
+        delta = None
+        if self._options is not None:
+            delta = self._options.pmGetOptionInterval()
+        if delta is None:
+            delta = self._default_delta
+        return self._ts2float(delta)
+
+    def _fetchHosts(self):
+        """ Fetch all groups of every host concurrently.  Hosts that do
+            not answer within the deadline are left out of this round and
+            not fetched again until their outstanding fetch completes.
+            Hosts whose fetch fails, or that reach the end of an archive,
+            are dropped from later rounds.
+        """
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(len(self._hosts))
+        for host in self._active:
+            if host._pending is None:
+                host._pending = self._pool.submit(host._fetchGroups)
+        wait([host._pending for host in self._active], self._fetchDeadline())
+
+        fetchtime = None
+        rmax = 0.0
+        self._ready = []
+        for host in list(self._active):
+            if not host._pending.done():
+                sys.stderr.write("%s: %s: fetch deadline exceeded\n" %
+                                 (self.pmGetProgname(), host.source))
+                continue
+            future, host._pending = host._pending, None
+            try:
+                stamp = future.result()
+            except SystemExit as code:
+                host._status = code.code
+                self._active.remove(host)
+                continue
+            self._ready.append(host)
+            if fetchtime is None or self._ts2float(stamp) > rmax:
+                fetchtime = stamp
+                rmax = self._ts2float(stamp)
+        if not self._active:
+            raise SystemExit(self._exitStatus())
+        return fetchtime
+
+    def _exitStatus(self):
+        """ Worst exit status seen across all hosts """
+        return max(host._status for host in self._hosts)
+
+    def _report(self):
+        """ Call the printer with each host fetched on this round """
+        if len(self._hosts) == 1:
+            self._printer.report(self)
+            return
+        for host in self._ready:
+            host._counter = self._counter
+            self._printer.report(host)
+
+    def _scheduledFetch(self):
+        """ Fetch, accounting the time taken to the run schedule """
+        self._scheduler.fetching()
+        curtime = self.fetch()
+        self._scheduler.fetched()
+        return curtime
+
     def run(self):
         """ Using options specification, loop fetching and reporting,
             pausing for the requested time interval between updates.
             Transparently handles archive/live mode differences.
             Note that this can be different to the sampling interval
             in archive mode, but is usually the same as the sampling
-            interval in live mode.
+            interval in live mode.  Updates are scheduled at fixed
+            offsets from the first, so fetch and report times do not
+            accumulate, and updates missed by overrunning are skipped.
         """
         samples, finish = self._computeSamples()
         # print("DEBUG samples=" + str(samples) + " finish=" + str(self._ts2float(finish)))
-        timer = self._computePauseTime()
+        align = None
+        if self.type != PM_CONTEXT_ARCHIVE and self._options is not None:
+            align = self._options.pmGetOptionAlignment()
+        self._scheduler = Scheduler(self._computePauseTime(), align)
         try:
-            curtime = self.fetch()
+            curtime = self._scheduledFetch()
             while True:
                 if self._counter >= samples > 0:
                     break
                 if finish is not None and self._ts2float(curtime) >= self._ts2float(finish):
                     break
-                self._printer.report(self)
-                timer.sleep()
-                curtime = self.fetch()
+                self._report()
+                self._scheduler.pause()
+                curtime = self._scheduledFetch()
                 self._counter += 1
         except SystemExit as code:
             return code
         except KeyboardInterrupt:
             pass
-        return 0
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+            if self._stats:
+                for line in self._scheduler.summary():
+                    sys.stderr.write("%s: %s\n" % (self.pmGetProgname(), line))
+        return self._exitStatus()
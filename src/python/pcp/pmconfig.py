@@ -27,7 +27,6 @@ try:
 except ImportError:
     import ConfigParser
 import signal
-import time
 import math
 import csv
 import sys
@@ -35,11 +34,13 @@ import os
 import re
 
 from pcp import pmapi
+from pcp.schedule import Scheduler
 
 # Common defaults (for applicable utils)
 TRUNC = "xxx"
 VERSION = 1
 CURR_INSTS = False
+FILTER_CACHE_SIZE = 100000
 
 class pmConfig(object):
     """ Config reader and validator """
@@ -62,9 +63,8 @@ class pmConfig(object):
         self.labels = []                 # PCP labels of initial instances
         self.res_labels = OrderedDict()  # PCP labels of current results
 
-        # Pause helpers
-        self._round = 0
-        self._init_ts = None
+        # Sampling schedule, created on first use
+        self._scheduler = None
 
         # Predicate metric references
         self._pred_indom = []
@@ -72,6 +72,10 @@ class pmConfig(object):
         # Instance regex cache
         self._re_cache = {}
 
+        # Instance filter verdict cache, shared by metrics
+        # with the same indom and instance specifications
+        self._filter_cache = {}
+
         # Pass data with pmTraversePMNS
         self._tmp = []
 
@@ -1040,13 +1044,7 @@ class pmConfig(object):
 
                 # Populate per-metric regex cache for live filtering
                 if self.do_live_filtering():
-                    try:
-                        self._re_cache[metric] = []
-                        for r in self.util.metrics[metric][1]:
-                            self._re_cache[metric].append(re.compile(r'\A' + r + r'\Z'))
-                    except Exception as error:
-                        sys.stderr.write("Invalid regex '%s': %s.\n" % (r, error))
-                        sys.exit(1)
+                    self._re_cache[metric] = self.compile_instance_filter(metric, self.descs[i].contents.indom)
             except Exception:
                 if hasattr(self.util, 'ignore_incompat') and self.util.ignore_incompat:
                     # Schedule the metric for removal
@@ -1117,6 +1115,8 @@ class pmConfig(object):
         self.texts = []
         self.labels = []
         self.res_labels = OrderedDict()
+        self._re_cache = {}
+        self._filter_cache = {}
         self.util.pmfg.clear()
         self.util.pmfg_ts = None
 
@@ -1135,8 +1135,10 @@ class pmConfig(object):
 
     def fetch(self):
         """ Sample using fetchgroup and handle special cases """
+        self.scheduler().fetching()
         try:
             state = self.util.pmfg.fetch()
+            self.scheduler().fetched()
         except pmapi.pmErr as error:
             if error.args[0] == pmapi.c_api.PM_ERR_EOL:
                 return -1
@@ -1163,36 +1165,95 @@ class pmConfig(object):
         # Successfully completed sampling
         return 0
 
+    def scheduler(self):
+        """ Sampling schedule, aligned to --align for live contexts """
+        if self._scheduler is None:
+            align = None
+            if self.util.context.type != pmapi.c_api.PM_CONTEXT_ARCHIVE:
+                align = self.util.opts.pmGetOptionAlignment()
+            self._scheduler = Scheduler(self.util.interval, align)
+        return self._scheduler
+
+    def align(self):
+        """ Wait for the --align boundary before the first sample """
+        self.scheduler().begin()
+
     def pause(self):
-        """ Pause before next sampling """
-        self._round += 1
+        """ Pause before next sampling, returns number of missed samples """
+        return self.scheduler().pause()
+
+    def write_stats(self):
+        """ Report overruns and cycle timing of the sampling schedule """
+        if self._scheduler is not None:
+            for line in self._scheduler.summary():
+                sys.stderr.write("%s: %s\n" % (pmapi.pmContext.pmGetProgname(), line))
+
+    def compile_instance_filter(self, metric, indom):
+        """ Compile metric instance specifications for live filtering """
+        instances = self.util.metrics[metric][1]
+        if not instances:
+            return None
+
+        # Plain process names are matched against the process basename
+        procs = set()
+        for r in instances:
+            if r.replace('.', '').replace('_', '').replace('-', '').isalnum():
+                procs.add(r)
 
-        if not self._init_ts:
-            self._init_ts = float(self.util.pmfg_ts().strftime("%s.%f"))
+        # Validate each regex on its own for clear error messages
+        regexes = []
+        for r in instances:
+            try:
+                regexes.append(re.compile(r'\A' + r + r'\Z'))
+            except Exception as error:
+                sys.stderr.write("Invalid regex '%s': %s.\n" % (r, error))
+                sys.exit(1)
 
-        wakeup = self._init_ts + float(self.util.interval) * self._round
+        # Combine into a single alternation unless group references
+        # or duplicate group names would change the meaning of a regex
+        if len(regexes) > 1 and not any(re.search(r'\\[1-9]|\(\?P=', r) for r in instances):
+            try:
+                regexes = [re.compile(r'\A(?:' + '|'.join('(?:' + r + ')' for r in instances) + r')\Z')]
+            except Exception:
+                pass
 
-        sleep = wakeup - time.time()
+        key = (indom, tuple(instances))
+        if key not in self._filter_cache:
+            self._filter_cache[key] = {}
 
-        if sleep > 0:
-            time.sleep(sleep)
+        return (procs, regexes, self._filter_cache[key])
 
-    def filter_instance(self, metric, name):
+    def filter_instance(self, metric, name, inst=None):
         """ Filter instance name against metric instances """
         if not self._re_cache[metric]:
             return True
 
-        for r in self.util.metrics[metric][1]:
-            if r.replace('.', '').replace('_', '').replace('-', '').isalnum():
-                if ' ' in name and name.split()[0].isdigit():
-                    if r == self.get_proc_basename(name.split()[1]):
-                        return True
+        procs, regexes, verdicts = self._re_cache[metric]
+
+        # Instance names are stable between samples, only
+        # evaluate the filter for previously unseen instances
+        if inst is not None:
+            key = (inst, name)
+            if key in verdicts:
+                return verdicts[key]
+            if len(verdicts) >= FILTER_CACHE_SIZE:
+                verdicts.clear()
+
+        verdict = False
+        if procs and ' ' in name and name.split()[0].isdigit():
+            if self.get_proc_basename(name.split()[1]) in procs:
+                verdict = True
+
+        if not verdict:
+            for cr in regexes:
+                if cr.match(name):
+                    verdict = True
+                    break
 
-        for cr in self._re_cache[metric]:
-            if re.match(cr, name):
-                return True
+        if inst is not None:
+            verdicts[key] = verdict
 
-        return False
+        return verdict
 
     def rank(self, instances):
         """ Rank instances """
@@ -1242,7 +1303,7 @@ class pmConfig(object):
                         if inst != pmapi.c_api.PM_IN_NULL and not name:
                             continue
                         if early_live_filter and inst != pmapi.c_api.PM_IN_NULL and \
-                           not self.filter_instance(metric, name):
+                           not self.filter_instance(metric, name, inst):
                             continue
                         value = val()
                         if self.util.metrics[metric][7]:
@@ -1318,6 +1379,6 @@ class pmConfig(object):
 
         if self.do_live_filtering() and self.do_invert_filtering():
             for metric in results:
-                results[metric] = [x for x in results[metric] if self.filter_instance(metric, x[1])]
+                results[metric] = [x for x in results[metric] if self.filter_instance(metric, x[1], x[0])]
 
         return results
@@ -20,8 +20,12 @@
 # pylint: disable=consider-using-dict-items,no-member
 # pylint: disable=too-many-arguments,too-many-positional-arguments
 
+import gc
 import os
 import sys
+import time
+import threading
+from collections import namedtuple
 
 import cpmapi
 import cpmda
@@ -135,6 +139,11 @@ class pmdaIndom(Structure):
                 ("it_numinst", c_int),
                 ("it_set", POINTER(pmdaInstid))]
 
+    # (instance ID -> name, name -> instance ID) dictionaries, keyed by
+    # indom so every pmdaIndom of an indom (e.g. the one a PMDA keeps
+    # after replace_indom() with a numeric indom) sees the same lookups
+    _lookups = {}
+
     def __init__(self, indom, insts):
         Structure.__init__(self)
         self.it_numinst = 0
@@ -157,31 +166,80 @@ class pmdaIndom(Structure):
                 if name:
                     yield (inst, name)
         else:
+            inst_names = self.lookups(self.it_indom)[0]
             for i in range(self.it_numinst):
                 inst = self.it_set[i].i_inst
-                name = self.inst_name_lookup(inst)
+                name = inst_names.get(inst)
                 if name:
                     yield (inst, name)
 
     def inst_name_lookup(self, instance):
+        """
+        Lookup the name of an (internal) instance ID.  Array indoms
+        use a dictionary maintained alongside it_set, cache indoms
+        remember active instances once looked up in the indom cache
+        (until the cache is next changed through a pmdaIndom).
+        """
+        inst_names, name_insts = self.lookups(self.it_indom)
+        try:
+            return inst_names[instance]
+        except KeyError:
+            pass
         if self.it_numinst <= 0:
             name = (c_char_p)()
             sts = LIBPCP_PMDA.pmdaCacheLookup(self.it_indom, instance,
                                               byref(name), None)
             if sts == cpmda.PMDA_CACHE_ACTIVE:
-                return str(name.value.decode())
-        elif self.it_numinst > 0:
-            for inst in self.it_set:
-                if inst.i_inst == instance:
-                    return str(inst.i_name.decode())
+                name = str(name.value.decode())
+                inst_names[instance] = name
+                name_insts[name] = instance
+                return name
         return None
 
+    def inst_id_lookup(self, name):
+        """
+        Lookup the (internal) instance ID of an instance name, the
+        inverse of inst_name_lookup().
+        """
+        inst_names, name_insts = self.lookups(self.it_indom)
+        try:
+            return name_insts[name]
+        except KeyError:
+            pass
+        if self.it_numinst <= 0:
+            inst = (c_int)()
+            sts = LIBPCP_PMDA.pmdaCacheLookupName(self.it_indom, name.encode('utf-8'),
+                                                  byref(inst), None)
+            if sts == cpmda.PMDA_CACHE_ACTIVE:
+                inst_names[inst.value] = name
+                name_insts[name] = inst.value
+                return inst.value
+        return None
+
+    @staticmethod
+    def lookups(indom):
+        """ The lookup dictionaries shared by all pmdaIndoms of an indom """
+        try:
+            return pmdaIndom._lookups[indom]
+        except KeyError:
+            return pmdaIndom._lookups.setdefault(indom, ({}, {}))
+
+    def refresh_lookup(self):
+        """ Rebuild (array indoms) or drop (cache indoms) the lookup dictionaries """
+        inst_names, name_insts = {}, {}
+        for i in range(max(0, self.it_numinst)):
+            name = str(self.it_set[i].i_name.decode())
+            inst_names[self.it_set[i].i_inst] = name
+            name_insts[name] = self.it_set[i].i_inst
+        pmdaIndom._lookups[self.it_indom] = (inst_names, name_insts)
+
     def load_indom(self, indom, insts):
         if isinstance(insts, dict):
             LIBPCP_PMDA.pmdaCacheOp(indom, cpmda.PMDA_CACHE_LOAD)
 
     def load(self):
         if self.it_numinst == -1:
+            self.refresh_lookup()
             LIBPCP_PMDA.pmdaCacheOp(self.it_indom, cpmda.PMDA_CACHE_LOAD)
 
     def set_list_instances(self, insts):
@@ -192,15 +250,22 @@ class pmdaIndom(Structure):
             instance_array[i].i_name = insts[i].i_name
         self.it_set = instance_array
         self.it_numinst = instance_count
+        self.refresh_lookup()
         cpmda.set_need_refresh()
 
     def set_dict_instances(self, indom, insts):
+        self.it_numinst = -1
+        self.refresh_lookup()
+        inst_names, name_insts = {}, {}
+        pmdaIndom._lookups[indom] = (inst_names, name_insts)
         LIBPCP_PMDA.pmdaCacheOp(indom, cpmda.PMDA_CACHE_INACTIVE)
         for key in insts.keys():
             key8 = key.encode('utf-8')
-            LIBPCP_PMDA.pmdaCacheStore(indom, cpmda.PMDA_CACHE_ADD, key8, byref(insts[key]))
+            inst = LIBPCP_PMDA.pmdaCacheStore(indom, cpmda.PMDA_CACHE_ADD, key8, byref(insts[key]))
+            if inst >= 0:
+                inst_names[inst] = key
+                name_insts[key] = inst
         LIBPCP_PMDA.pmdaCacheOp(indom, cpmda.PMDA_CACHE_SAVE)
-        self.it_numinst = -1
 
     def set_instances(self, indom, insts):
         if insts is None:
@@ -217,6 +282,7 @@ class pmdaIndom(Structure):
 
     def cache_load(self):
         if self.it_numinst <= 0:
+            self.refresh_lookup()
             sts = LIBPCP_PMDA.pmdaCacheOp(self.it_indom, cpmda.PMDA_CACHE_LOAD)
             if sts < 0:
                 raise pmErr(sts)
@@ -225,24 +291,345 @@ class pmdaIndom(Structure):
 
     def cache_mark_active(self):
         if self.it_numinst <= 0:
+            self.refresh_lookup()
             LIBPCP_PMDA.pmdaCacheOp(self.it_indom, cpmda.PMDA_CACHE_ACTIVE)
         else:
             raise pmErr(cpmapi.PM_ERR_NYI)
 
     def cache_mark_inactive(self):
         if self.it_numinst <= 0:
+            self.refresh_lookup()
             LIBPCP_PMDA.pmdaCacheOp(self.it_indom, cpmda.PMDA_CACHE_INACTIVE)
         else:
             raise pmErr(cpmapi.PM_ERR_NYI)
 
     def cache_resize(self, maximum):
         if self.it_numinst <= 0:
+            self.refresh_lookup()
             sts = LIBPCP_PMDA.pmdaCacheResize(self.it_indom, maximum)
             if sts < 0:
                 raise pmErr(sts)
         else:
             raise pmErr(cpmapi.PM_ERR_NYI)
 
+##
+# Background sampling of (slow) data sources for PMDAs
+#
+
+PMDASnapshot = namedtuple('PMDASnapshot',
+                          ['data', 'timestamp', 'duration', 'error', 'count'])
+PMDASnapshot.__doc__ = """ Immutable result of a PMDASampler collection:
+    data      - value returned by the collect function (last good one)
+    timestamp - time (epoch seconds) of the last successful collection
+    duration  - seconds spent in the most recent collection
+    error     - exception raised by the most recent collection, or None
+    count     - number of collections performed so far
+"""
+
+class PMDASampler(object):
+    """ Collects data for a PMDA in a background thread
+
+        The collect function is called every interval seconds and
+        must return a new object each time (it is never modified
+        afterwards).  The result is published by replacing a single
+        PMDASnapshot reference, so fetch callbacks read the latest
+        snapshot without blocking on the data source, no matter how
+        long a collection takes.
+    """
+
+    def __init__(self, name, collect, interval, stale=None):
+        self._name = name
+        self._collect = collect
+        self._interval = float(interval)
+        if stale is None:
+            stale = 3 * self._interval
+        self._stale = float(stale)
+        self._snapshot = PMDASnapshot(None, 0.0, 0.0, None, 0)
+        self._errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def read_name(self):
+        """ Property for name of this sampler """
+        return self._name
+
+    def read_interval(self):
+        """ Property for the collection interval in seconds """
+        return self._interval
+
+    def read_snapshot(self):
+        """ Property for the latest snapshot """
+        return self._snapshot
+
+    def read_data(self):
+        """ Property for the data of the latest snapshot """
+        return self._snapshot.data
+
+    def read_errors(self):
+        """ Property for the number of failed collections """
+        return self._errors
+
+    name = property(read_name, None, None, None)
+    interval = property(read_interval, None, None, None)
+    snapshot = property(read_snapshot, None, None, None)
+    data = property(read_data, None, None, None)
+    errors = property(read_errors, None, None, None)
+
+    def age(self):
+        """ Seconds since the last successful collection, or None """
+        timestamp = self._snapshot.timestamp
+        if not timestamp:
+            return None
+        return max(0.0, time.time() - timestamp)
+
+    def stale(self):
+        """ Whether the latest data is missing or older than allowed """
+        age = self.age()
+        return age is None or age > self._stale
+
+    def collect(self):
+        """ Perform one collection and publish the resulting snapshot """
+        previous = self._snapshot
+        start = time.time()
+        try:
+            data = self._collect()
+            timestamp = time.time()
+            error = None
+        except Exception as exc: # pylint: disable=broad-except
+            data = previous.data
+            timestamp = previous.timestamp
+            error = exc
+            self._errors += 1
+            if previous.error is None:
+                cpmda.pmda_err('%s sampler: collection failed: %s' % (self._name, exc))
+        duration = time.time() - start
+        self._snapshot = PMDASnapshot(data, timestamp, duration, error, previous.count + 1)
+        return self._snapshot
+
+    def publish(self, data):
+        """ Publish data collected elsewhere, e.g. at startup, as the latest snapshot """
+        previous = self._snapshot
+        self._snapshot = PMDASnapshot(data, time.time(), 0.0, None, previous.count + 1)
+        return self._snapshot
+
+    def _run(self):
+        deadline = time.monotonic()
+        age = self.age()
+        if age is not None:
+            # data collected or published before starting is used until
+            # it is an interval old
+            deadline += max(0.0, self._interval - age)
+        while not self._stop.wait(max(0.0, deadline - time.monotonic())):
+            self.collect()
+            deadline += self._interval
+            now = time.monotonic()
+            if deadline < now:
+                # collection overran the interval, skip missed ones
+                deadline = now
+
+    def start(self):
+        """ Start the background collection thread """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='sampler-%s' % self._name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """ Stop the background collection thread """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+
+##
+# Self-instrumentation of Python PMDAs, exported as <pmda>.control.*
+#
+
+_control = None     # PMDAControl instance once control metrics are enabled
+_callbacks = {}     # callbacks registered with cpmda, by setter name
+
+def _set_callback(setter, callback):
+    """ Register a callback with cpmda, instrumented if enabled """
+    _callbacks[setter] = callback
+    if _control is not None:
+        callback = _control.wrap(setter, callback)
+    return getattr(cpmda, setter)(callback)
+
+class PMDAControl(object):
+    """ Collects refresh and fetch statistics of a Python PMDA
+
+        Callbacks registered through the PMDA are wrapped to count
+        calls, exceptions and time spent; refresh latencies are kept
+        per cluster (with pseudo-clusters for the refresh_all and
+        fetch hooks) in cumulative latency buckets.  Process garbage
+        collection and memory statistics are sampled at fetch time.
+    """
+
+    BUCKETS = (('1ms', 0.001), ('10ms', 0.01), ('100ms', 0.1),
+               ('1s', 1.0), ('10s', 10.0))
+    REFRESH_ALL = 4096      # instance identifiers of the pseudo-clusters
+    PREFETCH = 4097
+    STATM = '/proc/self/statm'
+
+    def __init__(self, pmda, cluster, serial):
+        self.pmda = pmda
+        self.cluster = cluster
+        self.indom = pmda.indom(serial)
+        self.clusters = {}  # instance -> [count, time, bucket counts...]
+        self.instances = []
+        self.fetch_calls = 0
+        self.fetch_time = 0.0
+        self.exceptions = 0
+        self.pmda.add_indom(pmdaIndom(self.indom, self.instances),
+                            'clusters refreshed by the %s PMDA' % pmda.name)
+
+        prefix = pmda.name + '.control.'
+        counter = pmUnits(0, 0, 1, 0, 0, cpmapi.PM_COUNT_ONE)
+        seconds = pmUnits(0, 1, 0, 0, cpmapi.PM_TIME_SEC, 0)
+        metrics = [
+            ('refresh.count', self.indom, cpmapi.PM_TYPE_U64, counter,
+             'number of refresh callbacks for each cluster'),
+            ('refresh.time', self.indom, cpmapi.PM_TYPE_DOUBLE, seconds,
+             'time spent in refresh callbacks for each cluster'),
+            ('fetch.calls', cpmapi.PM_INDOM_NULL, cpmapi.PM_TYPE_U64, counter,
+             'number of fetch callbacks'),
+            ('fetch.time', cpmapi.PM_INDOM_NULL, cpmapi.PM_TYPE_DOUBLE, seconds,
+             'time spent in fetch callbacks'),
+            ('exceptions', cpmapi.PM_INDOM_NULL, cpmapi.PM_TYPE_U64, counter,
+             'number of exceptions raised by refresh and fetch callbacks'),
+            ('gc.collections', cpmapi.PM_INDOM_NULL, cpmapi.PM_TYPE_U64, counter,
+             'number of Python garbage collection runs'),
+            ('gc.collected', cpmapi.PM_INDOM_NULL, cpmapi.PM_TYPE_U64, counter,
+             'number of objects freed by Python garbage collection'),
+            ('rss', cpmapi.PM_INDOM_NULL, cpmapi.PM_TYPE_U64,
+             pmUnits(1, 0, 0, cpmapi.PM_SPACE_KBYTE, 0, 0),
+             'resident set size of the PMDA process')]
+        for name, _ in self.BUCKETS:
+            metrics.append(('refresh.latency.le_' + name, self.indom,
+                            cpmapi.PM_TYPE_U64, counter,
+                            'refresh callbacks completed within %s' % name))
+        for item, (name, indom, mtype, units, text) in enumerate(metrics):
+            sem = cpmapi.PM_SEM_INSTANT if name == 'rss' else cpmapi.PM_SEM_COUNTER
+            pmda.add_metric(prefix + name,
+                            pmdaMetric(pmda.pmid(cluster, item), mtype, indom, sem, units),
+                            text)
+
+    def record(self, inst, elapsed):
+        """ Account for one refresh of a cluster or pseudo-cluster """
+        stats = self.clusters.get(inst)
+        if stats is None:
+            stats = self.clusters[inst] = [0, 0.0] + [0] * len(self.BUCKETS)
+            if inst == self.REFRESH_ALL:
+                name = 'all'
+            elif inst == self.PREFETCH:
+                name = 'fetch'
+            else:
+                name = str(inst)
+            self.instances.append(pmdaInstid(inst, name))
+            self.pmda.replace_indom(self.indom, self.instances)
+        stats[0] += 1
+        stats[1] += elapsed
+        for i, (_, bound) in enumerate(self.BUCKETS):
+            if elapsed <= bound:
+                stats[2 + i] += 1
+
+    def timed(self, callback, inst):
+        """ Wrap a refresh-style callback with latency accounting """
+        def wrapper(*args):
+            start = time.time()
+            try:
+                return callback(*args)
+            except Exception:
+                self.exceptions += 1
+                raise
+            finally:
+                self.record(inst if inst is not None else args[0],
+                            time.time() - start)
+        return wrapper
+
+    def wrap(self, setter, callback):
+        """ Instrument a callback before it is registered with cpmda """
+        control = self.cluster
+        if setter == 'set_fetch_callback':
+            def fetch_callback(cluster, item, inst):
+                if cluster == control:
+                    return self.fetch(item, inst)
+                if callback is None:
+                    return [cpmapi.PM_ERR_PMID, 0]
+                start = time.time()
+                try:
+                    return callback(cluster, item, inst)
+                except Exception:
+                    self.exceptions += 1
+                    raise
+                finally:
+                    self.fetch_calls += 1
+                    self.fetch_time += time.time() - start
+            return fetch_callback
+        if callback is None:
+            return callback
+        if setter == 'set_refresh':
+            timed = self.timed(callback, None)
+            def refresh(cluster):
+                if cluster != control:
+                    timed(cluster)
+            return refresh
+        if setter == 'set_refresh_all':
+            return self.timed(callback, self.REFRESH_ALL)
+        if setter == 'set_fetch':
+            return self.timed(callback, self.PREFETCH)
+        if setter == 'set_fetch_values_callback':
+            def fetch_values_callback(cluster, item):
+                if cluster == control:
+                    return None
+                try:
+                    return callback(cluster, item)
+                except Exception:
+                    self.exceptions += 1
+                    raise
+            return fetch_values_callback
+        return callback
+
+    def rss(self):
+        """ Resident set size of this process in kilobytes, if known """
+        try:
+            with open(self.STATM) as statm:
+                pages = int(statm.read().split()[1])
+            return pages * os.sysconf('SC_PAGE_SIZE') // 1024
+        except (IOError, OSError, ValueError, IndexError):
+            return None
+
+    def fetch(self, item, inst):
+        """ Values of the control metrics """
+        if item in (0, 1) or item >= 8:
+            stats = self.clusters.get(inst)
+            if stats is None:
+                return [cpmapi.PM_ERR_INST, 0]
+            index = item if item < 2 else item - 6
+            if index >= len(stats):
+                return [cpmapi.PM_ERR_PMID, 0]
+            return [stats[index], 1]
+        if item == 2:
+            return [self.fetch_calls, 1]
+        if item == 3:
+            return [self.fetch_time, 1]
+        if item == 4:
+            return [self.exceptions, 1]
+        if item in (5, 6):
+            key = 'collections' if item == 5 else 'collected'
+            stats = getattr(gc, 'get_stats', list)()
+            return [sum(gen.get(key, 0) for gen in stats), 1]
+        if item == 7:
+            rss = self.rss()
+            return None if rss is None else [rss, 1]
+        return [cpmapi.PM_ERR_PMID, 0]
+
+
 class pmdaUnits(pmUnits):
     """ Wrapper class for PMDAs defining their metrics (avoids pmapi import) """
     def __init__(self, dimS, dimT, dimC, scaleS, scaleT, scaleC):
@@ -280,6 +667,7 @@ class MetricDispatch(object):
         self._metric_names_map = {}
         self._metric_oneline = {}
         self._metric_helptext = {}
+        self._samplers = {}
         cpmda.init_dispatch(domain, name, logfile, helpfile)
 
     def clear_indoms(self):
@@ -366,12 +754,35 @@ class MetricDispatch(object):
         self._indom_oneline[indomid] = oneline
         self._indom_helptext[indomid] = text
 
+    def add_sampler(self, name, collect, interval, stale=None):
+        """
+        Register a PMDASampler calling collect() every interval seconds
+        in a background thread once the PMDA starts running.  Fetch
+        callbacks should only read the sampler's latest snapshot.
+        """
+        if name in self._samplers:
+            raise KeyError('attempt to add_sampler with an existing name=%s' % (name))
+        sampler = PMDASampler(name, collect, interval, stale)
+        self._samplers[name] = sampler
+        return sampler
+
+    def start_samplers(self):
+        """ Start the background thread of each registered sampler """
+        for sampler in self._samplers.values():
+            sampler.start()
+
+    def stop_samplers(self):
+        """ Stop the background thread of each registered sampler """
+        for sampler in self._samplers.values():
+            sampler.stop()
+
     def replace_indom(self, indom, insts):
         # Note that this function can take a numeric indom or a
         # pmdaIndom.
         if isinstance(indom, pmdaIndom):
             it_indom = indom.it_indom
             replacement = indom
+            replacement.refresh_lookup()
         else:
             it_indom = indom
             replacement = pmdaIndom(it_indom, insts)
@@ -406,6 +817,14 @@ class MetricDispatch(object):
         entry = self._indoms[indom]
         return entry.inst_name_lookup(instance)
 
+    def inst_id_lookup(self, indom, name):
+        """
+        Lookup the (internal) instance ID associated with a name within
+        a specific instance domain.
+        """
+        entry = self._indoms[indom]
+        return entry.inst_id_lookup(name)
+
     def pmid_name_lookup(self, cluster, item):
         """
         Lookup the name associated with a performance metric identifier.
@@ -499,6 +918,24 @@ class PMDA(MetricDispatch):
         """
         cpmda.pmda_ready()
 
+    def add_control_metrics(self, cluster, serial):
+        """
+        Export self-instrumentation metrics below <name>.control in the
+        given (otherwise unused) cluster, using the given instance domain
+        serial for the refreshed clusters.  Refresh and fetch callbacks
+        registered before or after this call are instrumented.
+        """
+        global _control # pylint: disable=global-statement
+        if _control is not None:
+            raise KeyError('attempt to add_control_metrics more than once')
+        _control = PMDAControl(self, cluster, serial)
+        for setter in ('set_fetch', 'set_refresh', 'set_refresh_all',
+                       'set_fetch_callback', 'set_fetch_values_callback'):
+            callback = _callbacks.get(setter)
+            if callback is not None or setter == 'set_fetch_callback':
+                getattr(cpmda, setter)(_control.wrap(setter, callback))
+        return _control
+
     def run(self):
         """
         All the real work happens herein; we can be called in one of three
@@ -523,11 +960,15 @@ class PMDA(MetricDispatch):
             cpmda.pmid_longtext_refresh(self._metric_helptext)
             cpmda.indom_oneline_refresh(self._indom_oneline)
             cpmda.indom_longtext_refresh(self._indom_helptext)
-            cpmda.pmda_dispatch(self._indomtable, self._metrictable)
+            self.start_samplers()
+            try:
+                cpmda.pmda_dispatch(self._indomtable, self._metrictable)
+            finally:
+                self.stop_samplers()
 
     @staticmethod
     def set_fetch(fetch):
-        return cpmda.set_fetch(fetch)
+        return _set_callback('set_fetch', fetch)
 
     @staticmethod
     def set_label(label):
@@ -539,7 +980,7 @@ class PMDA(MetricDispatch):
 
     @staticmethod
     def set_refresh(refresh):
-        return cpmda.set_refresh(refresh)
+        return _set_callback('set_refresh', refresh)
 
     @staticmethod
     def set_instance(instance):
@@ -547,7 +988,20 @@ class PMDA(MetricDispatch):
 
     @staticmethod
     def set_fetch_callback(fetch_callback):
-        return cpmda.set_fetch_callback(fetch_callback)
+        return _set_callback('set_fetch_callback', fetch_callback)
+
+    @staticmethod
+    def set_fetch_values_callback(fetch_values_callback):
+        """
+        Register a callback invoked once per requested metric as
+        fetch_values_callback(cluster, item), returning the values of
+        all instances either as a dictionary {inst: value} or as a
+        tuple of parallel (instances, values) sequences (PM_IN_NULL
+        being the instance of metrics without an instance domain).
+        A value of None omits that instance.  Returning None instead
+        falls back to the per-instance fetch callback for the metric.
+        """
+        return _set_callback('set_fetch_values_callback', fetch_values_callback)
 
     @staticmethod
     def set_label_callback(label_callback):
@@ -571,7 +1025,7 @@ class PMDA(MetricDispatch):
 
     @staticmethod
     def set_refresh_all(refresh_all):
-        return cpmda.set_refresh_all(refresh_all)
+        return _set_callback('set_refresh_all', refresh_all)
 
     @staticmethod
     def set_refresh_metrics(refresh_metrics):
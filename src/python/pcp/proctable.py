@@ -0,0 +1,447 @@
+#
+# Copyright (c) 2026 Red Hat.
+# Copyright (C) 2016 Sitaram Shelke.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+# pylint: disable=too-few-public-methods
+
+""" Columnar process tables for the pcp-ps and pcp-pidstat utilities
+
+A ProcessTable holds one row per process (ordered by pid) and one column
+per value reported about those processes.  Columns are either a proc.*
+metric name, whose values are gathered for every row in a single pass
+over the fetched instances, or a function of the table that derives a
+whole column at once (CPU percentages, fault rates, memory shares and
+so on) from other columns.  Columns are computed on first use only and
+then cached, so a report pays for just the columns it displays.
+
+Rows are presented to the reporters as light-weight objects with an
+accessor method per column, named after the column.
+
+A MetricHistory keeps the last few samples of selected metrics for each
+process in fixed size arrays, so rates can be reported over a window of
+several intervals, and accumulates per-process summaries (averages and
+peaks) across the whole run without retaining every sample.
+"""
+
+from array import array
+from itertools import repeat
+
+
+# After fetching non singular metric values, create a mapping of instance id
+# to instance value rather than instance name to instance value.
+# The reason is, in PCP, instance names require a separate pmGetIndom() request
+# and some of the names may not be available.
+class ReportingMetricRepository(object):
+    """
+    Cached current and previous values of the metrics in a group.  Given
+    a MetricHistory, previous values of proc metrics may be taken from up
+    to window samples ago rather than from the preceding fetch.
+    """
+    def __init__(self, group, history=None, window=1):
+        self.group = group
+        self.history = history
+        self.window = window
+        self.current_cached_values = {}
+        self.previous_cached_values = {}
+
+    def span(self):
+        """ Number of samples between the previous and current values """
+        if self.history is None:
+            return 1
+        return self.history.span(self.window)
+
+    def __fetch_current_values(self, metric, instance):
+        if instance:
+            return dict(map(lambda x: (x[0].inst, x[2]), self.group[metric].netValues))
+        else:
+            return self.group[metric].netValues[0][2]
+
+    def __fetch_previous_values(self, metric, instance):
+        if instance and self.span() > 1:
+            return self.history.values(metric, self.span())
+        if instance:
+            return dict(map(lambda x: (x[0].inst, x[2]), self.group[metric].netPrevValues))
+        else:
+            return self.group[metric].netPrevValues[0][2]
+
+    def current_value(self, metric, instance):
+        if not metric in self.group:
+            return None
+        if instance:
+            if self.current_cached_values.get(metric, None) is None:
+                lst = self.__fetch_current_values(metric, instance)
+                self.current_cached_values[metric] = lst
+
+            return self.current_cached_values[metric].get(instance, None)
+        else:
+            if self.current_cached_values.get(metric, None) is None:
+                self.current_cached_values[metric] = self.__fetch_current_values(metric, instance)
+            return self.current_cached_values.get(metric, None)
+
+    def previous_value(self, metric, instance):
+        if not metric in self.group:
+            return None
+        if instance:
+            if self.previous_cached_values.get(metric, None) is None:
+                lst = self.__fetch_previous_values(metric, instance)
+                self.previous_cached_values[metric] = lst
+
+            return self.previous_cached_values[metric].get(instance, None)
+        else:
+            if self.previous_cached_values.get(metric, None) is None:
+                self.previous_cached_values[metric] = self.__fetch_previous_values(metric, instance)
+            return self.previous_cached_values.get(metric, None)
+
+    def current_values(self, metric_name):
+        if self.group.get(metric_name, None) is None:
+            return None
+        if self.current_cached_values.get(metric_name, None) is None:
+            self.current_cached_values[metric_name] = self.__fetch_current_values(metric_name, True)
+        return self.current_cached_values.get(metric_name, None)
+
+    def previous_values(self, metric_name):
+        if self.group.get(metric_name, None) is None:
+            return None
+        if self.previous_cached_values.get(metric_name, None) is None:
+            self.previous_cached_values[metric_name] = self.__fetch_previous_values(metric_name, True)
+        return self.previous_cached_values.get(metric_name, None)
+
+
+class InstanceHistory(object):
+    """ Recent values of one metric instance, with run-long summaries """
+    __slots__ = ('ring', 'since', 'seen', 'last',
+                 'first', 'start', 'end', 'count', 'total', 'peak', 'peak_rate')
+
+    def __init__(self):
+        self.ring = None	# recent values, indexed by sample % depth
+        self.since = None	# first sample held in the ring
+        self.seen = None	# latest sample with a value
+        self.last = None	# latest value, numeric or not
+        self.first = None	# first numeric value and its time
+        self.start = None
+        self.end = None		# time of the latest numeric value
+        self.count = 0
+        self.total = 0.0
+        self.peak = None	# largest value
+        self.peak_rate = None	# largest rate of change between samples
+
+
+class MetricHistory(object):
+    """
+    The last depth samples of some metrics, per instance, held in arrays
+    of doubles indexed by sample number modulo depth.  The metrics map
+    each name to either a metric name or a function returning a mapping
+    of instance to value from a ReportingMetricRepository (for values
+    derived from several metrics).  Rings are released once instances
+    disappear (e.g. processes exit), keeping memory proportional to depth
+    and the number of current instances.  With summaries, the few values
+    used for whole-run averages and peaks are kept for every instance
+    seen, otherwise nothing is kept for instances that have gone.  An
+    instance reappearing after a gap (such as a reused pid) starts anew.
+    """
+    def __init__(self, depth, metrics, summaries=True):
+        self.depth = max(2, int(depth))
+        self.metrics = metrics
+        self.summaries = summaries
+        self.samples = 0
+        self.times = array('d', [0.0]) * self.depth
+        self.entries = dict((name, {}) for name in metrics)
+
+    def record(self, repository, timestamp):
+        """ Add the current values of a repository as the next sample """
+        sample = self.samples
+        slot = sample % self.depth
+        prior = (sample - 1) % self.depth
+        elapsed = timestamp - self.times[prior] if sample else 0.0
+        self.times[slot] = timestamp
+        self.samples += 1
+        for name, source in self.metrics.items():
+            if callable(source):
+                values = source(repository)
+            else:
+                values = repository.current_values(source)
+            entries = self.entries[name]
+            for inst, value in (values or {}).items():
+                entry = entries.get(inst)
+                if entry is None or entry.seen != sample - 1:
+                    # new, or back after a gap (e.g. a reused pid): start afresh
+                    entry = entries[inst] = InstanceHistory()
+                    entry.since = sample
+                entry.seen = sample
+                entry.last = value
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                if entry.ring is None:
+                    entry.ring = array('d', [0.0]) * self.depth
+                elif elapsed > 0:
+                    change = (value - entry.ring[prior]) / elapsed
+                    if entry.peak_rate is None or change > entry.peak_rate:
+                        entry.peak_rate = change
+                entry.ring[slot] = value
+                if entry.first is None:
+                    entry.first, entry.start = value, timestamp
+                entry.end = timestamp
+                entry.count += 1
+                entry.total += value
+                if entry.peak is None or value > entry.peak:
+                    entry.peak = value
+            gone = [inst for inst, entry in entries.items()
+                    if entry.seen != sample and (entry.ring is not None or not self.summaries)]
+            for inst in gone:
+                if self.summaries:
+                    entries[inst].ring = None
+                else:
+                    del entries[inst]
+
+    def span(self, window):
+        """ Samples back that a window of that many intervals can reach now """
+        return max(1, min(window, self.depth - 1, self.samples - 1))
+
+    def elapsed(self, back):
+        """ Seconds between the latest sample and the one back samples ago """
+        latest = self.samples - 1
+        return (self.times[latest % self.depth] -
+                self.times[(latest - back) % self.depth])
+
+    def values(self, name, back):
+        """ Values from back samples ago of the instances in the latest one """
+        latest = self.samples - 1
+        slot = (latest - back) % self.depth
+        return dict((inst, entry.ring[slot])
+                    for inst, entry in self.entries.get(name, {}).items()
+                    if entry.ring is not None and entry.seen == latest
+                    and entry.since <= latest - back)
+
+    def current_values(self, name):
+        """ Latest value of every instance seen, like a repository """
+        entries = self.entries.get(name)
+        if entries is None:
+            return None
+        return dict((inst, entry.last) for inst, entry in entries.items())
+
+    def current_value(self, name, instance):
+        """ Latest value of an instance (None for singular values) """
+        entry = self.entries.get(name, {}).get(instance)
+        return None if entry is None else entry.last
+
+    def instances(self, name, count=1):
+        """ Instances with numeric values in at least count samples """
+        entries = self.entries.get(name, {})
+        return sorted(inst for inst, entry in entries.items() if entry.count >= count)
+
+    def __summaries(self, name, insts, summary):
+        entries = self.entries.get(name, {})
+        return [None if inst not in entries else summary(entries[inst]) for inst in insts]
+
+    def averages(self, name, insts):
+        """ Mean value of each instance over the samples it was seen in """
+        return self.__summaries(name, insts, lambda entry:
+                                entry.total / entry.count if entry.count else None)
+
+    def peaks(self, name, insts):
+        """ Largest value of each instance """
+        return self.__summaries(name, insts, lambda entry: entry.peak)
+
+    def average_rates(self, name, insts):
+        """ Per-second rate of change of each instance over the whole run """
+        return self.__summaries(name, insts, lambda entry:
+                                (entry.last - entry.first) / (entry.end - entry.start)
+                                if entry.count > 1 and entry.end > entry.start else None)
+
+    def peak_rates(self, name, insts):
+        """ Largest per-second rate of change of each instance in one interval """
+        return self.__summaries(name, insts, lambda entry: entry.peak_rate)
+
+
+def percent(current, previous, delta_time):
+    """ Percentage of an interval accounted for by a millisecond counter """
+    if current is not None and previous is not None:
+        return float("%.2f" % (100 * float(current - previous) / float(1000 * delta_time)))
+    return None
+
+def rate(current, previous, delta_time):
+    """ Per-second rate of change of a counter over an interval """
+    if current is not None and previous is not None:
+        return float("%.2f" % ((current - previous) / delta_time))
+    return None
+
+def share(value, whole):
+    """ Percentage of a whole (e.g. physical memory) used by a value """
+    if whole is not None and value is not None:
+        return float("%.2f" % (100 * float(value) / whole))
+    return None
+
+def total(*values):
+    """ Sum of several percentages, unless any one is unavailable """
+    if None in values:
+        return None
+    return float("%.2f" % sum(values))
+
+
+class ProcessRow(object):
+    """ One process of a ProcessTable, with an accessor method per column """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+
+def _accessor(name):
+    def value(self):
+        return self.table.column(name)[self.index]
+    value.__name__ = name
+    return value
+
+_ROW_TYPES = {}
+
+def row_type(names):
+    """ The ProcessRow subclass with accessors for the given column names """
+    names = tuple(names)
+    cls = _ROW_TYPES.get(names)
+    if cls is None:
+        methods = dict((name, _accessor(name)) for name in names)
+        methods['__slots__'] = ()
+        cls = _ROW_TYPES[names] = type('ProcessRow', (ProcessRow,), methods)
+    return cls
+
+
+class ProcessRows(object):
+    """
+    A selection of rows of a ProcessTable, in reporting order.  Filtering
+    and sorting work on whole columns and produce a new selection, rows
+    are only instantiated as the selection is iterated over.  Filtering
+    narrows the table too, so columns first used after that are only
+    computed for the processes that remain.
+    """
+    def __init__(self, table, indexes):
+        self.table = table
+        self.indexes = indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __iter__(self):
+        row, table = self.table.row_type, self.table
+        for index in self.indexes:
+            yield row(table, index)
+
+    def __getitem__(self, position):
+        return self.table.row_type(self.table, self.indexes[position])
+
+    def column(self, name):
+        """ Values of the named column for the selected rows """
+        values = self.table.column(name)
+        return [values[index] for index in self.indexes]
+
+    def where(self, name, predicate):
+        """ Select the rows for which predicate(value of column) holds """
+        values = self.table.column(name)
+        indexes = [index for index in self.indexes if predicate(values[index])]
+        if len(indexes) == len(self.indexes):
+            return self
+        return self.table.subset(indexes).rows()
+
+    def sort(self, name, reverse=False):
+        """ Order rows by the named column, rows lacking a value go last """
+        values = self.table.column(name)
+        present = [index for index in self.indexes if values[index] is not None]
+        missing = [index for index in self.indexes if values[index] is None]
+        present.sort(key=values.__getitem__, reverse=reverse)
+        return ProcessRows(self.table, present + missing)
+
+
+class ProcessTable(object):
+    """
+    Process metric values arranged in columns, one row per process in
+    ascending pid order.  The columns dictionary maps each column name
+    to either a metric name or a function computing the whole column
+    from the table.
+    """
+    def __init__(self, metric_repository, delta_time, columns, pids=None):
+        self.repository = metric_repository
+        self.delta_time = delta_time
+        self.row_type = row_type(columns)
+        self.__columns = columns
+        self.__cache = {}
+        if pids is None:
+            pids = metric_repository.current_values('proc.psinfo.pid')
+            pids = sorted(pids.values()) if pids else []
+        self.pids = pids
+
+    def __len__(self):
+        return len(self.pids)
+
+    def rows(self):
+        """ All processes of the table """
+        return ProcessRows(self, list(range(len(self.pids))))
+
+    def subset(self, indexes):
+        """ A table of the given rows only, keeping columns computed so far """
+        table = ProcessTable(self.repository, self.delta_time, self.__columns,
+                             [self.pids[index] for index in indexes])
+        for name, values in self.__cache.items():
+            table.__cache[name] = [values[index] for index in indexes]
+        return table
+
+    def column(self, name):
+        """ Values of the named column, computed once on first use """
+        values = self.__cache.get(name)
+        if values is None:
+            source = self.__columns[name]
+            if callable(source):
+                values = source(self)
+            else:
+                values = self.current(source)
+            self.__cache[name] = values
+        return values
+
+    def __values(self, values):
+        if values is None:
+            return [None] * len(self.pids)
+        return list(map(values.get, self.pids))
+
+    def current(self, metric):
+        """ Current values of a proc metric for every row """
+        return self.__values(self.repository.current_values(metric))
+
+    def previous(self, metric):
+        """ Previous values of a proc metric for every row """
+        return self.__values(self.repository.previous_values(metric))
+
+    def value(self, metric):
+        """ Current value of a singular metric """
+        return self.repository.current_value(metric, None)
+
+    def deltas(self, metric, unknown=None):
+        """ Change in a proc metric over the interval for every row """
+        return [unknown if c is None or p is None else c - p
+                for c, p in zip(self.current(metric), self.previous(metric))]
+
+    def percents(self, metric):
+        """ Interval percentages of a millisecond counter for every row """
+        return list(map(percent, self.current(metric), self.previous(metric),
+                        repeat(self.delta_time)))
+
+    def rates(self, metric):
+        """ Per-second rates of a counter for every row """
+        return list(map(rate, self.current(metric), self.previous(metric),
+                        repeat(self.delta_time)))
+
+    def shares(self, metric, whole):
+        """ Percentages of a whole used by a proc metric for every row """
+        return list(map(share, self.current(metric), repeat(whole)))
+
+    def totals(self, *names):
+        """ Sums of several percentage columns for every row """
+        return list(map(total, *[self.column(name) for name in names]))
@@ -0,0 +1,126 @@
+#
+# Copyright (c) 2026 Red Hat.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License
+# for more details.
+
+# pylint: disable=too-many-instance-attributes
+
+""" Sampling schedule shared by the pmcc and pmconfig based utilities
+
+A Scheduler paces the fetch-report-pause cycle of a monitoring tool.
+Wakeups are absolute deadlines on the monotonic clock, a whole number
+of intervals after the schedule began, so neither the time spent in
+each cycle nor clock adjustments accumulate into drift.  Optionally
+the schedule begins on a wall-clock multiple of some alignment period.
+
+A cycle that runs past its deadline is an overrun; the next cycle then
+starts at once.  Deadlines that have passed entirely while a cycle ran
+are missed, and skipped rather than sampled in a burst to catch up.
+Fetch and report times of each cycle are accumulated for --stats.
+"""
+
+import time
+
+
+class Timing(object):
+    """ Count, total and maximum of a series of durations """
+    __slots__ = ('count', 'total', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        """ Account for one more duration """
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def average(self):
+        """ Mean duration, or zero if there were none """
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+
+class Scheduler(object):
+    """ Drift-free deadlines, overrun and cycle time accounting """
+    def __init__(self, interval, align=None, clock=time.monotonic, sleep=time.sleep):
+        self.interval = float(interval)
+        self.align = float(align) if align else None
+        self.clock = clock
+        self.sleep = sleep
+        self.start = None	# monotonic time of deadline zero
+        self.deadline = 0	# index of the current cycle's deadline
+        self.overruns = 0	# cycles that ran past the next deadline
+        self.missed = 0		# deadlines skipped while overrunning
+        self.fetches = Timing()
+        self.reports = Timing()
+        self.waits = Timing()
+        self._fetching = None
+        self._fetched = None
+
+    def begin(self):
+        """ Start the schedule, on an alignment boundary if requested """
+        if self.start is not None:
+            return
+        if self.align:
+            self.sleep(self.align - (time.time() % self.align))
+        self.start = self.clock()
+
+    def fetching(self):
+        """ Note the start of a fetch, beginning the schedule if need be """
+        self.begin()
+        self._fetching = self.clock()
+        if self._fetched is not None:	# no pause, e.g. archive replay
+            self.reports.add(self._fetching - self._fetched)
+            self._fetched = None
+
+    def fetched(self):
+        """ Note the end of a fetch """
+        if self._fetching is not None:
+            self._fetched = self.clock()
+            self.fetches.add(self._fetched - self._fetching)
+            self._fetching = None
+
+    def pause(self):
+        """ Wait for the next deadline once reporting is done.
+            Returns the number of deadlines missed by this cycle.
+        """
+        self.begin()
+        now = self.clock()
+        if self._fetched is not None:
+            self.reports.add(now - self._fetched)
+            self._fetched = None
+        if self.interval <= 0:
+            return 0
+        self.deadline += 1
+        wakeup = self.start + self.interval * self.deadline
+        if now < wakeup:
+            self.waits.add(wakeup - now)
+            self.sleep(wakeup - now)
+            return 0
+        self.overruns += 1
+        behind = int((now - wakeup) / self.interval)
+        self.deadline += behind
+        self.missed += behind
+        return behind
+
+    def summary(self):
+        """ Lines describing overruns and cycle timing so far """
+        lines = ['%d fetches, interval %.3f sec, %d overruns, %d missed' %
+                 (self.fetches.count, self.interval, self.overruns, self.missed)]
+        for name, timing in (('fetch', self.fetches), ('report', self.reports),
+                             ('idle', self.waits)):
+            lines.append('%-6s avg %.6f max %.6f sec' %
+                         (name, timing.average(), timing.maximum))
+        return lines
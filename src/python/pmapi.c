@@ -881,7 +881,9 @@ setContextOptions(PyObject *self, PyObject *args, PyObject *keywords)
 
 	if (interval.tv_sec == 0 && interval.tv_nsec == 0)
 	    interval.tv_sec = delta;
-	if ((sts = pmSetMode(mode, &position, &interval)) < 0) {
+	/* boundaries of multiple archives may have switched context */
+	if ((sts = pmUseContext(ctx)) < 0 ||
+	    (sts = pmSetMode(mode, &position, &interval)) < 0) {
 	    pmprintf("%s: %s: %s\n", "pmSetMode",
 			    pmGetProgname(), pmErrStr(sts));
 	    options.flags |= PM_OPTFLAG_RUNTIME_ERR;
@@ -57,6 +57,7 @@ static PyObject *refresh_func;
 static PyObject *instance_func;
 static PyObject *store_cb_func;
 static PyObject *fetch_cb_func;
+static PyObject *fetch_values_cb_func;
 static PyObject *label_cb_func;
 static PyObject *notes_cb_func;
 static PyObject *attribute_cb_func;
@@ -64,6 +65,10 @@ static PyObject *endcontext_cb_func;
 static PyObject *refresh_all_func;
 static PyObject *refresh_metrics_func;
 
+static PyObject *fetch_values;		/* pmid:{inst:value} of current fetch */
+static PyObject *fetch_values_last;	/* {inst:value} of last metric used */
+static pmID fetch_values_pmid = PM_ID_NULL;
+
 static PyThreadState *thread_state;
 
 static Py_ssize_t nindoms;
@@ -454,6 +459,114 @@ refresh(int numpmid, pmID *pmidlist)
     return sts;
 }
 
+/*
+ * Convert the result of a fetch values callback into a dictionary
+ * mapping instance identifiers to values - either a dictionary is
+ * returned already, or a tuple of (instances, values) sequences.
+ * None is passed through, indicating the per-instance callback is
+ * to be used for this metric.
+ */
+static PyObject *
+fetch_values_dict(PyObject *result)
+{
+    PyObject *dict, *insts, *values;
+    Py_ssize_t i, count;
+
+    if (result == Py_None || PyDict_Check(result)) {
+	Py_INCREF(result);
+	return result;
+    }
+    if (!PyTuple_Check(result) || PyTuple_GET_SIZE(result) != 2) {
+	PyErr_SetString(PyExc_TypeError,
+		"expected dict or (instances, values) tuple");
+	return NULL;
+    }
+    insts = PySequence_Fast(PyTuple_GET_ITEM(result, 0),
+		"instances must be a sequence");
+    if (insts == NULL)
+	return NULL;
+    values = PySequence_Fast(PyTuple_GET_ITEM(result, 1),
+		"values must be a sequence");
+    if (values == NULL) {
+	Py_DECREF(insts);
+	return NULL;
+    }
+    count = PySequence_Fast_GET_SIZE(insts);
+    if (count != PySequence_Fast_GET_SIZE(values)) {
+	PyErr_SetString(PyExc_ValueError,
+		"instances and values differ in length");
+	dict = NULL;
+    }
+    else if ((dict = PyDict_New()) != NULL) {
+	for (i = 0; i < count; i++) {
+	    if (PyDict_SetItem(dict, PySequence_Fast_GET_ITEM(insts, i),
+				PySequence_Fast_GET_ITEM(values, i)) < 0) {
+		Py_CLEAR(dict);
+		break;
+	    }
+	}
+    }
+    Py_DECREF(insts);
+    Py_DECREF(values);
+    return dict;
+}
+
+/*
+ * Invoke the fetch values callback once for each requested PMID, so
+ * that all instance values of a metric are passed back to us in one
+ * go.  The values are stashed away for fetch_callback() to fill in
+ * the pmResult without further calls into the Python interpreter.
+ */
+static int
+fetch_values_all(int numpmid, pmID *pmidlist)
+{
+    PyObject *arglist, *result, *key, *values;
+    int i, sts;
+
+    if ((fetch_values = PyDict_New()) == NULL)
+	return -ENOMEM;
+    for (i = 0; i < numpmid; i++) {
+	if ((key = PyLong_FromUnsignedLong(pmidlist[i])) == NULL)
+	    return -ENOMEM;
+	if (PyDict_Contains(fetch_values, key)) {
+	    Py_DECREF(key);
+	    continue;
+	}
+	arglist = Py_BuildValue("(ii)",
+			pmID_cluster(pmidlist[i]), pmID_item(pmidlist[i]));
+	if (arglist == NULL) {
+	    Py_DECREF(key);
+	    return -ENOMEM;
+	}
+	result = PyObject_Call(fetch_values_cb_func, arglist, NULL);
+	Py_DECREF(arglist);
+	if (result == NULL) {
+	    Py_DECREF(key);
+	    return callback_error("fetch_values_callback");
+	}
+	values = fetch_values_dict(result);
+	Py_DECREF(result);
+	if (values == NULL) {
+	    Py_DECREF(key);
+	    return callback_error("fetch_values_callback");
+	}
+	sts = PyDict_SetItem(fetch_values, key, values);
+	Py_DECREF(values);
+	Py_DECREF(key);
+	if (sts < 0)
+	    return -ENOMEM;
+    }
+    return 0;
+}
+
+static void
+fetch_values_clear(void)
+{
+    Py_CLEAR(fetch_values);
+    fetch_values_last = NULL;
+    fetch_values_pmid = PM_ID_NULL;
+}
+
 static int
 fetch(int numpmid, pmID *pmidlist, pmdaResult **rp, pmdaExt *pmda)
 {
@@ -465,7 +578,14 @@ fetch(int numpmid, pmID *pmidlist, pmdaResult **rp, pmdaExt *pmda)
     if ((refresh_func || refresh_all_func) &&
 	(sts = refresh(numpmid, pmidlist)) < 0)
 	return sts;
-    return pmdaFetch(numpmid, pmidlist, rp, pmda);
+    if (fetch_values_cb_func &&
+	(sts = fetch_values_all(numpmid, pmidlist)) < 0) {
+	fetch_values_clear();
+	return sts;
+    }
+    sts = pmdaFetch(numpmid, pmidlist, rp, pmda);
+    fetch_values_clear();
+    return sts;
 }
 
 /*
@@ -577,6 +697,68 @@ instance(pmInDom indom, int a, char *b, pmInResult **rp, pmdaExt *pmda)
     return pmdaInstance(indom, a, b, rp, pmda);
 }
 
+/*
+ * Extract the value of one instance of a metric from the values
+ * returned earlier by the fetch values callback for this metric.
+ */
+static int
+fetch_value(pmdaMetric *metric, unsigned int inst, PyObject *values, pmAtomValue *atom)
+{
+    char *s;
+    int rc, sts;
+    PyObject *key, *value;
+
+    if ((key = PyLong_FromUnsignedLong(inst)) == NULL)
+	return -ENOMEM;
+    value = PyDict_GetItem(values, key);	/* borrowed reference */
+    Py_DECREF(key);
+    if (value == NULL || value == Py_None)
+	return PMDA_FETCH_NOVALUES;
+
+    sts = PMDA_FETCH_STATIC;
+    switch (metric->m_desc.type) {
+	case PM_TYPE_32:
+	    rc = PyArg_Parse(value, "i:fetch_values_s32", &atom->l);
+	    break;
+	case PM_TYPE_U32:
+	    rc = PyArg_Parse(value, "I:fetch_values_u32", &atom->ul);
+	    break;
+	case PM_TYPE_64:
+	    rc = PyArg_Parse(value, "L:fetch_values_s64", &atom->ll);
+	    break;
+	case PM_TYPE_U64:
+	    rc = PyArg_Parse(value, "K:fetch_values_u64", &atom->ull);
+	    break;
+	case PM_TYPE_FLOAT:
+	    rc = PyArg_Parse(value, "f:fetch_values_float", &atom->f);
+	    break;
+	case PM_TYPE_DOUBLE:
+	    rc = PyArg_Parse(value, "d:fetch_values_double", &atom->d);
+	    break;
+	case PM_TYPE_STRING:
+	    s = NULL;
+	    rc = PyArg_Parse(value, "s:fetch_values_string", &s);
+	    if (rc == 0)
+		break;
+	    if (s == NULL)
+		sts = PM_ERR_VALUE;
+	    else if ((atom->cp = strdup(s)) == NULL)
+		sts = -ENOMEM;
+	    else
+		sts = PMDA_FETCH_DYNAMIC;
+	    break;
+	default:
+	    pmNotifyErr(LOG_ERR, "unsupported metric type in fetch values callback");
+	    return -ENOTSUP;
+    }
+    if (!rc) {
+	PyErr_Clear();
+	pmNotifyErr(LOG_ERR, "bad value type in fetch values callback");
+	sts = PM_ERR_TYPE;
+    }
+    return sts;
+}
+
 static int
 fetch_callback(pmdaMetric *metric, unsigned int inst, pmAtomValue *atom)
 {
@@ -586,6 +768,20 @@ fetch_callback(pmdaMetric *metric, unsigned int inst, pmAtomValue *atom)
     unsigned int item = pmID_item(metric->m_desc.pmid);
     unsigned int cluster = pmID_cluster(metric->m_desc.pmid);
 
+    if (fetch_values != NULL) {
+	/* instances of one metric are requested in turn, remember it */
+	if (metric->m_desc.pmid != fetch_values_pmid) {
+	    PyObject *key = PyLong_FromUnsignedLong(metric->m_desc.pmid);
+	    if (key == NULL)
+		return -ENOMEM;
+	    fetch_values_last = PyDict_GetItem(fetch_values, key);
+	    fetch_values_pmid = metric->m_desc.pmid;
+	    Py_DECREF(key);
+	}
+	if (fetch_values_last != NULL && fetch_values_last != Py_None)
+	    return fetch_value(metric, inst, fetch_values_last, atom);
+    }
+
     if (fetch_cb_func == NULL)
 	return PM_ERR_VALUE;
 
@@ -1550,6 +1746,12 @@ set_fetch_callback(PyObject *self, PyObject *args)
     return set_callback(self, args, "O:set_fetch_callback", &fetch_cb_func);
 }
 
+static PyObject *
+set_fetch_values_callback(PyObject *self, PyObject *args)
+{
+    return set_callback(self, args, "O:set_fetch_values_callback", &fetch_values_cb_func);
+}
+
 static PyObject *
 set_label_callback(PyObject *self, PyObject *args)
 {
@@ -1646,6 +1848,8 @@ static PyMethodDef methods[] = {
 	.ml_flags = METH_VARARGS|METH_KEYWORDS },
     { .ml_name = "set_fetch_callback", .ml_meth = (PyCFunction)set_fetch_callback,
 	.ml_flags = METH_VARARGS|METH_KEYWORDS },
+    { .ml_name = "set_fetch_values_callback", .ml_meth = (PyCFunction)set_fetch_values_callback,
+	.ml_flags = METH_VARARGS|METH_KEYWORDS },
     { .ml_name = "set_label_callback", .ml_meth = (PyCFunction)set_label_callback,
 	.ml_flags = METH_VARARGS|METH_KEYWORDS },
     { .ml_name = "set_notes_callback", .ml_meth = (PyCFunction)set_notes_callback,